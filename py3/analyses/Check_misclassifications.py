@@ -24,6 +24,8 @@ from tkinter import filedialog
 from PIL import Image, ImageTk
 import pandas as pd
 
+import synonymstore
+
 IMGHEIGHT = 350
 TKBUTTONWIDTH = 15
 last_changed_entry = None
@@ -33,7 +35,7 @@ dir_py = os.path.dirname(os.path.dirname(__file__))
 dir_main = os.path.dirname(dir_py)
 dir_spl = os.path.join(dir_main, "spl")
 edit_br_py = os.path.join(dir_py, "requests", "batchrequest_v201.py")
-edit_syn_py = os.path.join(dir_py, "analyses", "taxonomy.py")
+syn_db = os.path.join(dir_main, "dat", "Synonyms.sqlite")
 
 # Batch request info
 br_table = pd.read_excel(
@@ -66,10 +68,10 @@ def edit_response(br, rel, obs, img, cvm, new, pysc = edit_br_py):
         f'py {pysc} --mupdate {br} {rel} {obs} {img} {cvm} new_response="{new}"'
         )
 
-def edit_synonyms(taxon, synonym, pysc = edit_syn_py):
-    exit_status = subprocess.call(
-        f'py {pysc} --add_synonym "{taxon}" "{synonym}"'
-        )
+def edit_synonyms(taxon, synonym, path = syn_db):
+    store = synonymstore.SynonymStore(path)
+    store.add(taxon, synonym)
+    store.close()
 
 def display(df):
     row_index = 0
@@ -13,17 +13,33 @@ __email__ = "requests@cdpopp.de"
 __status__ = "Development"
 
 #-----------------------------------------------------------------------------|
+import os, sys
 import pickle as pk
 import numpy as np
 
-with open("N:/prj/COMECO/img/META.pickle", "rb") as f:
-    d = pk.load(f)
+dir_py = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(dir_py, "requests"))
 
-precision = []
+import observationstore
 
-for v in d.values():
-    precision.append(v["xy_precision"])
+img_dir = "N:/prj/COMECO/img"
+meta_file = observationstore.metadata_file(img_dir)
 
-precision = np.array(precision)
+## Read only the precision column from the observation store, if it is the
+## current metadata file (see base.MetaStore)
+if meta_file.endswith(observationstore.FILENAME):
+    store = observationstore.ObservationStore(meta_file)
+    precision = list(store.column("xy_precision"))
+
+else:
+    with open(meta_file, "rb") as f:
+        d = pk.load(f)
+    
+    precision = []
+    
+    for v in d.values():
+        precision.append(v["xy_precision"])
+
+precision = np.array(precision, dtype = float)
 np.mean(precision)
 np.std(precision, ddof = 1) / np.sqrt(np.size(precision))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:14:06 2026
+
+On-disk (SQLite) store of the synonym database used by taxonomy.py, with a
+reverse index from synonym to accepted taxa. The store (dat/Synonyms.sqlite)
+is tracked in the repository and is the source of truth for synonyms; it
+replaces the pickled SynonymDatabase instance (Synonyms.db), which can be
+converted using SynonymStore.import_pickle.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 21:14:06 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import sqlite3
+import pickle as pk
+from itertools import groupby
+from collections.abc import MutableMapping
+
+#-----------------------------------------------------------------------------|
+# Settings
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS taxa (
+    taxon TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS synonyms (
+    taxon TEXT NOT NULL,
+    synonym TEXT NOT NULL,
+    UNIQUE (taxon, synonym)
+);
+CREATE INDEX IF NOT EXISTS synonyms_reverse
+    ON synonyms (synonym, taxon);
+"""
+
+#-----------------------------------------------------------------------------|
+# Functions
+def _as_list(synonyms):
+    return synonyms if isinstance(synonyms, list) else [synonyms]
+
+#-----------------------------------------------------------------------------|
+# Classes
+class _LegacyDatabase():
+    ## Stands in for the pickled SynonymDatabase, which was pickled from the
+    ## __main__ module of taxonomy.py
+    pass
+
+class _LegacyUnpickler(pk.Unpickler):
+    def find_class(self, module, name):
+        if name == "SynonymDatabase":
+            return _LegacyDatabase
+        
+        return super().find_class(module, name)
+
+class SynonymStore(MutableMapping):
+    def __init__(self, path):
+        '''
+        Synonym database entries ({"synonyms" : list of str}) by taxon name.
+        Entries are read from disk on access, and edits are written in one
+        transaction per call without rewriting the file. Taxa and synonyms
+        are returned in the order they were added (rowid order).
+        
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file. The file is created if it does not
+            exist.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.path = path
+        self._con = sqlite3.connect(path)
+        
+        with self._con as con:
+            con.executescript(SCHEMA)
+    
+    def __getitem__(self, taxon):
+        if taxon not in self:
+            raise KeyError(taxon)
+        
+        return {"synonyms" : [row[0] for row in self._con.execute(
+            "SELECT synonym FROM synonyms WHERE taxon = ? ORDER BY rowid",
+            (taxon,)
+            )]}
+    
+    def __contains__(self, taxon):
+        return self._con.execute(
+            "SELECT 1 FROM taxa WHERE taxon = ?", (taxon,)
+            ).fetchone() is not None
+    
+    def __iter__(self):
+        return iter([row[0] for row in self._con.execute(
+            "SELECT taxon FROM taxa ORDER BY rowid"
+            )])
+    
+    def __len__(self):
+        return self._con.execute("SELECT COUNT(*) FROM taxa").fetchone()[0]
+    
+    def __setitem__(self, taxon, entry):
+        with self._con as con:
+            con.execute("DELETE FROM synonyms WHERE taxon = ?", (taxon,))
+            self._insert(con, taxon, entry["synonyms"])
+    
+    def __delitem__(self, taxon):
+        if taxon not in self:
+            raise KeyError(taxon)
+        
+        with self._con as con:
+            con.execute("DELETE FROM synonyms WHERE taxon = ?", (taxon,))
+            con.execute("DELETE FROM taxa WHERE taxon = ?", (taxon,))
+    
+    def _insert(self, con, taxon, synonyms):
+        con.execute("INSERT OR IGNORE INTO taxa VALUES (?)", (taxon,))
+        con.executemany(
+            "INSERT OR IGNORE INTO synonyms VALUES (?, ?)",
+            [(taxon, synonym) for synonym in synonyms]
+            )
+    
+    def add(self, taxon, synonyms):
+        '''
+        Add a synonym or a list of synonyms to a taxon. If the taxon does not
+        exist, it is created.
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        synonyms : str or list of str
+            Synonyms to the taxon name.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._con as con:
+            self._insert(con, taxon, _as_list(synonyms))
+    
+    def discard(self, taxon, synonyms):
+        '''
+        Remove a synonym or a list of synonyms from a taxon.
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        synonyms : str or list of str
+            Synonyms to remove.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._con as con:
+            con.executemany(
+                "DELETE FROM synonyms WHERE taxon = ? AND synonym = ?",
+                [(taxon, synonym) for synonym in _as_list(synonyms)]
+                )
+    
+    def is_synonym(self, taxon, true_taxon):
+        '''
+        Check whether a taxon is a synonym of true_taxon (see
+        taxonomy.SynonymDatabase.is_synonym).
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        true_taxon : str
+            Taxon to match with.
+        
+        Returns
+        -------
+        bool
+            Match or no match.
+        
+        Raises
+        ------
+        KeyError
+            true_taxon is not in the store.
+        '''
+        if taxon is None or true_taxon is None:
+            return False
+        
+        if true_taxon not in self:
+            raise KeyError(true_taxon)
+        
+        return self._con.execute(
+            "SELECT 1 FROM synonyms WHERE taxon = ? AND synonym = ?",
+            (true_taxon, taxon)
+            ).fetchone() is not None
+    
+    def taxa_of(self, synonym):
+        '''
+        Get the taxa a name is listed as a synonym of (reverse index).
+        
+        Parameters
+        ----------
+        synonym : str
+            Taxon name.
+        
+        Returns
+        -------
+        list
+            Taxon names.
+        '''
+        return [row[0] for row in self._con.execute(
+            "SELECT taxon FROM synonyms WHERE synonym = ? ORDER BY taxon",
+            (synonym,)
+            )]
+    
+    def replace(self, database):
+        '''
+        Replace the content of the store in one transaction.
+        
+        Parameters
+        ----------
+        database : dict
+            Synonym database entries ({"synonyms" : list of str}) by taxon
+            name.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._con as con:
+            con.execute("DELETE FROM synonyms")
+            con.execute("DELETE FROM taxa")
+            con.executemany(
+                "INSERT OR IGNORE INTO taxa VALUES (?)",
+                [(taxon,) for taxon in database]
+                )
+            con.executemany(
+                "INSERT OR IGNORE INTO synonyms VALUES (?, ?)",
+                [(taxon, synonym) for taxon, entry in database.items() \
+                 for synonym in entry["synonyms"]]
+                )
+    
+    def to_dict(self):
+        '''
+        Read all entries in one query.
+        
+        Returns
+        -------
+        dict
+            Synonym database entries ({"synonyms" : list of str}) by taxon
+            name.
+        '''
+        rows = self._con.execute(
+            "SELECT taxa.taxon, synonyms.synonym FROM taxa LEFT JOIN " + \
+                "synonyms ON synonyms.taxon = taxa.taxon " + \
+                    "ORDER BY taxa.rowid, synonyms.rowid"
+            )
+        
+        return {taxon : {"synonyms" : [row[1] for row in group if \
+                                       row[1] is not None]} for taxon, group \
+                in groupby(rows, key = lambda row: row[0])}
+    
+    def import_pickle(self, path):
+        '''
+        Copy the entries of a pickled SynonymDatabase (Synonyms.db) into the
+        store. Existing entries are replaced.
+        
+        Parameters
+        ----------
+        path : str
+            Path to the pickled synonym database.
+        
+        Returns
+        -------
+        int
+            Number of imported taxa.
+        '''
+        with open(path, "rb") as f:
+            legacy = _LegacyUnpickler(f).load()
+        
+        self.replace(legacy.database)
+        
+        return len(legacy.database)
+    
+    def close(self):
+        '''
+        Close the SQLite file.
+        
+        Returns
+        -------
+        None.
+        '''
+        self._con.close()
@@ -4,6 +4,9 @@
 Created on Wed Aug 16 10:30:37 2023
 
 Match taxon names using the Swiss taxonomic backbone for vascular plants.
+The match cache (MatchCache, see Matcher.use_cache) only serves ad-hoc
+row-wise matching (Matcher.match); the run of this script matches all
+responses with Matcher.match_frame and does not use it.
 """
 __author__ = "Manuel"
 __date__ = "Wed Aug 16 10:30:37 2023"
@@ -16,14 +19,17 @@ __status__ = "Production"
 
 #-----------------------------------------------------------------------------|
 # Imports
-import os, time, easygui, subprocess, argparse
+import os, sys, time, easygui, sqlite3, hashlib, subprocess, argparse
+import numpy as np
 import pandas as pd
-import pickle as pk
+from collections import deque
 import pykew.powo as powo
 from datetime import datetime
 from pykew.powo_terms import Name as NamePOWO
 from alive_progress import alive_bar as pb
 
+import synonymstore
+
 #-----------------------------------------------------------------------------|
 # Arguments and settings
 def parseArguments():
@@ -50,7 +56,7 @@ dir_main = os.path.dirname(dir_py)
 
 INFOFLORATAXBB = "Checklist_2017_simple_version_20230503.xlsx"
 TAXBB = os.path.join(dir_main, "dat", INFOFLORATAXBB)
-SYNDBFILE = os.path.join(dir_main, "dat", "Synonyms.db")
+SYNDBFILE = os.path.join(dir_main, "dat", "Synonyms.sqlite")
 RESPONSES = os.path.join(dir_main, "out", "Responses.xlsx")
 OUTPUT = os.path.join(dir_main, "out", "Final.xlsx")
 
@@ -76,6 +82,89 @@ taxonomy_bb["within_taxon_name"] = taxonomy_bb.apply(
 WFOMATCH = "https://list.worldfloraonline.org/matching_rest.php?input_string="
 WFOGET = "https://list.worldfloraonline.org/"
 
+## Persistent cache of match results (see MatchCache). Change the version
+## whenever Matcher.match changes, so that old results are not reused.
+MATCHCACHE = os.path.join(dir_main, "cache", "matches.sqlite")
+MATCHCACHE_SIZE = 100000
+MATCHVERSION = "1"
+
+## Taxonomy trees (parent, child, and descendant indices) by backbone (see
+## taxonomy_tree)
+_TREES = {}
+
+## Name normalization (see normalize_name): spellings of rank markers, and
+## lower case words of author citations
+RANKMARKERS = {
+    "agg." : "aggr.", "agg" : "aggr.", "aggr" : "aggr.", "aggr." : "aggr.",
+    "ssp." : "subsp.", "subsp" : "subsp.", "subsp." : "subsp.",
+    "var" : "var.", "var." : "var.", "f." : "f.", "s.l." : "s.l.",
+    "s.str." : "s.str.", "x" : "x", "\u00d7" : "x"
+    }
+AUTHORPARTICLES = {"ex", "et", "in", "de", "der", "den", "du", "la", "le",
+                   "van", "von", "d'"}
+
+#-----------------------------------------------------------------------------|
+# Functions
+def normalize_name(name):
+    '''
+    Normalize a taxon name for lookups: lower case, without author citation,
+    with uniform rank markers (e.g., "Abies alba Mill." and "abies alba" both
+    become "abies alba").
+    
+    Parameters
+    ----------
+    name : str
+        Taxon name.
+    
+    Returns
+    -------
+    str
+        Normalized (interned) name.
+    '''
+    words = str(name).split()
+    
+    if not words:
+        return sys.intern("")
+    
+    normalized = [words[0].lower()]
+    
+    for i, word in enumerate(words[1:]):
+        lower = word.lower()
+        
+        if lower in RANKMARKERS:
+            normalized.append(RANKMARKERS[lower])
+        
+        ## Epithets are lower case (except for the species epithet, which is
+        ## kept in any case); author names start with a capital letter or a
+        ## bracket
+        elif (i == 0 or word[0].islower()) and \
+            lower not in AUTHORPARTICLES and word.replace("-", "").isalpha():
+            normalized.append(lower)
+    
+    return sys.intern(" ".join(normalized))
+
+def taxonomy_tree(backbone):
+    '''
+    Get the shared taxonomy tree of a backbone. The tree is built once per
+    backbone DataFrame.
+    
+    Parameters
+    ----------
+    backbone : pd.DataFrame
+        Taxonomic database.
+    
+    Returns
+    -------
+    TaxonomyTree
+        Taxonomy tree.
+    '''
+    key = id(backbone)
+    
+    if key not in _TREES or _TREES[key].backbone is not backbone:
+        _TREES[key] = TaxonomyTree(backbone)
+    
+    return _TREES[key]
+
 #-----------------------------------------------------------------------------|
 # Classes
 class SubtaxonIterator():
@@ -97,7 +186,8 @@ class SubtaxonIterator():
         '''
         self.taxon = taxon
         self.backbone = backbone
-        self.list = [taxon]
+        self.tree = taxonomy_tree(backbone)
+        self.list = deque([taxon])
         self.subtaxa = []
     
     def __iter__(self):
@@ -115,13 +205,10 @@ class SubtaxonIterator():
             Subtaxon name.
         '''
         try:
-            item = self.list.pop(0)
+            item = self.list.popleft()
             
-            subtaxa = self.backbone[
-                self.backbone["within_taxon_name"] == item
-                ]["taxon_name"].to_list()
-            
-            subtaxa = [s for s in subtaxa if s != item]
+            subtaxa = [s for s in self.tree.children(item) or [] if \
+                       s != item]
             
             self.list.extend(subtaxa)
             
@@ -139,12 +226,7 @@ class SubtaxonIterator():
         list
             Subtaxon names.
         '''
-        while True:
-            try:
-                self.subtaxa.extend(self.__iter__())
-            
-            except:
-                break
+        self.subtaxa = list(self.tree.descendants(self.taxon))
         
         return self.subtaxa
 
@@ -170,26 +252,133 @@ class TaxonomyTree():
                     else -1,
             axis = 1
             )
+        
+        ## Parent and child indices (top level taxa are their own parent)
+        self._parents = {}
+        self._children = {}
+        
+        for taxon, parent in zip(self.backbone["taxon_name"],
+                                 self.backbone["within_taxon_name"]):
+            self._parents.setdefault(taxon, parent)
+            self._children.setdefault(parent, []).append(taxon)
+        
+        ## Descendants by taxon (computed on first request)
+        self._descendants = {}
     
     def parent(self, taxon):
-        parent = self.backbone[self.backbone["taxon_name"] == taxon][
-            "within_taxon_name"
-            ].to_list()
-        
-        return parent[0] if len(parent) > 0 else None
+        return self._parents.get(taxon)
     
     def children(self, taxon):
-        rows = self.backbone[self.backbone["within_taxon_name"] == taxon]
+        children = self._children.get(taxon)
         
-        children = [c["taxon_name"] for i, c in rows.iterrows()] if \
-            len(rows) > 0 else None
+        return list(children) if children is not None else None
+    
+    def descendants(self, taxon):
+        '''
+        Get all lower level taxa of a taxon (breadth-first order).
         
-        return children
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        
+        Returns
+        -------
+        tuple
+            Subtaxon names.
+        '''
+        if taxon not in self._descendants:
+            subtaxa = []
+            visited = {taxon}
+            queue = deque([taxon])
+            
+            while queue:
+                for child in self._children.get(queue.popleft(), []):
+                    if child not in visited:
+                        visited.add(child)
+                        subtaxa.append(child)
+                        queue.append(child)
+            
+            self._descendants[taxon] = (tuple(subtaxa), frozenset(subtaxa))
+        
+        return self._descendants[taxon][0]
+    
+    def is_lower(self, taxon, upper_taxon):
+        '''
+        Check whether a taxon is a lower level taxon of upper_taxon.
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        upper_taxon : str
+            Higher level taxon name.
+        
+        Returns
+        -------
+        bool
+            True if taxon is one of the descendants of upper_taxon.
+        '''
+        self.descendants(upper_taxon)
+        
+        return taxon in self._descendants[upper_taxon][1]
 
 class SynonymDatabase():
     def __init__(self):
         self.instanciated = datetime.now()
         self.database = {}
+        
+        ## Synonym sets by taxon and accepted taxa by normalized name (see
+        ## .is_synonym and .accepted_taxa)
+        self._synonyms = {}
+        self._accepted = None
+        
+        ## Incremented whenever the database changes (see Matcher.match)
+        self.version = 0
+    
+    def _index_taxon(self, taxon):
+        ## Raises a KeyError if the taxon is not in the database
+        synonyms = frozenset(self.database[taxon]["synonyms"])
+        self._synonyms[taxon] = synonyms
+        
+        if self._accepted is not None:
+            for name in synonyms | {taxon}:
+                key = normalize_name(name)
+                self._accepted[key] = self._accepted.get(key, frozenset()) \
+                    | {taxon}
+        
+        return synonyms
+    
+    def _unindex_taxon(self, taxon):
+        synonyms = self._synonyms.pop(taxon, frozenset())
+        
+        if self._accepted is not None:
+            for name in synonyms | {taxon}:
+                key = normalize_name(name)
+                accepted = self._accepted.get(key, frozenset()) - {taxon}
+                
+                if accepted:
+                    self._accepted[key] = accepted
+                
+                else:
+                    self._accepted.pop(key, None)
+    
+    def rebuild_index(self):
+        '''
+        Rebuild the synonym index. Only required if .database was modified
+        directly (instead of by .add_taxon, .add_synonyms, or .remove_taxon).
+        
+        Returns
+        -------
+        None.
+        '''
+        self._synonyms = {}
+        self._accepted = {}
+        
+        for taxon in self.database:
+            self._index_taxon(taxon)
+        
+        self.version += 1
     
     def add_taxon(self, name):
         '''
@@ -364,8 +553,11 @@ class SynonymDatabase():
             original_query_name.split(" ")[:2]
             )])
         
+        self._unindex_taxon(original_query_name)
         self.database[original_query_name] = {"synonyms" : list(set(synonyms))
             }
+        self._index_taxon(original_query_name)
+        self.version += 1
     
     def remove_taxon(self, name):
         '''
@@ -382,6 +574,8 @@ class SynonymDatabase():
         '''
         try:
             del self.database[name]
+            self._unindex_taxon(name)
+            self.version += 1
         
         except:
             print("Taxon not found in database.")
@@ -402,6 +596,8 @@ class SynonymDatabase():
         -------
         None.
         '''
+        self._unindex_taxon(taxon)
+        
         if taxon in self.database.keys():
             if isinstance(synonyms, list):
                 self.database[taxon]["synonyms"].extend(synonyms)
@@ -414,6 +610,9 @@ class SynonymDatabase():
             
             else:
                 self.database[taxon] = {"synonyms" : [synonyms]}
+        
+        self._index_taxon(taxon)
+        self.version += 1
     
     def add_list(self, taxon_list):
         '''
@@ -452,12 +651,36 @@ class SynonymDatabase():
         
         Returns
         -------
-        SubtaxonIterator
-            Subtaxon iterator object.
+        list
+            Subtaxon names.
+        '''
+        return list(taxonomy_tree(backbone).descendants(name))
+    
+    def get_synonyms(self, taxon):
+        '''
+        Get the synonyms of a taxon from the synonym index.
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        
+        Returns
+        -------
+        frozenset
+            Synonyms (including the taxon name itself, if listed).
+        
+        Raises
+        ------
+        KeyError
+            The taxon is not in the database.
         '''
-        iterator = SubtaxonIterator(name, backbone)
+        synonyms = self._synonyms.get(taxon)
+        
+        if synonyms is None:
+            synonyms = self._index_taxon(taxon)
         
-        return iterator.get()
+        return synonyms
     
     def is_synonym(self, taxon, true_taxon):
         '''
@@ -478,13 +701,30 @@ class SynonymDatabase():
         if taxon is None or true_taxon is None:
             return False
         
-        else:
-            return taxon in self.database[true_taxon]["synonyms"]
+        return taxon in self.get_synonyms(true_taxon)
     
-    def is_lower(self, taxon, true_taxon):
-        sublevel_synonyms = self.get_sublevel_taxa(true_taxon)
+    def accepted_taxa(self, name):
+        '''
+        Get the taxa a name is a synonym of (reverse lookup). Names are
+        compared in normalized form (see normalize_name).
+        
+        Parameters
+        ----------
+        name : str
+            Taxon name (e.g., a suggestion of an identification service).
         
-        return taxon in sublevel_synonyms
+        Returns
+        -------
+        frozenset
+            Taxon names of the database.
+        '''
+        if self._accepted is None:
+            self.rebuild_index()
+        
+        return self._accepted.get(normalize_name(name), frozenset())
+    
+    def is_lower(self, taxon, true_taxon, backbone = taxonomy_bb):
+        return taxonomy_tree(backbone).is_lower(taxon, true_taxon)
     
     def _create_query(self, name, level = 0):
         name = name.replace("nothosubsp", "subsp")# Some issue with Pulsatilla alpina. Not in the data set. Simply replaced to avoid issues.
@@ -555,42 +795,348 @@ class SynonymDatabase():
     
     def save(self, path):
         '''
-        Save current instance.
+        Save the synonym database to a synonym store (see synonymstore.py).
+        
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file.
         
         Returns
         -------
         None.
         '''
-        with open(path, "wb") as f:
-            pk.dump(self, f)
+        store = synonymstore.SynonymStore(path)
+        store.replace(self.database)
+        store.close()
         
         print("Output saved at {0}.".format(path))
+    
+    @classmethod
+    def load(cls, path):
+        '''
+        Load a synonym database from a synonym store (see synonymstore.py).
+        
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file.
+        
+        Returns
+        -------
+        SynonymDatabase
+            Synonym database.
+        '''
+        store = synonymstore.SynonymStore(path)
+        
+        instance = cls()
+        instance.database = store.to_dict()
+        instance.rebuild_index()
+        store.close()
+        
+        return instance
+
+class MatchCache():
+    ## Returned by .get for pairs that are not cached (None is a valid level)
+    MISSING = object()
+    
+    def __init__(self, fingerprint, path = MATCHCACHE,
+                 maxsize = MATCHCACHE_SIZE):
+        '''
+        Cache of match levels by (taxon, true taxon) pair for row-wise
+        matching (see Matcher.match and Matcher.use_cache). Levels are kept
+        in memory and stored in an SQLite file, which is read in one query
+        when the cache is opened. When maxsize is exceeded, the least recently
+        used levels are dropped from memory. Levels are only valid for the
+        synonym database and backbone they were computed with; the file is
+        cleared when the fingerprint changes (see Matcher.fingerprint).
+        
+        Parameters
+        ----------
+        fingerprint : str
+            Fingerprint of the synonym database and backbone.
+        path : str, optional
+            Path to the SQLite file. None keeps the cache in memory only. The
+            default is MATCHCACHE.
+        maxsize : int, optional
+            Maximum number of levels kept in memory. The default is
+            MATCHCACHE_SIZE.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.fingerprint = fingerprint
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._pending = {}
+        self._con = None
+        
+        ## Whether all stored levels are in memory (no disk lookups needed)
+        self._complete = True
+        
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            self._con = sqlite3.connect(path)
+            
+            with self._con as con:
+                con.executescript(
+                    "CREATE TABLE IF NOT EXISTS meta (" + \
+                        "key TEXT PRIMARY KEY, value TEXT);" + \
+                    "CREATE TABLE IF NOT EXISTS matches (" + \
+                        "taxon TEXT, true_taxon TEXT, level INTEGER, " + \
+                            "PRIMARY KEY (taxon, true_taxon)) WITHOUT ROWID;"
+                    )
+                row = con.execute(
+                    "SELECT value FROM meta WHERE key = 'fingerprint'"
+                    ).fetchone()
+                
+                if row is None or row[0] != fingerprint:
+                    con.execute("DELETE FROM matches")
+                    con.execute(
+                        "INSERT OR REPLACE INTO meta VALUES " + \
+                            "('fingerprint', ?)", (fingerprint,)
+                        )
+                
+                for taxon, true_taxon, level in con.execute(
+                    "SELECT taxon, true_taxon, level FROM matches LIMIT ?",
+                    (maxsize + 1,)
+                    ):
+                    self._memory[(taxon, true_taxon)] = level
+                
+                if len(self._memory) > maxsize:
+                    self._memory.popitem()
+                    self._complete = False
+    
+    def _remember(self, pair, level):
+        self._memory[pair] = level
+        
+        if len(self._memory) > self.maxsize:
+            del self._memory[next(iter(self._memory))]
+            self._complete = False
+    
+    def get(self, taxon, true_taxon):
+        '''
+        Get the cached match level of a pair.
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        true_taxon : str
+            True taxon name.
+        
+        Returns
+        -------
+        int
+            Match level (None for no match; MatchCache.MISSING if the pair is
+            not cached).
+        '''
+        pair = (taxon, true_taxon)
+        level = self._memory.get(pair, self.MISSING)
+        
+        if level is not self.MISSING:
+            ## Move the pair to the end (most recently used)
+            self._memory[pair] = self._memory.pop(pair)
+            self.hits += 1
+            
+            return level
+        
+        if not self._complete and self._con is not None:
+            row = self._con.execute(
+                "SELECT level FROM matches WHERE taxon = ? AND " + \
+                    "true_taxon = ?", pair
+                ).fetchone()
+            
+            if row is not None:
+                self._remember(pair, row[0])
+                self.disk_hits += 1
+                
+                return row[0]
+        
+        self.misses += 1
+        
+        return self.MISSING
+    
+    def put(self, taxon, true_taxon, level):
+        '''
+        Add the match level of a pair. Levels are written to the SQLite
+        file by .flush (at the latest when the cache is closed).
+        
+        Parameters
+        ----------
+        taxon : str
+            Taxon name.
+        true_taxon : str
+            True taxon name.
+        level : int
+            Match level (None for no match).
+        
+        Returns
+        -------
+        None.
+        '''
+        self._remember((taxon, true_taxon), level)
+        self._pending[(taxon, true_taxon)] = level
+        
+        if len(self._pending) >= 10000:
+            self.flush()
+    
+    def flush(self):
+        '''
+        Write added match levels to the SQLite file.
+        
+        Returns
+        -------
+        None.
+        '''
+        if self._con is not None and self._pending:
+            with self._con as con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO matches VALUES (?, ?, ?)",
+                    [(taxon, true_taxon, level) for (taxon, true_taxon), \
+                     level in self._pending.items()]
+                    )
+        
+        self._pending = {}
+    
+    def stats(self):
+        '''
+        Get cache statistics.
+        
+        Returns
+        -------
+        dict
+            Number of pairs found in memory ("hits") and in the SQLite file
+            ("disk_hits"), number of pairs not found ("misses"), and the
+            fraction of pairs found ("hit_rate").
+        '''
+        total = self.hits + self.disk_hits + self.misses
+        
+        return {
+            "hits" : self.hits,
+            "disk_hits" : self.disk_hits,
+            "misses" : self.misses,
+            "hit_rate" : (self.hits + self.disk_hits) / total if total else 0.0
+            }
+    
+    def close(self):
+        '''
+        Write added match levels and close the SQLite file.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.flush()
+        
+        if self._con is not None:
+            self._con.close()
+            self._con = None
 
 #-----------------------------------------------------------------------------|
 # Main class
 class Matcher():
     def __init__(self, backbone, synonym_db = "create_new"):
-        self.Tree = TaxonomyTree(backbone)
+        self.Tree = taxonomy_tree(backbone)
+        self.Cache = None
+        self._cache_version = None
         
         if synonym_db == "create_new":
             self.Synonyms = SynonymDatabase()
             self.Synonyms.add_list(backbone["taxon_name"].to_list())
         
         else:
-            with open(synonym_db, "rb") as f:
-                self.Synonyms = pk.load(f)
+            self.Synonyms = SynonymDatabase.load(synonym_db)
+    
+    def fingerprint(self):
+        '''
+        Get a fingerprint of the synonym database and backbone (see
+        MatchCache).
+        
+        Returns
+        -------
+        str
+            Hex digest.
+        '''
+        h = hashlib.sha256(MATCHVERSION.encode("utf8"))
+        
+        h.update(pd.util.hash_pandas_object(
+            self.Tree.backbone[["taxon_name", "within_taxon_name"]] \
+                .astype(str), index = False
+            ).values.tobytes())
+        
+        for taxon in sorted(self.Synonyms.database):
+            synonyms = sorted(
+                map(str, self.Synonyms.database[taxon]["synonyms"])
+                )
+            h.update("\n{0}\t{1}".format(
+                taxon, "\t".join(synonyms)
+                ).encode("utf8"))
+        
+        return h.hexdigest()
+    
+    def use_cache(self, path = MATCHCACHE, maxsize = MATCHCACHE_SIZE):
+        '''
+        Cache the results of row-wise matching (.match), e.g., to re-score
+        new batches that share most (taxon, true taxon) pairs with previous
+        ones. .match_frame does not use the cache, since matching unique
+        pairs with array operations is faster than looking them up. The
+        cache is bound to the current content of the synonym database; it
+        is reopened with a new fingerprint (i.e., cleared) by .match once
+        the database has changed (see SynonymDatabase.version).
+        
+        Parameters
+        ----------
+        path : str, optional
+            Path to the SQLite file. The default is MATCHCACHE.
+        maxsize : int, optional
+            Maximum number of levels kept in memory. The default is
+            MATCHCACHE_SIZE.
+        
+        Returns
+        -------
+        MatchCache
+            Match cache.
+        '''
+        if self.Cache is not None:
+            self.Cache.close()
+        
+        self.Cache = MatchCache(self.fingerprint(), path, maxsize)
+        self._cache_version = self.Synonyms.version
+        
+        return self.Cache
     
     def match(self, taxon, true_taxon):
         #print(f"Matching {taxon} and true taxon {true_taxon}.")
         ## Replace potentially "wrong" abbreviations
         taxon = taxon.replace("agg.", "aggr.")
         
+        if self.Cache is not None:
+            if self._cache_version != self.Synonyms.version:
+                self.use_cache(self.Cache.path, self.Cache.maxsize)
+            
+            matching_lvl = self.Cache.get(taxon, true_taxon)
+            
+            if matching_lvl is MatchCache.MISSING:
+                matching_lvl = self._match(taxon, true_taxon)
+                self.Cache.put(taxon, true_taxon, matching_lvl)
+            
+            return matching_lvl
+        
+        return self._match(taxon, true_taxon)
+    
+    def _match(self, taxon, true_taxon):
         ## Check whether the input taxons are equal or synonyms
         if self.Synonyms.is_synonym(taxon, true_taxon):
             matching_lvl = 0
         
         ## Check whether first input taxon is a (sub)child of the true taxon
-        elif self.Synonyms.is_lower(taxon, true_taxon):
+        elif self.Synonyms.is_lower(taxon, true_taxon, self.Tree.backbone):
             children = self.Tree.children(true_taxon)
             
             ### Set matching level to sub-child
@@ -613,6 +1159,186 @@ class Matcher():
                     taxon.split(" ")[0] == true_taxon.split(" ")[0] else None
         
         return matching_lvl
+    
+    def _relations(self, names, true_codes):
+        '''
+        Get the relations used by .match between taxon names (see
+        .match_frame).
+        
+        Parameters
+        ----------
+        names : pd.Index
+            Taxon names (code = position).
+        true_codes : numpy.ndarray
+            Codes of the true taxa.
+        
+        Returns
+        -------
+        relations : dict
+            Pair codes (taxon code * len(names) + true taxon code) for which
+            the taxon is a synonym of the true taxon ("syn"), a lower level
+            taxon ("low"), a synonym of a direct child ("direct"), or a
+            synonym of the parent taxon ("upper").
+        missing : dict
+            Per name code, whether the name ("true"), one of its children
+            ("child"), or its parent ("parent") are missing in the synonym
+            database.
+        '''
+        Tree = self.Tree
+        n = len(names)
+        lookup = dict(zip(names, range(n)))
+        
+        relations = {"syn" : [], "low" : [], "direct" : [], "upper" : []}
+        missing = {key : np.zeros(n, dtype = bool) for key in \
+                   ["true", "child", "parent"]}
+        
+        def codes(taxon, t):
+            ## Pair codes of the synonyms of a taxon (as used by .match)
+            return [lookup[s] * n + t for s in \
+                    self.Synonyms.get_synonyms(taxon) if s in lookup]
+        
+        for t in np.unique(true_codes):
+            name = names[t]
+            
+            try:
+                relations["syn"] += codes(name, t)
+            
+            except KeyError:
+                missing["true"][t] = True
+            
+            relations["low"] += [lookup[s] * n + t for s in \
+                                 Tree.descendants(name) if s in lookup]
+            
+            for child in Tree.children(name) or []:
+                try:
+                    relations["direct"] += codes(child, t)
+                
+                except KeyError:
+                    missing["child"][t] = True
+            
+            parent = Tree.parent(name)
+            
+            if parent is not None:
+                try:
+                    relations["upper"] += codes(parent, t)
+                
+                except KeyError:
+                    missing["parent"][t] = True
+        
+        relations = {key : np.array(value, dtype = np.int64) for key, value \
+                     in relations.items()}
+        
+        return relations, missing
+    
+    def match_frame(self, df, rank_cols, true_col = "true_taxon_name"):
+        '''
+        Match the taxa of multiple columns of a table with the true taxa (see
+        .match). Taxon names are factorized to integer codes, and each unique
+        (taxon, true taxon) pair is matched once using array operations.
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Table with taxon names.
+        rank_cols : list of str
+            Columns with the taxon names to match (e.g., "first", "second").
+        true_col : str, optional
+            Column with the true taxon names. The default is
+            "true_taxon_name".
+        
+        Returns
+        -------
+        df : pd.DataFrame
+            Input table with a column "match_<rank column>" per rank column.
+        
+        Raises
+        ------
+        KeyError
+            Taxon not found in the synonym database (as .match).
+        '''
+        n_rows = len(df)
+        
+        ## Factorize taxon names (as in .match: values as str, "agg." replaced
+        ## by "aggr." for the taxa to match)
+        taxon_codes, taxon_names = pd.factorize(np.concatenate(
+            [df[rank].map(str).values for rank in rank_cols]
+            ))
+        taxon_names = pd.Index(
+            [t.replace("agg.", "aggr.") for t in taxon_names], dtype = object
+            )
+        true_codes, true_names = pd.factorize(df[true_col].map(str).values)
+        
+        names = taxon_names.append(pd.Index(true_names)).unique()
+        n = len(names)
+        
+        taxon_codes = names.get_indexer(taxon_names)[taxon_codes]
+        true_codes = np.tile(
+            names.get_indexer(true_names)[true_codes], len(rank_cols)
+            )
+        
+        ## Unique pairs (in order of appearance)
+        pair_index, pairs = pd.factorize(
+            taxon_codes.astype(np.int64) * n + true_codes
+            )
+        levels = self._match_pairs(names, pairs)
+        
+        for r, rank in enumerate(rank_cols):
+            values = levels[pair_index[r * n_rows:(r + 1) * n_rows]]
+            
+            df["match_" + rank] = values if np.isnan(values).any() else \
+                values.astype(np.int64)
+        
+        return df
+    
+    def _match_pairs(self, names, pairs):
+        '''
+        Match (taxon, true taxon) pairs using array operations (see
+        .match_frame).
+        
+        Parameters
+        ----------
+        names : pd.Index
+            Taxon names (code = position).
+        pairs : numpy.ndarray
+            Pair codes (taxon code * len(names) + true taxon code).
+        
+        Returns
+        -------
+        levels : numpy.ndarray
+            Match levels (NaN for no match).
+        '''
+        n = len(names)
+        taxon_of, true_of = pairs // n, pairs % n
+        
+        relations, missing = self._relations(names, true_of)
+        
+        syn = np.isin(pairs, relations["syn"])
+        low = np.isin(pairs, relations["low"]) & ~syn
+        direct = np.isin(pairs, relations["direct"])
+        upper = np.isin(pairs, relations["upper"]) & ~syn & ~low
+        
+        genus = pd.factorize(
+            np.array([name.split(" ")[0] for name in names], dtype = object)
+            )[0]
+        same_genus = genus[taxon_of] == genus[true_of]
+        
+        levels = np.select(
+            [syn, low & direct, low, upper, same_genus],
+            [0, -1, -2, 1, 10],
+            default = np.nan
+            )
+        
+        ## Pairs for which .match raises a KeyError (taxa missing in the
+        ## synonym database) or might do so are left to .match
+        fallback = missing["true"][true_of] | \
+            (low & missing["child"][true_of]) | \
+                (~syn & ~low & missing["parent"][true_of])
+        
+        for i in np.flatnonzero(fallback):
+            level = self.match(names[taxon_of[i]], names[true_of[i]])
+            levels[i] = np.nan if level is None else level
+        
+        return levels
 
 #-----------------------------------------------------------------------------|
 # Match taxa
@@ -621,11 +1347,9 @@ if ADDSYNONYM:
         ADDSYNONYM[1], ADDSYNONYM[0])
         )
     
-    with open(SYNDBFILE, "rb") as f:
-        Synonyms = pk.load(f)
-
-    Synonyms.add_synonyms(ADDSYNONYM[0], ADDSYNONYM[1])
-    Synonyms.save(SYNDBFILE)
+    store = synonymstore.SynonymStore(SYNDBFILE)
+    store.add(ADDSYNONYM[0], ADDSYNONYM[1])
+    store.close()
 
 else:
     print("Updating synonyms and adding to API responses...")
@@ -646,26 +1370,26 @@ else:
     
     for key in key_list:
         if len(key) > 47:
-            M.Synonyms.database[key[:47] + "..."] = M.Synonyms.database[key]
+            M.Synonyms.database[key[:47] + "..."] = {
+                "synonyms" : list(M.Synonyms.database[key]["synonyms"])
+                }
+    
+    M.Synonyms.rebuild_index()
     
     sheets_dict = pd.read_excel(RESPONSES, sheet_name = None, index_col = None)
     print("Found Excel file sheets: {}".format(sheets_dict.keys()))
     
     df = pd.concat(sheets_dict.values())
     
-    for rank in ["first", "second", "third", "forth", "fifth"]:
-        try:
-            df["match_" + rank] = [M.match(
-                taxon, true_taxon
-                ) for taxon, true_taxon in zip(
-                    map(str, df[rank].values),
-                    map(str, df["true_taxon_name"].values)
-                    )]
-        
-        except KeyError as e:
-            lines = df[df["true_taxon_name"] == e.args[0]]
-            mssg = f"Error in {lines}. Cannot match taxon."
-            raise KeyError(mssg)
+    try:
+        df = M.match_frame(
+            df, ["first", "second", "third", "forth", "fifth"]
+            )
+    
+    except KeyError as e:
+        lines = df[df["true_taxon_name"] == e.args[0]]
+        mssg = f"Error in {lines}. Cannot match taxon."
+        raise KeyError(mssg)
     
     df.to_excel(OUTPUT, index = False, header = True, na_rep = 100)
 
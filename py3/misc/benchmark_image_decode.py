@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:21:45 2026
+
+Compare the full-resolution image preprocessing (PIL decode, RGB to BGR,
+cv2.resize) with the reduced-resolution JPEG decode of
+base.image_crop_to_b64. Peak memory is measured with tracemalloc, i.e., it
+covers NumPy arrays, but not the internal buffers of PIL.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 17:21:45 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, sys, glob, time, base64, argparse, tracemalloc
+import cv2
+
+dir_py = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(dir_py, "requests"))
+
+import base
+
+#-----------------------------------------------------------------------------|
+# Settings
+def parseArguments():
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument("-d", "--image_dir",
+                        help = "Image directory.",
+                        type = str, default = os.path.join(
+                            os.path.dirname(dir_py), "example"
+                            ))
+    parser.add_argument("-m", "--max_size",
+                        help = "Maximum image size in pixels.",
+                        type = int, default = 369800)
+    parser.add_argument("-n", "--repetitions",
+                        help = "Number of runs per image.",
+                        type = int, default = 3)
+    
+    args = parser.parse_args()
+    
+    return args
+
+#-----------------------------------------------------------------------------|
+# Functions
+def full_decode(path, max_size):
+    ## Preprocessing before the reduced-resolution decode path
+    img = base.load_image_pil(path)
+    h, w = img.shape[:2]
+    
+    if w * h > max_size:
+        SCALE = (max_size / (w * h)) ** 0.5
+        WIDTH, HEIGHT = int(w * SCALE), int(h * SCALE)
+        
+        img = cv2.resize(
+            img, (WIDTH, HEIGHT), interpolation = cv2.INTER_CUBIC
+            )
+    
+    rv, img = cv2.imencode(".jpg", img)
+    
+    return base64.b64encode(img).decode("utf8")
+
+def measure(fn, files, max_size, repetitions):
+    '''
+    Measure the run time and peak memory of a preprocessing function.
+    
+    Returns
+    -------
+    seconds : float
+        Mean run time per image.
+    peak : int
+        Peak traced memory (bytes).
+    '''
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    
+    for _ in range(repetitions):
+        for f in files:
+            fn(f, max_size)
+    
+    seconds = (time.perf_counter() - t0) / (repetitions * len(files))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    return seconds, peak
+
+#-----------------------------------------------------------------------------|
+# Main
+if __name__ == "__main__":
+    args = parseArguments()
+    
+    files = sorted(glob.glob(
+        os.path.join(args.image_dir, "**", "*.jp*g"), recursive = True
+        ))
+    
+    print(f"{len(files)} images, max_size = {args.max_size}")
+    
+    for name, fn in [("full decode", full_decode),
+                     ("reduced decode", base.image_crop_to_b64)]:
+        seconds, peak = measure(fn, files, args.max_size, args.repetitions)
+        
+        print("{0:<15} {1:8.1f} ms/image {2:8.1f} MB peak".format(
+            name, seconds * 1000, peak / 1024 ** 2
+            ))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:05:37 2026
+
+Measure how building the pending request list of a Batchrequest scales with
+the number of observations. Synthetic image metadata (META.pickle and
+RELEVE.dict) is written to a temporary directory for each archive size. The
+list is built once from scratch (fresh pending index) and once from the
+existing index; the metadata is loaded once per archive (base.MetaStore).
+For comparison, the "one load" column is the time to load the metadata
+files, which was paid once per observation before the metadata was cached.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 22:05:37 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, sys, time, argparse, tempfile
+import pickle as pk
+
+dir_py = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(dir_py, "requests"))
+
+import base
+import batchrequest_v201 as brm
+
+#-----------------------------------------------------------------------------|
+# Settings
+def parseArguments():
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument("-n", "--observations",
+                        help = "Archive sizes (number of observations).",
+                        nargs = "+",
+                        type = int, default = [1250, 2500, 5000, 10000])
+    parser.add_argument("-o", "--obs_per_releve",
+                        help = "Observations per releve.",
+                        type = int, default = 25)
+    parser.add_argument("-i", "--images",
+                        help = "Images per observation.",
+                        type = int, default = 4)
+    parser.add_argument("-r", "--repetitions",
+                        help = "Number of runs per archive size.",
+                        type = int, default = 3)
+    
+    args = parser.parse_args()
+    
+    return args
+
+#-----------------------------------------------------------------------------|
+# Functions
+def write_archive(image_dir, n_observations, obs_per_releve, n_images):
+    '''
+    Write synthetic image metadata in the format of infoflora.py.
+    
+    Returns
+    -------
+    releve_names : list of str
+        Names of the releves of the archive.
+    '''
+    metadata = {}
+    relevedict = {}
+    
+    for i in range(n_observations):
+        releve_id = 1000000 + i // obs_per_releve
+        obs_id = 20000000 + i
+        relevedict["R{0}".format(releve_id)] = releve_id
+        organs = ["i", "f", "v", "s"][:n_images] + \
+            ["i"] * max(0, n_images - 4)
+        
+        metadata[obs_id] = {
+            "obs_id" : obs_id,
+            "releve_id" : releve_id,
+            "date" : "2023-05-09T08:36:57+02:00",
+            "taxon_id" : 1037390,
+            "x" : 8.48,
+            "y" : 47.37,
+            "xy_precision" : 3.79,
+            "img_types" : organs,
+            "file_locations" : [
+                "{0}/{1}/img_{2}_{3}.jpg".format(releve_id, obs_id, k, o) \
+                    for k, o in enumerate(organs)
+                ]
+            }
+    
+    with open(os.path.join(image_dir, "META.pickle"), "wb") as f:
+        pk.dump(metadata, f)
+    
+    with open(os.path.join(image_dir, "RELEVE.dict"), "wb") as f:
+        pk.dump(relevedict, f)
+    
+    return list(relevedict.keys())
+
+def measure(image_dir, out_dir, releve_names, repetitions):
+    '''
+    Measure building the pending request list.
+    
+    Returns
+    -------
+    n_requests : int
+        Number of pending requests.
+    build : float
+        Seconds to build the list including the pending index.
+    indexed : float
+        Seconds to build the list from the existing index.
+    load : float
+        Seconds to load the metadata files once.
+    '''
+    build, indexed, load = [], [], []
+    
+    for _ in range(repetitions):
+        store = base.get_meta_store(image_dir)
+        
+        t0 = time.perf_counter()
+        store.refresh(force = True)
+        load.append(time.perf_counter() - t0)
+        
+        br = brm.Batchrequest(img_dir = image_dir, out_dir = out_dir,
+                              single = ["plantnet", "florid"],
+                              multi = ["florid"])
+        br.add_releves(releve_names)
+        
+        t0 = time.perf_counter()
+        n_requests = len(br.pending)
+        build.append(time.perf_counter() - t0)
+        
+        t0 = time.perf_counter()
+        br.pending
+        indexed.append(time.perf_counter() - t0)
+    
+    return n_requests, min(build), min(indexed), min(load)
+
+#-----------------------------------------------------------------------------|
+# Main
+if __name__ == "__main__":
+    args = parseArguments()
+    
+    print("{0:>12} {1:>10} {2:>10} {3:>14} {4:>10} {5:>10}".format(
+        "observations", "requests", "build [s]", "build [us/obs]",
+        "index [s]", "one load [s]"
+        ))
+    
+    for n in args.observations:
+        with tempfile.TemporaryDirectory() as tmp:
+            image_dir = os.path.join(tmp, "img")
+            out_dir = os.path.join(tmp, "out")
+            os.makedirs(image_dir)
+            os.makedirs(os.path.join(out_dir, "log"))
+            
+            releve_names = write_archive(
+                image_dir, n, args.obs_per_releve, args.images
+                )
+            n_requests, build, indexed, load = measure(
+                image_dir, out_dir, releve_names, args.repetitions
+                )
+        
+        print("{0:>12} {1:>10} {2:>10.3f} {3:>14.1f} {4:>10.3f} {5:>10.3f}" \
+              .format(n, n_requests, build, build / n * 1e6, indexed, load))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:31:12 2026
+
+Compare the per-request latency of a new connection per request (bare
+requests.post, as previously used by the API clients) with the shared
+provider session of httppool.py (keep-alive connection pool). Requests are
+sent to a local stub server, i.e., the measurement covers the TCP
+connection setup, but not the TLS handshake or network latency of the
+identification services.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 22:31:12 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, sys, time, argparse, statistics, threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+dir_py = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(dir_py, "requests"))
+
+import httppool
+
+#-----------------------------------------------------------------------------|
+# Settings
+def parseArguments():
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument("-n", "--requests",
+                        help = "Number of requests per variant.",
+                        type = int, default = 500)
+    parser.add_argument("-s", "--payload_size",
+                        help = "Request body size in kB (e.g., an image).",
+                        type = int, default = 200)
+    parser.add_argument("-p", "--provider",
+                        help = "Provider key of the shared session.",
+                        type = str, default = "plantnet")
+    
+    args = parser.parse_args()
+    
+    return args
+
+#-----------------------------------------------------------------------------|
+# Classes
+class StubHandler(BaseHTTPRequestHandler):
+    ## Keep connections open (HTTP/1.1) and answer with a small JSON body.
+    ## Headers and body are written separately, so Nagle's algorithm is
+    ## disabled (TCP_NODELAY); it would delay the body on kept-alive
+    ## connections by about 40 ms
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = b'{"results": [{"score": 0.9, "species": "Abies alba"}]}'
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+    
+    def log_message(self, format, *args):
+        pass
+
+#-----------------------------------------------------------------------------|
+# Functions
+def measure(post, url, payload, n):
+    '''
+    Send requests and measure their latency.
+    
+    Returns
+    -------
+    list of float
+        Latency per request (seconds).
+    '''
+    latencies = []
+    
+    for _ in range(n):
+        t0 = time.perf_counter()
+        response = post(url, data = payload, timeout = 10)
+        response.raise_for_status()
+        response.json()
+        latencies.append(time.perf_counter() - t0)
+    
+    return latencies
+
+#-----------------------------------------------------------------------------|
+# Main
+if __name__ == "__main__":
+    args = parseArguments()
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    url = "http://127.0.0.1:{0}/identify".format(server.server_address[1])
+    payload = os.urandom(args.payload_size * 1024)
+    
+    session = httppool.get_session(args.provider)
+    
+    print(f"{args.requests} requests, {args.payload_size} kB payload")
+    
+    for name, post in [("new connection", requests.post),
+                       ("shared session", session.post)]:
+        ## Warm-up (imports, first connection)
+        measure(post, url, payload, 5)
+        latencies = measure(post, url, payload, args.requests)
+        
+        print("{0:<15} {1:8.3f} ms mean {2:8.3f} ms median".format(
+            name, statistics.mean(latencies) * 1000,
+            statistics.median(latencies) * 1000
+            ))
+    
+    httppool.close_sessions()
+    server.shutdown()
@@ -63,7 +63,7 @@ for LOADFILE in logfiles:
                 print(BR.results[k0][k1][k2].keys())
     
     df = BR.to_df()
-    df["true_taxon_name"] = [SD.decode(tid) for tid in df["true_taxon_id"]]
+    df["true_taxon_name"] = SD.decode_many(df["true_taxon_id"])
     df = df.drop_duplicates(subset = ["releve_name", "observation_id",
                                         "true_taxon_id", "plant_organ",
                                         "image_files", "cv_model"],
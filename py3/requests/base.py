@@ -14,7 +14,8 @@ __status__ = "Development"
 
 #-----------------------------------------------------------------------------|
 # Imports
-import os, io, base64, datetime, cv2, requests, exif, piexif
+import os, io, base64, datetime, functools, cv2, requests, exif, piexif
+import hashlib
 import pickle as pk
 import numpy as np
 import pandas as pd
@@ -23,11 +24,22 @@ from dateutil import parser
 from fractions import Fraction
 from warnings import warn
 
+import observationstore
+
 #-----------------------------------------------------------------------------|
 # Settings
 dir_py = os.path.dirname(os.path.dirname(__file__))
 dir_main = os.path.dirname(dir_py)
 
+## Metadata stores by image directory (see get_meta_store)
+_META_STORES = {}
+
+## Parsed taxonomic backbone tables and ID indices (see read_backbone and
+## backbone_index)
+BACKBONE_CACHE_DIR = os.path.join(dir_main, "cache", "backbones")
+_BACKBONES = {}
+_BACKBONE_INDICES = {}
+
 #-----------------------------------------------------------------------------|
 # Functions
 def data_dir(*args):
@@ -143,98 +155,119 @@ def get_coords(path):
     return {"lat" : lat,
             "lon" : lon}
 
-def add_coords(path, coordinates, replace = False):
-    '''
-    Add coordinates to the Exif data of a .jpg file.
+def _exif_thumbnail(image):
+    ## Small thumbnail for Exif data that cannot be written without one
+    o = io.BytesIO()
+    thumb_im = Image.open(image)
+    
+    try:
+        thumb_im.thumbnail((25, 25), Image.LANCZOS)
+    
+    except:
+        thumb_im.thumbnail((25, 25), Image.ANTIALIAS)
+    
+    thumb_im.save(o, "jpeg")
+    
+    return o.getvalue()
+
+def _gps_ifd(coordinates):
+    ## GPS Exif tags for coordinates in decimal degrees
+    gps = {}
+    gps[piexif.GPSIFD.GPSVersionID] = (2, 0, 0, 0)
+    
+    lat_deg, lat_min, lat_sec = dec_to_dms(coordinates[0])
+    lon_deg, lon_min, lon_sec = dec_to_dms(coordinates[1])
+    
+    lat_deg, lat_min, lat_sec = [
+        (
+            Fraction(str(i)).numerator,
+            Fraction(str(i)).denominator
+            ) for i in [lat_deg, lat_min, lat_sec]
+        ]
+    
+    lon_deg, lon_min, lon_sec = [
+        (
+            Fraction(str(i)).numerator,
+            Fraction(str(i)).denominator
+            ) for i in [lon_deg, lon_min, lon_sec]
+        ]
+    
+    gps[piexif.GPSIFD.GPSLatitudeRef] = "N" if coordinates[0] >= 0 else "S"
+    gps[piexif.GPSIFD.GPSLatitude] = (lat_deg, lat_min, lat_sec)
+    gps[piexif.GPSIFD.GPSLongitudeRef] = "E" if coordinates[1] >= 0 else "W"
+    gps[piexif.GPSIFD.GPSLongitude] = (lon_deg, lon_min, lon_sec)
+    
+    return gps
 
+def set_image_meta(image, coordinates = None, date_time = None,
+                   replace = False):
+    '''
+    Add coordinates and/or creation time to the Exif data of a .jpg image in
+    a single read-modify-write cycle.
+    
     Parameters
     ----------
-    path : str
-        Full path to the image file.
-    coordinates : list or tuple of float
-        Latitude and longitude that shall be added to the image file.
-    replace : bool
-        Replace existing coordinates if the image alread contains values for
-        the repective Exif tags.
-
+    image : str or bytes
+        Full path to the image file or the content of the image file (e.g.,
+        a download buffer that has not been written to disk yet).
+    coordinates : list or tuple of float, optional
+        Latitude and longitude. The default is None (keep coordinates).
+    date_time : str/datetime, optional
+        Creation time (datetime object or string that can be parsed to a
+        datetime object). The default is None (keep creation time).
+    replace : bool, optional
+        Replace existing values if the image already contains values for the
+        respective Exif tags. The default is False.
+    
     Returns
     -------
-    None.
+    bytes
+        Updated image content if image is of type bytes, else None (the file
+        is updated in place).
     '''
+    if isinstance(image, bytes):
+        data = image
+    
+    else:
+        with open(image, "rb") as f:
+            data = f.read()
+    
     try:
-        exif_dict = piexif.load(path)
+        exif_dict = piexif.load(data)
     
     except:
-        o = io.BytesIO()
-        thumb_im = Image.open(path)
-        
-        try:
-            thumb_im.thumbnail((25, 25), Image.LANCZOS)
-        
-        except:
-            thumb_im.thumbnail((25, 25), Image.ANTIALIAS)
-        
-        thumb_im.save(o, "jpeg")
-        thumbnail = o.getvalue()
-        
         exif_dict = {
             "0th" : {},
             "Exif" : {},
             "GPS" : {},
             "1st" : {},
-            "thumbnail" : thumbnail
+            "thumbnail" : _exif_thumbnail(io.BytesIO(data))
             }
     
-    if exif_dict["GPS"] == {} or replace:
-        exif_dict["GPS"] = {}
-        exif_dict["GPS"][piexif.GPSIFD.GPSVersionID] = (2, 0, 0, 0)
-        
-        lat_deg, lat_min, lat_sec = dec_to_dms(coordinates[0])
-        lon_deg, lon_min, lon_sec = dec_to_dms(coordinates[1])
-        
-        lat_deg, lat_min, lat_sec = [
-            (
-                Fraction(str(i)).numerator,
-                Fraction(str(i)).denominator
-                ) for i in [lat_deg, lat_min, lat_sec]
-            ]
-        
-        lon_deg, lon_min, lon_sec = [
-            (
-                Fraction(str(i)).numerator,
-                Fraction(str(i)).denominator
-                ) for i in [lon_deg, lon_min, lon_sec]
-            ]
-        
-        exif_dict["GPS"][piexif.GPSIFD.GPSLatitudeRef] = "N" \
-            if coordinates[0] >= 0 else "S"
-        
-        exif_dict["GPS"][piexif.GPSIFD.GPSLatitude] = (lat_deg, lat_min,
-                                                       lat_sec)
-        
-        exif_dict["GPS"][piexif.GPSIFD.GPSLongitudeRef] = "E" \
-            if coordinates[1] >= 0 else "W"
-        
-        exif_dict["GPS"][piexif.GPSIFD.GPSLongitude] = (lon_deg, lon_min,
-                                                        lon_sec)
+    changed = False
+    
+    if coordinates is not None and (exif_dict["GPS"] == {} or replace):
+        exif_dict["GPS"] = _gps_ifd(coordinates)
+        changed = True
+    
+    if date_time is not None:
+        t_original = exif_dict["Exif"].get(piexif.ExifIFD.DateTimeOriginal)
         
+        if t_original is None or replace:
+            date_time = date_time if isinstance(
+                date_time, datetime.datetime
+                ) else parser.parse(date_time)
+            
+            exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = u"{0}" \
+                .format(date_time)
+            changed = True
+    
+    if changed:
         try:
             exif_bytes = piexif.dump(exif_dict)
         
         except:
-            o = io.BytesIO()
-            thumb_im = Image.open(path)
-            
-            try:
-                thumb_im.thumbnail((25, 25), Image.LANCZOS)
-            
-            except:
-                thumb_im.thumbnail((25, 25), Image.ANTIALIAS)
-            
-            thumb_im.save(o, "jpeg")
-            thumbnail = o.getvalue()
-            
-            exif_dict["thumbnail"] = thumbnail
+            exif_dict["thumbnail"] = _exif_thumbnail(io.BytesIO(data))
             
             try:
                 exif_bytes = piexif.dump(exif_dict)
@@ -257,7 +290,35 @@ def add_coords(path, coordinates, replace = False):
                 
                 exif_bytes = piexif.dump(exif_dict)
         
-        piexif.insert(exif_bytes, path)
+        o = io.BytesIO()
+        piexif.insert(exif_bytes, data, o)
+        data = o.getvalue()
+        
+        if not isinstance(image, bytes):
+            with open(image, "wb") as f:
+                f.write(data)
+    
+    return data if isinstance(image, bytes) else None
+
+def add_coords(path, coordinates, replace = False):
+    '''
+    Add coordinates to the Exif data of a .jpg file.
+    
+    Parameters
+    ----------
+    path : str
+        Full path to the image file.
+    coordinates : list or tuple of float
+        Latitude and longitude that shall be added to the image file.
+    replace : bool
+        Replace existing coordinates if the image alread contains values for
+        the repective Exif tags.
+    
+    Returns
+    -------
+    None.
+    '''
+    set_image_meta(path, coordinates = coordinates, replace = replace)
     
     return
 
@@ -308,61 +369,7 @@ def add_creation_time(path, date_time, replace = False):
     -------
     None.
     '''
-    date_time = parser.parse(date_time)
-    
-    try:
-        exif_dict = piexif.load(path)
-    
-    except:
-        o = io.BytesIO()
-        thumb_im = Image.open(path)
-        
-        try:
-            thumb_im.thumbnail((25, 25), Image.LANCZOS)
-        
-        except:
-            thumb_im.thumbnail((25, 25), Image.ANTIALIAS)
-        
-        thumb_im.save(o, "jpeg")
-        thumbnail = o.getvalue()
-        
-        exif_dict = {"0th" : {},
-                     "Exif" : {},
-                     "GPS" : {},
-                     "1st" : {},
-                     "thumbnail" : thumbnail
-                     }
-    
-    try:
-        t_original = exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal]
-    
-    except:
-        t_original = None
-    
-    if t_original is None or replace:
-        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = u"{0}" \
-            .format(date_time)
-    
-    try:
-        exif_bytes = piexif.dump(exif_dict)
-    
-    except:
-        o = io.BytesIO()
-        thumb_im = Image.open(path)
-        
-        try:
-            thumb_im.thumbnail((25, 25), Image.LANCZOS)
-        
-        except:
-            thumb_im.thumbnail((25, 25), Image.ANTIALIAS)
-        
-        thumb_im.save(o, "jpeg")
-        thumbnail = o.getvalue()
-        
-        exif_dict["thumbnail"] = thumbnail
-        exif_bytes = piexif.dump(exif_dict)
-    
-    piexif.insert(exif_bytes, path)
+    set_image_meta(path, date_time = date_time, replace = replace)
     
     return
 
@@ -375,6 +382,60 @@ def load_image_pil(path):
         warn(f"Error loading image {path}: {e}")
         return None
 
+def load_image_reduced(path, max_size = None):
+    '''
+    Load an image as BGR array. JPEG images are decoded at reduced resolution
+    (DCT scaling by 1/2, 1/4, or 1/8), as long as the decoded image keeps at
+    least max_size pixels. Like load_image_pil, the EXIF orientation is not
+    applied.
+    
+    Parameters
+    ----------
+    path : str
+        Full path to image file.
+    max_size : int, optional
+        Minimum number of pixels of the decoded image. The default is None
+        (decode at full resolution).
+    
+    Returns
+    -------
+    img : numpy.ndarray
+        Image (None if the image cannot be loaded).
+    w, h : int
+        Width and height of the image at full resolution.
+    '''
+    try:
+        ## Read the image size from the header only
+        with Image.open(path) as im:
+            w, h = im.size
+        
+        flags = cv2.IMREAD_COLOR
+        
+        if max_size is not None:
+            for factor, reduced in [
+                    (8, cv2.IMREAD_REDUCED_COLOR_8),
+                    (4, cv2.IMREAD_REDUCED_COLOR_4),
+                    (2, cv2.IMREAD_REDUCED_COLOR_2)
+                    ]:
+                if (w // factor) * (h // factor) >= max_size:
+                    flags = reduced
+                    break
+        
+        img = cv2.imdecode(
+            np.fromfile(path, dtype = np.uint8),
+            flags | cv2.IMREAD_IGNORE_ORIENTATION
+            )
+    
+    except Exception as e:
+        warn(f"Error loading image {path}: {e}")
+        return None, None, None
+    
+    if img is None:
+        ## Formats not supported by OpenCV
+        img = load_image_pil(path)
+    
+    return img, w, h
+
 def image_file_to_b64(path):
     '''
     Convert image to base64 encoded string.
@@ -414,16 +475,19 @@ def image_crop_to_b64(path, max_size):
     str
         Encoded string.
     '''
-    img = load_image_pil(path)
-    h, w = img.shape[:2]
+    img, w, h = load_image_reduced(path, max_size)
+    
+    if img is None:
+        raise ValueError(f"Decoding failed for image: {path}")
     
     if w * h > max_size:
         SCALE = (max_size / (w * h)) ** 0.5
         WIDTH, HEIGHT = int(w * SCALE), int(h * SCALE)
         
-        img = cv2.resize(
-            img, (WIDTH, HEIGHT), interpolation = cv2.INTER_CUBIC
-            )
+        if img.shape[:2] != (HEIGHT, WIDTH):
+            img = cv2.resize(
+                img, (WIDTH, HEIGHT), interpolation = cv2.INTER_CUBIC
+                )
         
     rv, img = cv2.imencode(".jpg", img)
     
@@ -473,8 +537,315 @@ def remove_empty(root):
         if not f[2]:
             os.rmdir(f[0])
 
+def relocate_path(image_dir, path):
+    '''
+    Map an image path to an image directory (keeping the releve and
+    observation subdirectories).
+    
+    Parameters
+    ----------
+    image_dir : str
+        Image file collection directory.
+    path : str
+        Image file path as stored in the metadata.
+    
+    Returns
+    -------
+    str
+        Image file path within the image directory.
+    '''
+    return os.path.join(
+        image_dir,
+        os.path.basename(os.path.dirname(os.path.dirname(path))),
+        os.path.basename(os.path.dirname(path)),
+        os.path.basename(path)
+        )
+
+def relocate_observation(image_dir, observation):
+    '''
+    Map the image paths of an observation to an image directory (see
+    relocate_path).
+    
+    Returns
+    -------
+    dict
+        Observation.
+    '''
+    if "file_locations" in observation:
+        observation["file_locations"] = [
+            relocate_path(image_dir, p) for p in \
+                observation["file_locations"]
+            ]
+    
+    return observation
+
+def get_meta_store(image_dir):
+    '''
+    Get the shared metadata store of an image file collection.
+    
+    Parameters
+    ----------
+    image_dir : str
+        Image file collection directory.
+    
+    Returns
+    -------
+    MetaStore
+        Metadata store of the image directory. The same instance is returned
+        for repeated calls with the same directory.
+    '''
+    key = os.path.normpath(image_dir)
+    
+    if key not in _META_STORES:
+        _META_STORES[key] = MetaStore(image_dir)
+    
+    return _META_STORES[key]
+
+def read_backbone(path):
+    '''
+    Read a taxonomic backbone table (.csv; leading comment lines starting
+    with "#" are skipped). The parsed table is kept in memory and in a pickle
+    file in BACKBONE_CACHE_DIR, which other processes load instead of parsing
+    the table as long as it is newer than the table.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the backbone table.
+    
+    Returns
+    -------
+    pandas.DataFrame
+        Taxonomic backbone.
+    '''
+    key = os.path.normpath(path)
+    mtime = os.path.getmtime(path)
+    
+    if key in _BACKBONES and _BACKBONES[key][0] == mtime:
+        return _BACKBONES[key][1]
+    
+    cache = os.path.join(BACKBONE_CACHE_DIR, "{0}_{1}.pickle".format(
+        os.path.basename(path),
+        hashlib.sha1(os.path.abspath(path).encode("utf8")).hexdigest()[:8]
+        ))
+    backbone = None
+    
+    if os.path.isfile(cache) and os.path.getmtime(cache) >= mtime:
+        try:
+            backbone = pd.read_pickle(cache)
+        
+        except Exception:
+            backbone = None
+    
+    if backbone is None:
+        skip = 0
+        
+        with open(path, "r", encoding = "utf-8") as f:
+            for line in f:
+                if not line.startswith("#"):
+                    break
+                
+                skip += 1
+        
+        backbone = pd.read_table(path, sep = ",", skiprows = skip)
+        
+        try:
+            os.makedirs(BACKBONE_CACHE_DIR, exist_ok = True)
+            backbone.to_pickle(cache + ".tmp")
+            os.replace(cache + ".tmp", cache)
+        
+        except OSError:
+            warn("Unable to cache taxonomic backbone at {0}.".format(cache))
+    
+    _BACKBONES[key] = (mtime, backbone)
+    
+    return backbone
+
+def backbone_index(path, key_col, value_col):
+    '''
+    Get an index (lookup table) that maps the values of one column of a
+    taxonomic backbone table to the values of another column. The index is
+    built once per table version.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the backbone table.
+    key_col : str
+        Column to look up (e.g., "ID").
+    value_col : str
+        Column to return (e.g., "COMECO_ID").
+    
+    Returns
+    -------
+    pandas.Series
+        Values of value_col with the values of key_col as index. For
+        duplicated keys, the first entry is used.
+    '''
+    backbone = read_backbone(path)
+    key = (os.path.normpath(path), key_col, value_col)
+    
+    if key not in _BACKBONE_INDICES or \
+        _BACKBONE_INDICES[key][0] is not backbone:
+        taxa = backbone.drop_duplicates(subset = key_col)
+        index = pd.Series(
+            taxa[value_col].values, index = taxa[key_col].values
+            )
+        
+        _BACKBONE_INDICES[key] = (backbone, index)
+    
+    return _BACKBONE_INDICES[key][1]
+
 #-----------------------------------------------------------------------------|
 # Classes
+class MetaStore():
+    def __init__(self, image_dir):
+        '''
+        Store of the image metadata (META.pickle or observation store
+        META.sqlite) and releve dictionary (RELEVE.dict) of an image file
+        collection.
+        
+        Parameters
+        ----------
+        image_dir : str
+            Image file collection directory. Must contain a META.pickle or
+            META.sqlite and a RELEVE.dict file.
+        
+        Returns
+        -------
+        None.
+        
+        Notes
+        -----
+        The files are read on first access and only read again once their
+        modification time changes. If the directory contains an observation
+        store (see observationstore.py) that is at least as recent as
+        META.pickle, observations are read from the store on access instead
+        of loading all metadata into memory.
+        '''
+        self.image_dir = image_dir
+        self.meta_file = os.path.join(image_dir, "META.pickle")
+        self.store_file = os.path.join(image_dir, observationstore.FILENAME)
+        self.releve_file = os.path.join(image_dir, "RELEVE.dict")
+        self._mtimes = None
+        self._metadata = None
+        self._relevedict = None
+        self._image_dicts = {}
+    
+    @property
+    def metadata(self):
+        self.refresh()
+        
+        return self._metadata
+    
+    @property
+    def relevedict(self):
+        self.refresh()
+        
+        return self._relevedict
+    
+    def refresh(self, force = False):
+        '''
+        Reload the metadata files if they changed since they were last read.
+        
+        Parameters
+        ----------
+        force : bool, optional
+            Reload irrespective of the file modification times. The default
+            is False.
+        
+        Returns
+        -------
+        bool
+            True if the files were (re)loaded.
+        '''
+        meta_file = observationstore.metadata_file(self.image_dir)
+        use_store = meta_file == self.store_file
+        
+        mtimes = (meta_file, os.path.getmtime(meta_file),
+                  os.path.getmtime(self.releve_file))
+        
+        if not force and mtimes == self._mtimes:
+            return False
+        
+        if use_store:
+            metadata = observationstore.ObservationStore(meta_file).view(
+                transform = functools.partial(
+                    relocate_observation, self.image_dir
+                    )
+                )
+        
+        else:
+            with open(meta_file, "rb") as f:
+                metadata = pk.load(f)
+            
+            for obs in metadata.values():
+                relocate_observation(self.image_dir, obs)
+        
+        with open(self.releve_file, "rb") as f:
+            relevedict = pk.load(f)
+        
+        self._metadata = metadata
+        self._relevedict = relevedict
+        self._image_dicts = {}
+        self._mtimes = mtimes
+        
+        return True
+    
+    def relocate(self, path):
+        '''
+        Map an image path to the current image directory (keeping the releve
+        and observation subdirectories).
+        
+        Parameters
+        ----------
+        path : str
+            Image file path as stored in the metadata.
+        
+        Returns
+        -------
+        str
+            Image file path within the current image directory.
+        '''
+        return relocate_path(self.image_dir, path)
+    
+    def image_dict(self, observation_id):
+        '''
+        Get the image dictionary of an observation (see
+        Batchrequest._get_image_dict).
+        
+        Parameters
+        ----------
+        observation_id : int
+            Observation ID.
+        
+        Returns
+        -------
+        dict
+            Dictionary with the image names as keys and nested dictionaries
+            containing disc location (key "disc_location") and depicted plant
+            part (key "organ") for each image.
+        '''
+        metadata = self.metadata
+        
+        if observation_id not in self._image_dicts:
+            observation = metadata[observation_id]
+            image_files = observation["file_locations"]
+            image_names = [
+                os.path.splitext(
+                    os.path.split(p.replace("\\", "/"))[-1]
+                    )[0] for p in image_files
+                ]
+            
+            details = [{"disc_location" : p, "organ" : o} for p, o in \
+                       zip(image_files, observation["img_types"])]
+            
+            self._image_dicts[observation_id] = {
+                key : value for key, value in zip(image_names, details)
+                }
+        
+        return self._image_dicts[observation_id]
+
 class SpeciesDecoder():
     def __init__(self, taxon_bb):
         self.backbone_dict = {
@@ -492,14 +863,54 @@ class SpeciesDecoder():
         self._id_col = self.backbone_dict[taxon_bb]["id"]
         self._name_col = self.backbone_dict[taxon_bb]["name"]
         
-        self.taxa_df = pd.read_table(self.taxonomic_backbone, sep = ",")
+        self.taxa_df = read_backbone(self.taxonomic_backbone)
+        
+        ## Taxon ID -> name index
+        self.names = backbone_index(
+            self.taxonomic_backbone, self._id_col, self._name_col
+            )
+        self._names = self.names.to_dict()
     
     def decode(self, taxon_id):
-        taxon_name = self.taxa_df[ \
-            self.taxa_df[self._id_col] == taxon_id \
-            ][self._name_col]
+        '''
+        Get the name of a taxon.
+        
+        Parameters
+        ----------
+        taxon_id : int
+            Taxon ID.
+        
+        Returns
+        -------
+        str
+            Taxon name (None if the ID is not part of the backbone).
+        '''
+        try:
+            return self._names.get(int(taxon_id))
+        
+        except (TypeError, ValueError):
+            return None
+    
+    def decode_many(self, taxon_ids):
+        '''
+        Get the names of multiple taxa.
+        
+        Parameters
+        ----------
+        taxon_ids : pandas.Series or list
+            Taxon IDs.
+        
+        Returns
+        -------
+        pandas.Series
+            Taxon names (NaN for IDs that are not part of the backbone).
+        '''
+        taxon_ids = taxon_ids if isinstance(taxon_ids, pd.Series) else \
+            pd.Series(taxon_ids)
+        
+        taxon_ids = pd.to_numeric(taxon_ids, errors = "coerce")
         
-        return taxon_name.to_string(index = False)
+        return taxon_ids.map(self.names)
     
     def check_wfo(self, name):
         WFOURL = "https://list.worldfloraonline.org/matching_rest.php?"
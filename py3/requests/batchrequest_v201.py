@@ -16,19 +16,27 @@ __status__ = "Production"
 
 #-----------------------------------------------------------------------------|
 # Imports
-import os, re, glob, time, random, argparse, platform
+import os, re, glob, math, time, random, argparse, platform, threading
 import pandas as pd
+import concurrent.futures as cf
 import pickle as pk
+from collections import deque
 from datetime import datetime, timedelta
 from alive_progress import alive_bar as pb
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 
-import base
+import base, dispatch, quota, journal, checkpoint, resultstable
+import payloadcache
 import plantnet, inaturalistcv, florid, floraincognita
 from floraincognita import insert as insert_florinc
 
 #-----------------------------------------------------------------------------|
 # Settings
+## Image metadata snapshot of a Batchrequest. Not pickled (checkpoints would
+## grow with the image archive); reloaded from base.MetaStore on access
+STATICMETA = ["_image_meta_static", "_releve_dict_static",
+              "_releve_dict_static_inv"]
+
 dir_py = os.path.dirname(os.getcwd())# for debugging in IDE
 dir_py = os.path.dirname(os.path.dirname(__file__))
 dir_main = os.path.dirname(dir_py)
@@ -86,6 +94,17 @@ def parseArguments():
                         help = "Repeat requests for specific CV models.",
                         nargs = "+",
                         type = str, default = [])
+    parser.add_argument("-c", "--concurrent",
+                        help = "Send requests to the different CV models " + \
+                            "in parallel.",
+                        action = "store_true")
+    parser.add_argument("-e", "--export_format",
+                        help = "Format of the exported response table " + \
+                            "(parquet, feather, or pickle).",
+                        type = str, default = "parquet")
+    parser.add_argument("-no_excel", "--no_excel",
+                        help = "Do not add the responses to Responses.xlsx.",
+                        action = "store_true")
     parser.add_argument("-u", "--update_fixed",
                         help = "Update plant part and taxon information." +
                         " Note: When -u is set, no requests will be started." +
@@ -111,6 +130,9 @@ if __name__ == "__main__":
     MANUALUPDATE = args.mupdate
     REPEAT = args.repeat if isinstance(args.repeat, list) else [args.repeat]
     UPDATEFIXED = args.update_fixed
+    CONCURRENT = args.concurrent
+    EXPORTFORMAT = args.export_format
+    EXCEL = not args.no_excel
     
     if FLORINC is not None:
         RELEVETABLE = ""
@@ -182,19 +204,62 @@ class Batchrequest():
         self.version = "2.0.1"
         
         self.set_image_dir(img_dir)
-        self.florid_taxonomy = None
     
     @property
-    def _image_meta(self):
-        image_meta, releve_dict = self.read_meta()
+    def _meta_store(self):
+        return base.get_meta_store(self.image_dir)
+    
+    @property
+    def _journal(self):
+        ## Opened lazily; the file handle is not part of the pickled state
+        if getattr(self, "_journal_obj", None) is None:
+            self._journal_obj = journal.ResultsJournal(
+                self.path_out(self.name + journal.EXTENSION, "log")
+                )
         
-        return image_meta
+        return self._journal_obj
     
     @property
-    def _releve_dict(self):
-        image_meta, releve_dict = self.read_meta()
+    def _results_lock(self):
+        ## Serialises changes of the results with journal compaction (see
+        ## ._write_checkpoint); not part of the pickled state
+        if getattr(self, "_results_lock_obj", None) is None:
+            self._results_lock_obj = threading.Lock()
         
-        return releve_dict
+        return self._results_lock_obj
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_journal_obj", None)
+        state.pop("_prefetcher", None)
+        state.pop("_results_lock_obj", None)
+        
+        ## Derived from the results and the image metadata (rebuilt on demand)
+        state.pop("_pending_index", None)
+        state.pop("_releve_observations", None)
+        
+        for key in STATICMETA:
+            state.pop(key, None)
+        
+        return state
+    
+    def __getattr__(self, name):
+        ## Only called for missing attributes: load the image metadata
+        ## snapshot after unpickling
+        if name in STATICMETA and "image_dir" in self.__dict__:
+            self._load_image_dicts()
+            
+            return self.__dict__[name]
+        
+        raise AttributeError(name)
+    
+    @property
+    def _image_meta(self):
+        return self._meta_store.metadata
+    
+    @property
+    def _releve_dict(self):
+        return self._meta_store.relevedict
     
     @property
     def total_releve_ids(self):
@@ -214,58 +279,175 @@ class Batchrequest():
             List of pending requests with their releve name, observation id,
             image (either a path or "multi"), plant organ, and CV model.
         '''
+        pending_index = self._pending
         pending = []
         
-        for observation in self._image_meta_static.values():
-            if observation["releve_id"] in self.total_releve_ids:
-                releve_name = self._releve_dict_static_inv[
-                    observation["releve_id"]
-                    ]
-                
-                observation_id = observation["obs_id"]
-                image_dict_vals = self._get_image_dict(observation_id).values()
-                paths = [x["disc_location"] for x in image_dict_vals]
-                parts = [x["organ"] for x in image_dict_vals]
-                
-                for cv_model, mode, part in zip(
-                        self.single * len(paths) + self.multi,
-                        [p for p in paths for q in range(
-                            len(self.single)
-                            )] + ["multi"] * len(self.multi),
-                        [p for p in parts for q in range(
-                            len(self.single)
-                            )] + ["multi"] * len(self.multi)
-                        ):
-                    try:
-                        exists = isinstance(
-                            self.results[releve_name][observation_id] \
-                                [mode][cv_model], dict
-                            )
-                        
-                        if not exists:
-                            p = "multi" if mode == "multi" else part
-                            pending.append([
-                                releve_name, observation_id, mode, p,
-                                cv_model
-                                ])
-                    
-                    except:
-                        p = "multi" if mode == "multi" else part
-                        
-                        pending.append([
-                            releve_name, observation_id, mode, p, cv_model
-                             ])
+        for releve_name in sorted(pending_index.keys()):
+            for obs_requests in pending_index[releve_name].values():
+                pending += [list(r) for r in obs_requests]
         
-        return sorted(pending, key = lambda x: x[0])
+        return pending
     
     @property
     def completed_releves(self):
-        pending = set([p[0] for p in self.pending])
+        pending_index = self._pending
         
-        completed = [n for n in self.total_releve_names if n not in pending]
+        completed = [n for n in self.total_releve_names if \
+                     len(pending_index.get(n, {})) == 0]
         
         return completed
     
+    @property
+    def _pending(self):
+        '''
+        Index of pending requests by releve name and observation ID. Built on
+        first access and updated incrementally afterwards.
+        
+        Returns
+        -------
+        dict
+            Nested dictionary {releve_name : {observation_id : requests}},
+            where requests is a dictionary with pending request tuples as keys
+            (used as an insertion-ordered set). Observations without pending
+            requests are removed.
+        '''
+        if getattr(self, "_pending_index", None) is None:
+            self._pending_index = {}
+            self._index_pending(self.total_releve_names)
+        
+        return self._pending_index
+    
+    def _observations_by_releve(self):
+        '''
+        Group the observations of the image metadata by releve ID.
+        
+        Returns
+        -------
+        dict
+            Dictionary {releve_id : list of observation dicts}.
+        '''
+        if getattr(self, "_releve_observations", None) is None:
+            grouped = {}
+            
+            for observation in self._image_meta_static.values():
+                grouped.setdefault(observation["releve_id"], []).append(
+                    observation
+                    )
+            
+            self._releve_observations = grouped
+        
+        return self._releve_observations
+    
+    def _observation_requests(self, releve_name, observation_id,
+                              models_single, models_multi):
+        '''
+        List all requests of an observation for the given CV models.
+        
+        Returns
+        -------
+        list of tuple
+            Requests with releve name, observation id, image (either a path or
+            "multi"), plant organ, and CV model.
+        '''
+        image_dict_vals = self._get_image_dict(observation_id).values()
+        paths = [x["disc_location"] for x in image_dict_vals]
+        parts = [x["organ"] for x in image_dict_vals]
+        
+        obs_requests = []
+        
+        for cv_model, mode, part in zip(
+                models_single * len(paths) + models_multi,
+                [p for p in paths for q in range(
+                    len(models_single)
+                    )] + ["multi"] * len(models_multi),
+                [p for p in parts for q in range(
+                    len(models_single)
+                    )] + ["multi"] * len(models_multi)
+                ):
+            p = "multi" if mode == "multi" else part
+            
+            obs_requests.append(
+                (releve_name, observation_id, mode, p, cv_model)
+                )
+        
+        return obs_requests
+    
+    def _index_pending(self, releve_names, observations = None):
+        '''
+        (Re)build the pending request index for a set of releves.
+        
+        Parameters
+        ----------
+        releve_names : list of str
+            Names of the releves to (re)index.
+        observations : list of int, optional
+            Restrict re-indexing to these observation IDs. The default is
+            None (all observations of the releves).
+        
+        Returns
+        -------
+        None.
+        '''
+        pending_index = self._pending_index
+        grouped = self._observations_by_releve()
+        observations = None if observations is None else set(observations)
+        
+        for releve_name in set(releve_names):
+            releve_id = self._releve_dict_static[releve_name]
+            releve_index = pending_index.setdefault(releve_name, {})
+            
+            for observation in grouped.get(releve_id, []):
+                observation_id = observation["obs_id"]
+                
+                if observations is not None and \
+                    observation_id not in observations:
+                    continue
+                
+                obs_requests = {
+                    r : None for r in self._observation_requests(
+                        releve_name, observation_id, self.single, self.multi
+                        ) if not self._has_result(*r)
+                    }
+                
+                if len(obs_requests) > 0:
+                    releve_index[observation_id] = obs_requests
+                
+                else:
+                    releve_index.pop(observation_id, None)
+    
+    def _has_result(self, releve_name, observation_id, image, part,
+                    cv_model):
+        try:
+            return isinstance(
+                self.results[releve_name][observation_id][image][cv_model],
+                dict
+                )
+        
+        except (KeyError, TypeError):
+            return False
+    
+    def _mark_completed(self, request):
+        '''
+        Remove a request from the pending request index.
+        
+        Parameters
+        ----------
+        request : list
+            Request with releve name, observation id, image, plant organ, and
+            CV model (as returned by .pending).
+        
+        Returns
+        -------
+        None.
+        '''
+        releve_name, observation_id = request[:2]
+        releve_index = self._pending.get(releve_name, {})
+        obs_requests = releve_index.get(observation_id, {})
+        obs_requests.pop(tuple(request), None)
+        
+        if len(obs_requests) == 0:
+            releve_index.pop(observation_id, None)
+    
     def set_image_dir(self, img_dir):
         '''
         Set image directory and load image file collection metadata.
@@ -291,6 +473,13 @@ class Batchrequest():
         -------
         None.
         '''
+        self._load_image_dicts()
+        
+        ## Observations and pending requests are indexed on demand
+        self._releve_observations = None
+        self._pending_index = None
+    
+    def _load_image_dicts(self):
         self._image_meta_static, self._releve_dict_static = self.read_meta()
         
         self._releve_dict_static_inv = {key : value for value, key in \
@@ -311,23 +500,9 @@ class Batchrequest():
             Dictionary containing releve information. (Used to link releve
             names to releve IDs.)
         '''
-        with open(os.path.join(self.image_dir, "META.pickle"), "rb") as f:
-            metadata = pk.load(f)
+        store = self._meta_store
         
-        with open(os.path.join(self.image_dir, "RELEVE.dict"), "rb") as f:
-            relevedict = pk.load(f)
-        
-        for obs in metadata.values():
-            obs["file_locations"] = [
-                os.path.join(
-                    self.image_dir,
-                    os.path.basename(os.path.dirname(os.path.dirname(path))),
-                    os.path.basename(os.path.dirname(path)),
-                    os.path.basename(path)
-                    ) for path in obs["file_locations"]
-                ]
-        
-        return metadata, relevedict
+        return store.metadata, store.relevedict
     
     def translate_id(self, infoflora_id, id_table = TAXONTABLE):
         '''
@@ -346,15 +521,12 @@ class Batchrequest():
         taxon_id : int
             FlorID taxon ID.
         '''
-        if not isinstance(self.florid_taxonomy, pd.core.frame.DataFrame):
-            self.florid_taxonomy = pd.read_table(TAXONTABLE, sep = ",")
+        index = base.backbone_index(id_table, "ID", "COMECO_ID")
         
         try:
-            taxon_id = self.florid_taxonomy["COMECO_ID"][
-                self.florid_taxonomy["ID"] == infoflora_id
-                ].values[0]
+            taxon_id = index[int(infoflora_id)]
         
-        except:
+        except (KeyError, TypeError, ValueError):
             mssg = "Info Flora ID {0} not found in taxonomy backbone."
             print(mssg.format(infoflora_id))
             
@@ -362,6 +534,32 @@ class Batchrequest():
         
         return taxon_id
     
+    def translate_ids(self, infoflora_ids, id_table = TAXONTABLE):
+        '''
+        Translate multiple Info Flora taxon IDs to FlorID taxon IDs.
+        
+        Parameters
+        ----------
+        infoflora_ids : pandas.Series or list
+            Info Flora taxon IDs.
+        id_table : str, optional
+            Path to the FlorID taxonomic backbone table. The default is
+            TAXONTABLE.
+        
+        Returns
+        -------
+        pandas.Series
+            FlorID taxon IDs (<NA> for IDs not found in the backbone).
+        '''
+        infoflora_ids = infoflora_ids if isinstance(
+            infoflora_ids, pd.Series
+            ) else pd.Series(infoflora_ids)
+        
+        index = base.backbone_index(id_table, "ID", "COMECO_ID")
+        taxon_ids = pd.to_numeric(infoflora_ids, errors = "coerce").map(index)
+        
+        return taxon_ids.astype("Int64")
+    
     def add_releves(self, releve_name_list):
         '''
         Add releves to include during the batch request by name.
@@ -376,10 +574,15 @@ class Batchrequest():
         None.
         '''
         releve_name_list = self._list_input(releve_name_list)
+        new_releves = [n for n in set(releve_name_list) if n not in \
+                       self.total_releve_names]
         
         self.total_releve_names += releve_name_list
         self.total_releve_names = list(set(self.total_releve_names))
         
+        if getattr(self, "_pending_index", None) is not None:
+            self._index_pending(new_releves)
+        
         self.parameters = {
             "releve_name_list" : releve_name_list
             }
@@ -523,7 +726,8 @@ class Batchrequest():
         
         return result_dict
     
-    def run_batch(self, checkpoints = True, cp_freq = 10, repeat = False):
+    def run_batch(self, checkpoints = True, cp_freq = 10, repeat = False,
+                  concurrent = False, cp_policy = None, prefetch = True):
         '''
         Start batch request.
         
@@ -535,13 +739,27 @@ class Batchrequest():
         cp_freq : int, optional
             Set frequency (in completed requests) at which checkpoints are
             saved if checkpoints is set to True. The default is 10.
+        concurrent : bool, optional
+            Send requests to the different CV models in parallel, using one
+            worker queue per model (see dispatch.py and quota.py for the
+            concurrency and rate limits per model). Results are added to
+            self.results as they arrive; since every request fills its own
+            slot, the merged results do not depend on the completion order.
+            The default is False.
+        cp_policy : checkpoint.CheckpointPolicy, optional
+            Checkpoint policy (every N requests, T seconds, or B bytes of new
+            results). Checkpoints are written in a background thread. The
+            default is None (checkpoint every cp_freq requests).
+        prefetch : bool, optional
+            Prepare the image payloads of upcoming requests in a process pool
+            (see payloadcache.py). The default is True.
         
         Raises
         ------
         Warning
-            DESCRIPTION.
+            Observation metadata incomplete.
         Exception
-            DESCRIPTION.
+            API request failed (e.g., due to exceeded API quotas).
         
         Returns
         -------
@@ -549,183 +767,546 @@ class Batchrequest():
         '''
         self.t_start = datetime.now()
         
-        last_releve = None
         ## Use hidden argument to run alternative list for repeating
         ## requests
         print("Gathering information on pending API requests...")
         with pb(unknown = "brackets", spinner = "classic") as bar:
             request_list = self.to_repeat if repeat else self.pending
         
+        if cp_policy is None:
+            cp_policy = checkpoint.CheckpointPolicy(every_n = cp_freq)
+        
+        cp_policy.reset()
+        
+        self._prefetcher = self._prefetch(request_list) if prefetch else None
+        
         print("Starting API requests...")
+        try:
+            with checkpoint.CheckpointWriter() as cp_writer:
+                if concurrent:
+                    self._run_concurrent(
+                        request_list, checkpoints, cp_policy, cp_writer
+                        )
+                
+                else:
+                    self._run_sequential(
+                        request_list, checkpoints, cp_policy, cp_writer
+                        )
+        
+        finally:
+            if self._prefetcher is not None:
+                self._prefetcher.shutdown()
+                self._prefetcher = None
+    
+    def _run_sequential(self, request_list, checkpoints, cp_policy,
+                        cp_writer):
+        '''
+        Send the requests of a batch one after another.
+        
+        Parameters
+        ----------
+        request_list : list
+            Requests as returned by .pending.
+        checkpoints : bool
+            Whether to save checkpoints.
+        cp_policy : checkpoint.CheckpointPolicy
+            Decides when a checkpoint is due.
+        cp_writer : checkpoint.CheckpointWriter
+            Background thread that writes the checkpoints.
+        
+        Returns
+        -------
+        None.
+        '''
+        last_releve = None
+        selections = {}
+        
         with pb(len(request_list), bar = "smooth") as bar:
-            for i, current_request in enumerate(request_list):
+            for i, current_request in enumerate(
+                    self._schedule(request_list, cp_writer)
+                    ):
                 releve_name, observation_id, image, p, \
                     cv_model = current_request
                 
-                ## Extract current releve id based on releve name
-                releve_id = self._releve_dict_static[releve_name]
-                
                 ## Print notification
                 if last_releve != releve_name:
                     mssg = "-" * 40 + "\nCurrent releve\nName: {0}\nID: {1}\n"
-                    print(mssg.format(releve_name, releve_id))
+                    print(mssg.format(
+                        releve_name, self._releve_dict_static[releve_name]
+                        ))
                     last_releve = releve_name
                 
-                observation = self._image_meta_static[observation_id]
-                
+                ### Handle warnings (in particular, the iNaturalist
+                ### VisionAPI quota limit warning) and incomplete metadata
                 try:
-                    image_files = observation["file_locations"]
-                    true_taxon_id = observation["taxon_id"]
-                    date = observation["date"]
-                    coordinates = (observation["y"], observation["x"])
-                    img_types = observation["img_types"]
-                
-                except:
-                    self.errors.append({
-                        "releve_name" : releve_name,
-                        "releve_id" : releve_id,
-                        "obs_id" : observation_id,
-                        "error_type" : "Failed to read metadata tag."
-                        })
+                    request_kwargs = self._request_kwargs(
+                        current_request, selections
+                        )
                     
-                    mssg = "Failed to read observation information for" + \
-                        " observation {0} in releve {1} (releve_id = {2})."
+                    mssg = "Current obs.: {0}\nCurrent releve: {1}"
+                    print(mssg.format(observation_id, releve_name))
                     
-                    raise Warning(
-                        mssg.format(observation_id, releve_name, releve_id)
+                    response = self._send_request(
+                        current_request, request_kwargs
                         )
                     
-                    continue
+                    nbytes = self._store_result(current_request, response)
                 
-                ### Handle warnings (in particular, the iNaturalist
-                ### VisionAPI quota limit warning)
-                try:
-                    mssg = "Current obs.: {0}\nCurrent releve: {1}"
-                    print(mssg.format(observation_id, releve_name))
+                except:
+                    cp_writer.wait()
+                    self._checkpoint("at_last_exception")
                     
-                    if image != "multi":
-                        response = self.single_image_request(
-                            cv_model = cv_model,
-                            image_path = image,
-                            coordinates = coordinates,
-                            date = date,
-                            organ = p,
-                            releve_name = releve_name,
-                            releve_id = releve_id,
-                            observation_id = observation_id,
-                            true_taxon_id = true_taxon_id
-                            )
+                    mssg = "Stumbled upon warning. Check API quotas."
+                    raise Exception(mssg)
+                
+                # Save as checkpoint to reduce data loss in case of error
+                if checkpoints and cp_policy.update(nbytes):
+                    self._checkpoint(writer = cp_writer)
+                
+                ### Increase progress bar
+                bar()
+    
+    def _run_concurrent(self, request_list, checkpoints, cp_policy,
+                        cp_writer):
+        '''
+        Send the requests of a batch with one worker queue per CV model and
+        merge the responses into self.results as they arrive.
+        
+        Parameters
+        ----------
+        request_list : list
+            Requests as returned by .pending.
+        checkpoints : bool
+            Whether to save checkpoints.
+        cp_policy : checkpoint.CheckpointPolicy
+            Decides when a checkpoint is due.
+        cp_writer : checkpoint.CheckpointWriter
+            Background thread that writes the checkpoints.
+        
+        Returns
+        -------
+        None.
+        '''
+        selections = {}
+        futures = {}
+        
+        ## Futures whose results were stored already
+        handled = set()
+        
+        def abort(dispatcher):
+            dispatcher.shutdown(wait = True, cancel = True)
+            
+            ### Keep responses that arrived in the meantime
+            for other, other_request in futures.items():
+                if other not in handled and other.done() and \
+                    not other.cancelled() and other.exception() is None:
+                    self._store_result(other_request, other.result())
+                    handled.add(other)
+            
+            cp_writer.wait()
+            self._checkpoint("at_last_exception")
+            
+            mssg = "Stumbled upon warning. Check API quotas."
+            raise Exception(mssg)
+        
+        with dispatch.Dispatcher() as dispatcher:
+            try:
+                for current_request in request_list:
+                    request_kwargs = self._request_kwargs(
+                        current_request, selections
+                        )
                     
-                    else:
-                        ### Find existing multi-image request for the same
-                        ### observation to use the same image combination.
-                        ### Else, select new (stratified) random images.
-                        try:
-                            parent_dict = self \
-                                .results[releve_name][observation_id]["multi"]
-                            
-                            response_0 = parent_dict[list(
-                                parent_dict.keys()
-                                )[0]]
-                            
-                            image_selection = response_0["image_files"] \
-                                .split(";")
-                            organs = response_0["plant_organ"].split(";")
-                        
-                        except:
-                            ### Select 5 images in case more were provided
-                            ### To this end, first get the first element for
-                            ### each individual plant organ category.
-                            indices = [img_types.index(t) for t in set(
-                                img_types
-                                )]
-                            
-                            ### Remove the selected images from the list of
-                            ### remaining images
-                            remaining = list(range(len(image_files)))
-                            
-                            for i in indices:
-                                remaining.remove(i)
-                            
-                            ### Fill up remaining places with random images
-                            if len(remaining) > 0:
-                                n_additional = min(
-                                    len(remaining), NSAMPLES - len(indices)
-                                    )
-                                
-                                indices += random.sample(
-                                    remaining, k = n_additional
-                                    )
-                            
-                            indices.sort()
-                            
-                            ### Select subset from photo list
-                            #### Select random images
-                            image_selection = [image_files[i] for i in indices]
-                            organs = [img_types[i] for i in indices]
-                        
-                        response = self.multi_image_request(
-                            cv_model = cv_model,
-                            image_paths = image_selection,
-                            coordinates = coordinates,
-                            date = date,
-                            organs = organs,
-                            releve_name = releve_name,
-                            releve_id = releve_id,
-                            observation_id = observation_id,
-                            true_taxon_id = true_taxon_id
-                            )
+                    future = dispatcher.submit(
+                        current_request[4], self._send_request,
+                        current_request, request_kwargs
+                        )
                     
-                    ### Add response dict to results
-                    if releve_name not in self.results.keys():
-                        self.results[releve_name] = {}
+                    futures[future] = current_request
+            
+            except:
+                abort(dispatcher)
+            
+            with pb(len(request_list), bar = "smooth") as bar:
+                for future in cf.as_completed(futures):
+                    try:
+                        response = future.result()
                     
-                    if observation_id not in self.results[releve_name].keys():
-                        self.results[releve_name][observation_id] = {}
+                    except:
+                        abort(dispatcher)
                     
-                    if image not in self.results[releve_name][observation_id] \
-                        .keys():
-                        self.results[releve_name][observation_id][image] = {}
+                    nbytes = self._store_result(futures[future], response)
+                    handled.add(future)
                     
-                    if cv_model not in \
-                        self.results[releve_name][observation_id][image] \
-                            .keys():
-                            self.results[releve_name][observation_id][image] \
-                                [cv_model] = {}
+                    if checkpoints and cp_policy.update(nbytes):
+                        self._checkpoint(writer = cp_writer)
                     
-                    else:
-                        mssg = "Response for releve {0}, observation {1}, " + \
-                            "image {2}, and CV model {3} already exists an" + \
-                                "d will be updated."
-                        
-                        Warning(mssg.format(
-                            releve_name, observation_id, image, cv_model
-                            ))
+                    bar()
+    
+    def _schedule(self, request_list, cp_writer = None):
+        '''
+        Yield the requests of a batch in list order, but skip ahead to
+        requests for other CV models while a model is rate limited or its API
+        quota is exhausted (see quota.py). The process only waits if all
+        remaining requests target throttled models.
+        
+        Parameters
+        ----------
+        request_list : list
+            Requests as returned by .pending.
+        cp_writer : checkpoint.CheckpointWriter, optional
+            Background thread that writes the checkpoints. The default is
+            None.
+        
+        Yields
+        ------
+        list
+            Next request.
+        
+        Raises
+        ------
+        quota.QuotaExhausted
+            All remaining requests target CV models whose quota is exhausted
+            with an unknown reset time (a checkpoint is saved first).
+        '''
+        queues = {}
+        
+        for n, current_request in enumerate(request_list):
+            queues.setdefault(current_request[4], deque()).append(
+                (n, current_request)
+                )
+        
+        while len(queues) > 0:
+            waits = {}
+            
+            ### Try the model with the earliest pending request first
+            for cv_model in sorted(queues, key = lambda m: queues[m][0][0]):
+                wait = quota.LIMITER.reserve(cv_model)
+                
+                if wait <= 0:
+                    break
+                
+                waits[cv_model] = wait
+            
+            else:
+                wait = min(waits.values())
+                
+                ### Stop if no quota is left and the reset time is unknown
+                if math.isinf(wait):
+                    self._checkpoint(writer = cp_writer)
                     
-                    ### Update response dict
-                    self.results[releve_name][observation_id][image][
-                        cv_model].update(response)
+                    mssg = "All remaining requests target CV models with " + \
+                        "exhausted API quotas ({0}) and unknown reset times."
                     
-                    ### If only testing one CV model, wait for 1 s between
-                    ### API requests
-                    if len(set(self.single + self.multi)) == 1:
-                        time.sleep(1)
+                    raise quota.QuotaExhausted(
+                        mssg.format(", ".join(waits.keys()))
+                        )
+                
+                if wait > 60:
+                    mssg = "All remaining requests target CV models with " + \
+                        "exhausted API quotas ({0}). Waiting for {1}."
                     
-                except:
-                    self._checkpoint("at_last_exception")
+                    print(mssg.format(", ".join(waits.keys()),
+                                      timedelta(seconds = round(wait))))
                     
-                    mssg = "Stumbled upon warning. Check API quotas."
-                    raise Exception(mssg)
+                    self._checkpoint(writer = cp_writer)
                 
-                self.finished_releves.append(releve_name)
+                time.sleep(wait)
                 
-                # Save as checkpoint to reduce data loss in case of error
-                if checkpoints and i > 0:
-                    if cp_freq % i == 0:
-                        self._checkpoint()
+                continue
+            
+            n, current_request = queues[cv_model].popleft()
+            
+            if len(queues[cv_model]) == 0:
+                del queues[cv_model]
+            
+            yield current_request
+    
+    def _request_kwargs(self, current_request, selections):
+        '''
+        Collect the arguments of a single- or multi-image request from the
+        observation metadata.
+        
+        Parameters
+        ----------
+        current_request : list
+            Request as returned by .pending.
+        selections : dict
+            Image selections of multi-image requests by (releve name,
+            observation ID) for the current batch. New selections are added.
+        
+        Raises
+        ------
+        Warning
+            Observation metadata incomplete.
+        
+        Returns
+        -------
+        dict
+            Keyword arguments for .single_image_request or
+            .multi_image_request.
+        '''
+        releve_name, observation_id, image, p, cv_model = current_request
+        
+        ## Extract current releve id based on releve name
+        releve_id = self._releve_dict_static[releve_name]
+        observation = self._image_meta_static[observation_id]
+        
+        try:
+            image_files = observation["file_locations"]
+            true_taxon_id = observation["taxon_id"]
+            date = observation["date"]
+            coordinates = (observation["y"], observation["x"])
+            img_types = observation["img_types"]
+        
+        except:
+            self.errors.append({
+                "releve_name" : releve_name,
+                "releve_id" : releve_id,
+                "obs_id" : observation_id,
+                "error_type" : "Failed to read metadata tag."
+                })
+            
+            mssg = "Failed to read observation information for" + \
+                " observation {0} in releve {1} (releve_id = {2})."
+            
+            raise Warning(
+                mssg.format(observation_id, releve_name, releve_id)
+                )
+        
+        request_kwargs = {
+            "cv_model" : cv_model,
+            "coordinates" : coordinates,
+            "date" : date,
+            "releve_name" : releve_name,
+            "releve_id" : releve_id,
+            "observation_id" : observation_id,
+            "true_taxon_id" : true_taxon_id
+            }
+        
+        if image != "multi":
+            request_kwargs.update({"image_path" : image, "organ" : p})
+        
+        else:
+            key = (releve_name, observation_id)
+            
+            if key not in selections:
+                selections[key] = self._select_images(
+                    releve_name, observation_id, image_files, img_types
+                    )
+            
+            image_selection, organs = selections[key]
+            
+            request_kwargs.update({
+                "image_paths" : image_selection, "organs" : organs
+                })
+        
+        return request_kwargs
+    
+    def _select_images(self, releve_name, observation_id, image_files,
+                       img_types):
+        '''
+        Select the images for a multi-image request.
+        
+        Returns
+        -------
+        image_selection : list of str
+            Image file paths.
+        organs : list of str
+            Plant organ keys of the selected images.
+        '''
+        ### Find existing multi-image request for the same
+        ### observation to use the same image combination.
+        ### Else, select new (stratified) random images.
+        try:
+            parent_dict = self \
+                .results[releve_name][observation_id]["multi"]
+            
+            response_0 = parent_dict[list(
+                parent_dict.keys()
+                )[0]]
+            
+            image_selection = response_0["image_files"] \
+                .split(";")
+            organs = response_0["plant_organ"].split(";")
+        
+        except:
+            ### Select 5 images in case more were provided
+            ### To this end, first get the first element for
+            ### each individual plant organ category.
+            indices = [img_types.index(t) for t in set(
+                img_types
+                )]
+            
+            ### Remove the selected images from the list of
+            ### remaining images
+            remaining = list(range(len(image_files)))
+            
+            for i in indices:
+                remaining.remove(i)
+            
+            ### Fill up remaining places with random images
+            if len(remaining) > 0:
+                n_additional = min(
+                    len(remaining), NSAMPLES - len(indices)
+                    )
                 
-                ### Increase progress bar
-                bar()
+                indices += random.sample(
+                    remaining, k = n_additional
+                    )
+            
+            indices.sort()
+            
+            ### Select subset from photo list
+            #### Select random images
+            image_selection = [image_files[i] for i in indices]
+            organs = [img_types[i] for i in indices]
+        
+        return image_selection, organs
+    
+    def _payload_size(self, cv_model):
+        '''
+        Get the maximum image size of CV models that receive preprocessed
+        (resized and re-encoded) images.
+        
+        Returns
+        -------
+        int
+            Maximum image size in pixels (None if the CV model receives the
+            image files).
+        '''
+        if cv_model == "florid" and not florid.LOCAL:
+            return florid.IMG_MAXSIZE
+        
+        return None
+    
+    def _prefetch(self, request_list):
+        '''
+        Start preprocessing the images of the requests in a process pool.
+        The images are prepared in request order, a fixed number of images
+        ahead of the request being sent (see payloadcache.Prefetcher).
+        
+        Parameters
+        ----------
+        request_list : list
+            Requests as returned by .pending.
+        
+        Returns
+        -------
+        payloadcache.Prefetcher
+            Prefetcher (None if no request needs preprocessed images).
+        '''
+        jobs = []
+        
+        for releve_name, observation_id, image, p, cv_model in request_list:
+            max_size = self._payload_size(cv_model)
+            
+            if max_size is None:
+                continue
+            
+            if image != "multi":
+                paths = [image]
+            
+            else:
+                ## The images are selected when the request is sent
+                paths = self._image_meta_static[observation_id].get(
+                    "file_locations", []
+                    )
+            
+            jobs += [(path, max_size) for path in paths]
+        
+        if len(jobs) == 0:
+            return None
+        
+        prefetcher = payloadcache.Prefetcher()
+        
+        for path, max_size in jobs:
+            prefetcher.submit(path, max_size)
+        
+        return prefetcher
+    
+    def _send_request(self, current_request, request_kwargs):
+        '''
+        Send a single- or multi-image request.
+        
+        Returns
+        -------
+        dict
+            Result dictionary (see .single_image_request).
+        '''
+        prefetcher = getattr(self, "_prefetcher", None)
+        max_size = self._payload_size(current_request[4])
+        
+        if prefetcher is not None and max_size is not None:
+            paths = request_kwargs.get("image_paths") or \
+                [request_kwargs["image_path"]]
+            
+            for path in paths:
+                prefetcher.claim(path, max_size)
+        
+        if current_request[2] != "multi":
+            return self.single_image_request(**request_kwargs)
+        
+        else:
+            return self.multi_image_request(**request_kwargs)
+    
+    def _store_result(self, current_request, response):
+        '''
+        Add a response to self.results and remove the request from the
+        pending request index.
+        
+        Returns
+        -------
+        int
+            Size of the journal record (bytes).
+        '''
+        releve_name, observation_id, image, p, cv_model = current_request
+        
+        with self._results_lock:
+            nbytes = self._add_result(current_request, response)
+        
+        self._mark_completed(current_request)
+        self.finished_releves.append(releve_name)
+        
+        return nbytes
+    
+    def _add_result(self, current_request, response):
+        ## Add a response to self.results and journal it (see ._store_result)
+        releve_name, observation_id, image, p, cv_model = current_request
+        
+        ### Add response dict to results
+        if releve_name not in self.results.keys():
+            self.results[releve_name] = {}
+        
+        if observation_id not in self.results[releve_name].keys():
+            self.results[releve_name][observation_id] = {}
+        
+        if image not in self.results[releve_name][observation_id] \
+            .keys():
+            self.results[releve_name][observation_id][image] = {}
+        
+        if cv_model not in \
+            self.results[releve_name][observation_id][image] \
+                .keys():
+                self.results[releve_name][observation_id][image] \
+                    [cv_model] = {}
+        
+        else:
+            mssg = "Response for releve {0}, observation {1}, " + \
+                "image {2}, and CV model {3} already exists an" + \
+                    "d will be updated."
+            
+            Warning(mssg.format(
+                releve_name, observation_id, image, cv_model
+                ))
+        
+        ### Update response dict
+        self.results[releve_name][observation_id][image][
+            cv_model].update(response)
+        
+        return self._journal.put(
+            (releve_name, observation_id, image, cv_model),
+            self.results[releve_name][observation_id][image][cv_model]
+            )
     
     def path_out(self, name, *subdirs):
         '''
@@ -753,7 +1334,8 @@ class Batchrequest():
                models_multi = [],
                releve_names = [],
                observations = [],
-               checkpoints = True, cp_freq = 10
+               checkpoints = True, cp_freq = 10,
+               concurrent = False
                ):
         '''
         Repeat API requests for certain models, releves, or observations.
@@ -777,6 +1359,9 @@ class Batchrequest():
         cp_freq : int, optional
             Frequency (in API requests) at which checkpoints are saved if
             "checkpoint" is set to True. The default is 10.
+        concurrent : bool, optional
+            Send requests to the different CV models in parallel. The default
+            is False.
         
         Returns
         -------
@@ -805,31 +1390,22 @@ class Batchrequest():
         releve_ids = [self._releve_dict_static[releve_name] for releve_name \
                       in releve_names]
         
-        for observation in self._image_meta_static.values():
-            releve_id = observation["releve_id"]
+        grouped = self._observations_by_releve()
+        selected = [o for releve_id in releve_ids for o in \
+                    grouped.get(releve_id, [])]
+        selected_ids = set(o["obs_id"] for o in selected)
+        selected += [self._image_meta_static[o] for o in observations if \
+                     o in self._image_meta_static and o not in selected_ids]
+        
+        for observation in selected:
+            releve_name = self._releve_dict_static_inv[
+                observation["releve_id"]
+                ]
             
-            if releve_id in releve_ids or observation["obs_id"] in observations:
-                releve_name = self._releve_dict_static_inv[releve_id]
-                observation_id = observation["obs_id"]
-                image_dict_vals = self._get_image_dict(observation_id).values()
-                paths = [x["disc_location"] for x in image_dict_vals]
-                parts = [x["organ"] for x in image_dict_vals]
-                
-                for cv_model, mode, part in zip(
-                        models_single * len(paths) + models_multi,
-                        [p for p in paths for q in range(
-                            len(models_single)
-                            )] + ["multi"] * len(models_multi),
-                        [p for p in parts for q in range(
-                            len(models_single)
-                            )] + ["multi"] * len(models_multi)
-                        ):
-                    
-                    p = "multi" if mode == "multi" else part
-                    
-                    repeat.append([
-                        releve_name, observation_id, mode, p, cv_model
-                         ])
+            repeat += [list(r) for r in self._observation_requests(
+                releve_name, observation["obs_id"], models_single,
+                models_multi
+                )]
         
         self.to_repeat = sorted(repeat, key = lambda x: x[0])
         N = len(self.to_repeat)
@@ -837,7 +1413,7 @@ class Batchrequest():
         print(f"Found {N} requests to repeat.")
         
         self.run_batch(checkpoints = checkpoints, cp_freq = cp_freq,
-                       repeat = True)
+                       repeat = True, concurrent = concurrent)
     
     def delete(self,
                releves = [],
@@ -866,9 +1442,15 @@ class Batchrequest():
         observations = self._list_input(observations)
         cv_models = self._list_input(cv_models)
         
+        ## Keep track of changes to update the pending request index
+        changed = {}
+        
         for releve in releves:
+            changed[releve] = None
+            
             try:
                 del self.results[releve]
+                self._journal.delete((releve,))
             except:
                 pass
             
@@ -888,6 +1470,10 @@ class Batchrequest():
                 for key in list(keys):
                     if key in observations:
                         del self.results[releve_name][key]
+                        self._journal.delete((releve_name, key))
+                        
+                        if changed.get(releve_name, set()) is not None:
+                            changed.setdefault(releve_name, set()).add(key)
         
         if len(cv_models) > 0:
             for releve_name in list(self.results.keys()):
@@ -900,6 +1486,20 @@ class Batchrequest():
                             if cv_model in cv_models:
                                 del self.results[releve_name][observation_id][
                                     image][cv_model]
+                                self._journal.delete(
+                                    (releve_name, observation_id, image,
+                                     cv_model)
+                                    )
+                                
+                                if changed.get(releve_name, set()) is not None:
+                                    changed.setdefault(
+                                        releve_name, set()
+                                        ).add(observation_id)
+        
+        if getattr(self, "_pending_index", None) is not None:
+            for releve_name, observation_ids in changed.items():
+                if releve_name in self.total_releve_names:
+                    self._index_pending([releve_name], observation_ids)
     
     def _standard_task(self, image_path, coordinates, date, organs, cv_model,
                       return_n = NTOP, batch = None, req_id = None):
@@ -944,16 +1544,12 @@ class Batchrequest():
         -----
         This was a standalone function in the first verion. I made it a method
         in order to be able to access "self" and save checkpoints when running
-        out of free API requests.
+        out of free API requests. (API quotas are now handled in quota.py.)
         '''
         if cv_model == "plantnet":
             try:
                 response = plantnet.post_image(image_path, organs = organs)
                 ids = plantnet.species_ranking(response, n = return_n)
-                
-                remaining_requests = int(
-                    response["remainingIdentificationRequests"]
-                    )
             
             except KeyError:
                 ### PlantNet API responses are not consistent. We try two times
@@ -961,32 +1557,11 @@ class Batchrequest():
                 print("API response format invalid. Repeating request...")
                 response = plantnet.post_image(image_path, organs = organs)
                 ids = plantnet.species_ranking(response, n = return_n)
-                
-                remaining_requests = int(
-                    response["remainingIdentificationRequests"]
-                    )
             
             ## Since PlantNet only allows 500 IDs on the base subscription
-            ## (without additional payment or exception status), we wait for
-            ## 24 hrs in case the quota is reached
-            if remaining_requests <= 0:
-                mssg = "Daily PlantNet API quota reached. I will sleep for" + \
-                    " %s hours, %s minutes, and %s seconds to continue " + \
-                        "the batch at midnight."
-                
-                now = datetime.now()
-                tomorrow = now + timedelta(days = 1)
-                midnight = datetime(
-                    tomorrow.year, tomorrow.month, tomorrow.day, 0, 0, 0, 0
-                    )
-                
-                d = midnight - now
-                
-                print(mssg % tuple(str(d).split(":")))
-                
-                self._checkpoint()
-                
-                time.sleep(d.total_seconds())
+            ## (without additional payment or exception status), PlantNet
+            ## requests are paused until midnight once the quota is reached
+            ## (see quota.py). Requests to the other CV models continue.
         
         elif cv_model == "inaturalist":
             response = inaturalistcv.post_image(image_path, coordinates)
@@ -1069,6 +1644,9 @@ class Batchrequest():
                         .update(updates)
             else:
                 raise Exception("Missing arguments. Entry cannot be located.")
+        
+        self._pending_index = None
+        self._journal_stale = True
     
     def _update_fixed_taxon_ids(self):
         self.update_image_dicts()
@@ -1091,6 +1669,9 @@ class Batchrequest():
                             
                             N += 1
         print(f"Replaced true taxon IDs in {N} responses.")
+        
+        if N > 0:
+            self._journal_stale = True
     
     def _update_fixed_plant_organs(self):
         self.update_image_dicts()
@@ -1177,6 +1758,9 @@ class Batchrequest():
         
         print(f"Changed file locations and plant organ keys for {N} results.")
         
+        if N > 0:
+            self._journal_stale = True
+        
         return
     
     def _cleanup_duplicates(self):
@@ -1241,6 +1825,12 @@ class Batchrequest():
             f"Resolved {N} duplicate dictionary entries.\n" +
             f"Normalized {M} dictionary keys."
             )
+        
+        ## Image keys may have changed
+        self._pending_index = None
+        
+        if N > 0 or M > 0:
+            self._journal_stale = True
     
     def _get_image_dict(self, observation_id):
         '''
@@ -1260,31 +1850,7 @@ class Batchrequest():
             dictionaries containing disc location (key "disc_location") as well
             as depicted plant part (key "organ") for each image.
         '''
-        image_files = self._image_meta[observation_id]["file_locations"]
-        image_files = [# Added this to ensure that the image files are found in the correct directory after moving around files.
-            os.path.join(
-                self.image_dir,
-                os.path.basename(os.path.dirname(os.path.dirname(imf))),
-                os.path.basename(os.path.dirname(imf)),
-                os.path.basename(imf)
-                ) for imf in image_files
-            ]
-        image_names = [
-            os.path.splitext(
-                os.path.split(p.replace("\\", "/"))[-1]
-                )[0] for p in image_files
-            ]
-        
-        image_types = self._image_meta[observation_id]["img_types"]
-        
-        details = [{"disc_location" : p, "organ" : o} for p, o in \
-                   zip(image_files, image_types)]
-        
-        out_dict = {
-            key : value for key, value in zip(image_names, details)
-            }
-        
-        return out_dict
+        return self._meta_store.image_dict(observation_id)
     
     def _list_input(self, value):
         '''
@@ -1305,60 +1871,148 @@ class Batchrequest():
         
         return value
     
-    def _checkpoint(self, name = "cpt.save"):
+    def _dump(self, obj, path):
+        '''
+        Pickle an object to a temporary file and move it into place, so that
+        an interrupted write does not corrupt an existing file.
+        
+        Returns
+        -------
+        None.
+        '''
+        tmp = path + ".tmp"
+        
+        with open(tmp, "wb") as f:
+            pk.dump(obj, f)
+        
+        os.replace(tmp, path)
+    
+    def _checkpoint(self, name = "cpt.save", writer = None):
         '''
-        Create checkpoint of current instance.
+        Create checkpoint of current instance. The results are not part of
+        the checkpoint; they are restored from the results journal (see
+        journal.py) by .load_checkpoint.
+        
+        Parameters
+        ----------
+        name : str, optional
+            File name. The default is "cpt.save".
+        writer : checkpoint.CheckpointWriter, optional
+            Write the checkpoint in the background thread of the writer. The
+            default is None (write immediately).
         
         Returns
         -------
         None.
         '''
-        with open(self.path_out(name, "log"), "wb") as f:
-            pk.dump(self, f)
+        ## Results that were changed in place need to be journaled first
+        ## (done by the writer, see ._write_checkpoint)
+        rewrite = getattr(self, "_journal_stale", False)
+        
+        ## Snapshot of the current state. Containers are copied, since the
+        ## request loop continues while the snapshot is written. The pending
+        ## request index and the image metadata are rebuilt on loading.
+        state = {
+            k : v.copy() if isinstance(v, (list, dict, set)) else v \
+                for k, v in self.__getstate__().items()
+            }
+        state["results"] = {}
+        state["_journal_file"] = os.path.basename(self._journal.path)
+        
+        cpt = Batchrequest.__new__(Batchrequest)
+        cpt.__dict__.update(state)
+        
+        if writer is None:
+            self._write_checkpoint(cpt, name, rewrite)
+        
+        else:
+            writer.submit(self._write_checkpoint, cpt, name, rewrite)
+    
+    def _write_checkpoint(self, cpt, name, rewrite = False):
+        '''
+        Write a checkpoint snapshot and record the time it took.
+        
+        Parameters
+        ----------
+        cpt : Batchrequest
+            Snapshot of the instance (see ._checkpoint).
+        name : str
+            File name.
+        rewrite : bool, optional
+            Compact the results journal first, so that it contains the
+            results that were changed in place. The default is False.
+        
+        Returns
+        -------
+        None.
+        '''
+        t0 = time.perf_counter()
+        
+        if rewrite:
+            with self._results_lock:
+                self._journal.rewrite(self.results)
+                self._journal_stale = False
+        
+        self._dump(cpt, self.path_out(name, "log"))
+        duration = time.perf_counter() - t0
+        
+        if not hasattr(self, "checkpoint_log"):
+            self.checkpoint_log = []
         
-        print("Checkpoint saved.")
+        self.checkpoint_log.append({
+            "name" : name,
+            "time" : datetime.now(),
+            "duration" : duration
+            })
+        
+        print("Checkpoint saved ({0:.3f} s).".format(duration))
     
     def save(self):
         '''
-        Save current instance.
+        Save current instance (including all results).
         
         Returns
         -------
         None.
         '''
-        with open(self.path_out(self.name, "log"), "wb") as f:
-            pk.dump(self, f)
+        self._dump(self, self.path_out(self.name, "log"))
         
         print("Output saved at {0}.".format(
             str(self.path_out(self.name, "log"))
             )
             )
     
-    def to_df(self):
+    def results_table(self):
+        '''
+        Return the results as a columnar table (see resultstable.py).
+        
+        Returns
+        -------
+        resultstable.ResultsTable
+            Typed table of results and the separately stored full API
+            responses.
+        '''
+        return resultstable.ResultsTable.from_results(self.results)
+    
+    def to_df(self, json_ref = False):
         '''
         Return the results as a pandas.DataFrame.
         
+        Parameters
+        ----------
+        json_ref : bool, optional
+            Keep the column "json_ref" (reference to the full API response,
+            see .results_table). The default is False.
+        
         Returns
         -------
         out : pandas.DataFrame
             Dataframe containing the API responses.
         '''
-        results_list = []
-        
-        for releve in self.results.values():
-            for observation in releve.values():
-                for image in observation.values():
-                    results_list += [result for result in image.values()]
-        
-        df = pd.DataFrame(results_list)
-        
-        colnames = ["first", "second", "third", "forth", "fifth"]
-        taxa = pd.DataFrame(df["taxon_suggestions"].to_list(),
-                            columns = colnames)
-        
-        main = df[list(df.columns[:df.columns.get_loc("taxon_suggestions")])]
+        out = self.results_table().df
         
-        out = pd.concat([main, taxa], axis = 1)
+        if not json_ref:
+            out = out.drop(columns = "json_ref")
         
         return out
     
@@ -1393,7 +2047,10 @@ class Batchrequest():
                 name = "at_last_exception" if from_error else "cpt.save"
             
             else:
-                cpt_names = os.listdir(self.path_out("log"))
+                cpt_names = [
+                    n for n in os.listdir(self.path_out("log")) if not \
+                        n.endswith((journal.EXTENSION, ".tmp"))
+                    ]
                 cpt_dirs = [self.path_out(n, "log") for n in cpt_names]
                 
                 name = os.path.split(max(cpt_dirs, key = os.path.getmtime))[1]
@@ -1404,8 +2061,33 @@ class Batchrequest():
             br_cpt = pk.load(f)
         
         if int(br_cpt.version[0]) == 2:
+            if getattr(self, "_journal_obj", None) is not None:
+                self._journal_obj.close()
+            
             self.__dict__.update(br_cpt.__dict__)
             self.out_dir = current_out_dir
+            self._journal_obj = None
+            
+            ## Reload the image metadata snapshot (see STATICMETA), since the
+            ## image directory may have changed
+            for key in STATICMETA:
+                self.__dict__.pop(key, None)
+            
+            ## Rebuild the pending request index from the loaded results
+            self._pending_index = None
+            self._releve_observations = None
+            
+            journal_file = self.__dict__.pop("_journal_file", None)
+            
+            if journal_file is not None:
+                ## Checkpoint: Restore the results from the journal, including
+                ## results journaled after the checkpoint was written
+                self.results = self._journal.replay()
+                self._journal_stale = False
+            
+            else:
+                ## Complete Batchrequest file: Start a new journal from it
+                self._journal_stale = True
         
         else:
             mssg = "Incompatible Batchrequest version {0} of loaded file."
@@ -1424,7 +2106,7 @@ if __name__ == "__main__":
         
         # For old BR file versions: Get releve names
         if BR.total_releve_names == []:
-            BR.total_releve_names = list(BR.results.keys())
+            BR.add_releves(list(BR.results.keys()))
         
         print(f"Repeating requests for the following API(s): {REPEAT}.")
         REPEATMULTI = [r for r in REPEAT if r in MULTIIMG]
@@ -1435,7 +2117,8 @@ if __name__ == "__main__":
             BR._update_fixed_plant_organs()
         
         BR.repeat(models_single = REPEAT,
-                  models_multi = REPEATMULTI
+                  models_multi = REPEATMULTI,
+                  concurrent = CONCURRENT
                   )
     
     elif FROMCPT:
@@ -1453,7 +2136,7 @@ if __name__ == "__main__":
             BR._update_fixed_plant_organs()
         
         else:
-            BR.run_batch()
+            BR.run_batch(concurrent = CONCURRENT)
     
     elif FLORINC is not None:
         BR.load_checkpoint(file = FLORINC)
@@ -1506,39 +2189,43 @@ if __name__ == "__main__":
     
     else:
         BR.add_releves(releve_name_list = RELEVENAMES)
-        BR.run_batch()
+        BR.run_batch(concurrent = CONCURRENT)
     
     BR.save()
     
-    # Export data as Excel sheet
-    df = BR.to_df()
+    # Export data
+    table = BR.results_table()
+    df = table.df
     
     ## Add species names (using the Info Flora taxonomic backbone)
     SD = base.SpeciesDecoder("comeco_local")
     
-    df["true_taxon_name"] = [SD.decode(tid) for tid in df["true_taxon_id"]]
+    df["true_taxon_name"] = SD.decode_many(df["true_taxon_id"])
     
     ## Drop duplicates from dataframe
-    df = df.drop_duplicates(
+    table.df = df.drop_duplicates(
         subset = [
             "releve_name", "observation_id", "true_taxon_id", "plant_organ",
             "image_files", "cv_model"
                 ], keep = "last"
         )
     
-    ## Save to Excel file
-    if os.path.isfile(BR.path_out("Responses.xlsx")):
-        with pd.ExcelWriter(BR.path_out("Responses.xlsx"), mode = "a",
-                            if_sheet_exists = "replace") as writer:
-            df.to_excel(writer, sheet_name = BR.name, index = False)
-        print(
-            "Wrote sheet to Excel table " + BR.path_out("Responses.xlsx") + "."
-            )
+    ## Save columnar table (full API responses are written to a separate
+    ## file and referenced by the column json_ref)
+    try:
+        out = table.write(BR.path_out(BR.name, "responses"),
+                          fmt = EXPORTFORMAT)
     
-    else:
-        df.to_excel(BR.path_out("Responses.xlsx"), sheet_name = BR.name,
-                    index = False)
-        print("Created Excel table at " + BR.path_out("Responses.xlsx") + ".")
+    except ImportError:
+        print(f"Missing dependency for {EXPORTFORMAT} export (pyarrow). " + \
+              "Using pickle instead.")
+        out = table.write(BR.path_out(BR.name, "responses"), fmt = "pickle")
+    
+    print("Exported response table to " + out + ".")
+    
+    ## Save to Excel file (optional)
+    if EXCEL:
+        table.write_excel(BR.path_out("Responses.xlsx"), BR.name)
     
     # Shutdown system if shutdown flag was set
     if args.shutdown:
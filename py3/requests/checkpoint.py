@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:08:36 2026
+
+Checkpoint scheduling for batch requests: a policy that decides when a
+checkpoint is due and a background thread that writes the checkpoints.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 15:08:36 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import time, threading
+
+#-----------------------------------------------------------------------------|
+# Classes
+class CheckpointPolicy():
+    def __init__(self, every_n = 10, every_seconds = None, every_bytes = None):
+        '''
+        Decide when a checkpoint is due. A checkpoint is due as soon as any
+        of the set limits is reached since the last checkpoint.
+        
+        Parameters
+        ----------
+        every_n : int, optional
+            Number of completed requests. The default is 10.
+        every_seconds : float, optional
+            Time (s). The default is None (no time limit).
+        every_bytes : int, optional
+            Amount of new result data (bytes written to the results journal).
+            The default is None (no size limit).
+        
+        Returns
+        -------
+        None.
+        '''
+        self.every_n = every_n
+        self.every_seconds = every_seconds
+        self.every_bytes = every_bytes
+        self.reset()
+    
+    def reset(self):
+        '''
+        Start counting from zero (after a checkpoint was saved).
+        
+        Returns
+        -------
+        None.
+        '''
+        self.n = 0
+        self.nbytes = 0
+        self.t_last = time.monotonic()
+    
+    def update(self, nbytes = 0):
+        '''
+        Register a completed request.
+        
+        Parameters
+        ----------
+        nbytes : int, optional
+            Size of the new result. The default is 0.
+        
+        Returns
+        -------
+        due : bool
+            True if a checkpoint is due. The counters are reset in this case.
+        '''
+        self.n += 1
+        self.nbytes += nbytes
+        
+        due = (self.every_n is not None and self.n >= self.every_n) or \
+            (self.every_seconds is not None and \
+             time.monotonic() - self.t_last >= self.every_seconds) or \
+                (self.every_bytes is not None and \
+                 self.nbytes >= self.every_bytes)
+        
+        if due:
+            self.reset()
+        
+        return due
+
+class CheckpointWriter():
+    def __init__(self):
+        '''
+        Write checkpoints in a background thread, so that the request loop
+        does not wait for the disk. Only the latest submitted checkpoint is
+        kept if the previous one is still being written.
+        
+        Returns
+        -------
+        None.
+        '''
+        self._task = None
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target = self._work, name = "checkpoint", daemon = True
+            )
+        self._thread.start()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def submit(self, fn, *args, **kwargs):
+        '''
+        Queue a checkpoint write. A queued write that has not started yet is
+        replaced.
+        
+        Parameters
+        ----------
+        fn : callable
+            Function that writes the checkpoint.
+        *args, **kwargs
+            Arguments passed to fn.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._cond:
+            self._task = (fn, args, kwargs)
+            self._cond.notify_all()
+    
+    def wait(self):
+        '''
+        Block until all queued checkpoints are written.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._cond:
+            while self._task is not None or self._busy:
+                self._cond.wait()
+    
+    def close(self):
+        '''
+        Write the queued checkpoint and stop the background thread.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        
+        self._thread.join()
+    
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._task is None and not self._closed:
+                    self._cond.wait()
+                
+                if self._task is None:
+                    return
+                
+                fn, args, kwargs = self._task
+                self._task = None
+                self._busy = True
+            
+            try:
+                fn(*args, **kwargs)
+            
+            except Exception as e:
+                print("Failed to save checkpoint: {0}".format(e))
+            
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
@@ -21,7 +21,7 @@ __status__ = "Development"
 import os
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 
-import base
+import base, httppool, payloadcache, exifindex
 import requests
 
 #-----------------------------------------------------------------------------|
@@ -59,7 +59,7 @@ def post_image(image_files,
     file = files[0]
     
     if coords is None:
-        coords = base.get_coords(file)
+        coords = exifindex.get_coords(file)
         lat, lon = coords["lat"], coords["lon"]
     else:
         [lat, lon] = coords
@@ -67,10 +67,13 @@ def post_image(image_files,
     lat = base.dms_to_dec(lat) if isinstance(lat, tuple) else lat
     lon = base.dms_to_dec(lon) if isinstance(lon, tuple) else lon
     
-    date_time = base.get_creation_time(file) if date is None else date
+    date_time = exifindex.get_creation_time(file) if date is None else date
     
     img = {
-      "images": [base.image_to_b64(f, max_size = IMG_MAXSIZE) for f in files],
+      "images": [
+          payloadcache.image_crop_to_b64(f, max_size = IMG_MAXSIZE) \
+              for f in files
+          ],
       "lat" : lat,
       "lon" : lon,
       "date" : str(date_time.date()),
@@ -80,7 +83,7 @@ def post_image(image_files,
     
     POSTURL = "http://127.0.0.1:8000/identify/images"# "https://florid.infoflora.ch/api/v1/openapi/identify/images"
     
-    response = requests.post(POSTURL, json = img)
+    response = httppool.get_session("comeco").post(POSTURL, json = img)
     
     return response
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:44 2026
+
+Dispatch API requests concurrently with one worker queue per CV model
+provider.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 09:12:44 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import quota
+
+#-----------------------------------------------------------------------------|
+# Settings
+## Number of parallel requests per provider. (Request rates and API quotas
+## are handled in quota.py.)
+PROVIDERS = {
+    "plantnet" : {"max_workers" : 2},
+    "inaturalist" : {"max_workers" : 2},
+    "florid" : {"max_workers" : 4},
+    "floraincognita" : {"max_workers" : 1},
+    "infoflora" : {"max_workers" : 8}
+    }
+
+DEFAULT = {"max_workers" : 1}
+
+#-----------------------------------------------------------------------------|
+# Classes
+class Dispatcher():
+    def __init__(self, providers = PROVIDERS, limiter = quota.LIMITER):
+        '''
+        Run tasks in separate thread pools per provider, so that a slow
+        provider does not block the others.
+        
+        Parameters
+        ----------
+        providers : dict, optional
+            Settings ("max_workers") per provider. Providers not listed use
+            DEFAULT. The default is PROVIDERS.
+        limiter : quota.RateLimiter, optional
+            Rate limiter that each worker consults before a task is run. The
+            default is quota.LIMITER.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.providers = providers
+        self.limiter = limiter
+        self._pools = {}
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(cancel = exc_type is not None)
+    
+    def settings(self, provider):
+        settings = DEFAULT.copy()
+        settings.update(self.providers.get(provider, {}))
+        
+        return settings
+    
+    def submit(self, provider, fn, *args, **kwargs):
+        '''
+        Queue a task for a provider.
+        
+        Parameters
+        ----------
+        provider : str
+            Provider (CV model) key.
+        fn : callable
+            Task to run.
+        *args, **kwargs
+            Arguments passed to fn.
+        
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the task result.
+        '''
+        with self._lock:
+            if provider not in self._pools:
+                settings = self.settings(provider)
+                
+                self._pools[provider] = ThreadPoolExecutor(
+                    max_workers = settings["max_workers"],
+                    thread_name_prefix = provider
+                    )
+            
+            pool = self._pools[provider]
+        
+        return pool.submit(self._run, provider, fn, *args, **kwargs)
+    
+    def shutdown(self, wait = True, cancel = False):
+        '''
+        Shut down all worker pools.
+        
+        Parameters
+        ----------
+        wait : bool, optional
+            Wait for running tasks to finish. The default is True.
+        cancel : bool, optional
+            Cancel queued tasks that have not started yet. The default is
+            False.
+        
+        Returns
+        -------
+        None.
+        '''
+        for pool in self._pools.values():
+            pool.shutdown(wait = wait, cancel_futures = cancel)
+    
+    def _run(self, provider, fn, *args, **kwargs):
+        ## Only the workers of this provider wait if it is throttled
+        self.limiter.acquire(provider)
+        
+        return fn(*args, **kwargs)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:02:37 2026
+
+Bulk Exif extraction (coordinates and creation time) for image directories.
+Only the APP1 (Exif) segment of each JPEG is read, and the results are kept
+in a sidecar index file per directory tree.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 18:02:37 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, json, struct, atexit, datetime, threading, piexif
+from dateutil import parser
+from warnings import warn
+
+import base
+
+#-----------------------------------------------------------------------------|
+# Settings
+SIDECAR = ".exif_index.json"
+EXTENSIONS = (".jpg", ".jpeg")
+
+## Loaded indices by root directory (see get_index)
+_INDICES = {}
+_LOCK = threading.Lock()
+
+#-----------------------------------------------------------------------------|
+# Functions
+def read_app1(path):
+    '''
+    Read the Exif (APP1) segment of a JPEG file without reading the image
+    data.
+    
+    Parameters
+    ----------
+    path : str
+        Full path to image file.
+    
+    Returns
+    -------
+    bytes
+        Segment content starting with b"Exif" (None if the file has no Exif
+        segment or is not a JPEG).
+    '''
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        
+        while True:
+            header = f.read(4)
+            
+            if len(header) < 4 or header[0] != 0xFF:
+                return None
+            
+            marker = header[1]
+            length = struct.unpack(">H", header[2:])[0]
+            
+            ## Start of scan: no Exif segment before the image data
+            if marker == 0xDA:
+                return None
+            
+            if marker == 0xE1:
+                data = f.read(length - 2)
+                
+                if data[:6] == b"Exif\x00\x00":
+                    return data
+            
+            else:
+                f.seek(length - 2, os.SEEK_CUR)
+
+def _rational(value):
+    return value[0] / value[1] if value[1] != 0 else 0.0
+
+def _decode(value):
+    return value.decode("utf8", errors = "ignore").strip("\x00 ") if \
+        isinstance(value, bytes) else value
+
+def parse_datetime(value):
+    '''
+    Parse an Exif date/time string ("YYYY:MM:DD HH:MM:SS" or any format
+    understood by dateutil).
+    
+    Returns
+    -------
+    datetime.datetime
+        Datetime object (None if the value cannot be parsed).
+    '''
+    value = _decode(value)
+    
+    if not value:
+        return None
+    
+    try:
+        return datetime.datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+    
+    except ValueError:
+        pass
+    
+    try:
+        return parser.parse(value)
+    
+    except (ValueError, OverflowError):
+        return None
+
+def extract(path):
+    '''
+    Extract coordinates and creation time from the Exif of an image.
+    
+    Parameters
+    ----------
+    path : str
+        Full path to image file.
+    
+    Returns
+    -------
+    dict
+        Latitude and longitude in decimal degrees ("lat", "lon") and creation
+        time in ISO format ("datetime"). Missing values are None.
+    '''
+    entry = {"lat" : None, "lon" : None, "datetime" : None}
+    
+    try:
+        app1 = read_app1(path)
+        exif_dict = piexif.load(app1) if app1 is not None else None
+    
+    except Exception:
+        exif_dict = None
+    
+    if exif_dict is None:
+        return entry
+    
+    gps = exif_dict.get("GPS", {})
+    
+    try:
+        lat = base.dms_to_dec(
+            [_rational(v) for v in gps[piexif.GPSIFD.GPSLatitude]]
+            )
+        lon = base.dms_to_dec(
+            [_rational(v) for v in gps[piexif.GPSIFD.GPSLongitude]]
+            )
+        
+        if _decode(gps.get(piexif.GPSIFD.GPSLatitudeRef)) == "S":
+            lat = -lat
+        
+        if _decode(gps.get(piexif.GPSIFD.GPSLongitudeRef)) == "W":
+            lon = -lon
+        
+        entry["lat"], entry["lon"] = lat, lon
+    
+    except (KeyError, TypeError, ValueError):
+        pass
+    
+    date_time = parse_datetime(
+        exif_dict.get("Exif", {}).get(piexif.ExifIFD.DateTimeOriginal)
+        )
+    
+    if date_time is not None:
+        entry["datetime"] = date_time.isoformat()
+    
+    return entry
+
+def get_index(root):
+    '''
+    Get the shared Exif index of a directory tree.
+    
+    Parameters
+    ----------
+    root : str
+        Root directory (e.g., the image collection or a releve/observation
+        directory).
+    
+    Returns
+    -------
+    ExifIndex
+        Exif index. The same instance is returned for repeated calls.
+    '''
+    key = os.path.normpath(os.path.abspath(root))
+    
+    with _LOCK:
+        if key not in _INDICES:
+            _INDICES[key] = ExifIndex(key)
+        
+        return _INDICES[key]
+
+def _index_for(path):
+    ## Use a loaded index that covers the file, else the file's directory
+    directory = os.path.dirname(os.path.abspath(path))
+    
+    with _LOCK:
+        parent = directory
+        
+        while True:
+            if parent in _INDICES:
+                return _INDICES[parent]
+            
+            upper = os.path.dirname(parent)
+            
+            if upper == parent:
+                break
+            
+            parent = upper
+    
+    index = get_index(directory)
+    
+    ## Index the whole observation directory at once
+    if not index.scanned:
+        index.scan()
+    
+    return index
+
+@atexit.register
+def save_all():
+    '''
+    Save all loaded indices (entries added by lookups).
+    
+    Returns
+    -------
+    None.
+    '''
+    with _LOCK:
+        indices = list(_INDICES.values())
+    
+    for index in indices:
+        index.save()
+
+def get_coords(path):
+    '''
+    Indexed version of base.get_coords.
+    
+    Returns
+    -------
+    dict
+        Dictionary containing latitude and longitude.
+    '''
+    entry = _index_for(path).get(path)
+    
+    return {"lat" : entry["lat"], "lon" : entry["lon"]}
+
+def get_creation_time(path):
+    '''
+    Indexed version of base.get_creation_time. Falls back to the file
+    creation time if the Exif contains no creation time.
+    
+    Returns
+    -------
+    datetime.datetime
+        Datetime object.
+    '''
+    entry = _index_for(path).get(path)
+    
+    if entry["datetime"] is not None:
+        return datetime.datetime.fromisoformat(entry["datetime"])
+    
+    return datetime.datetime.fromtimestamp(os.path.getctime(path))
+
+#-----------------------------------------------------------------------------|
+# Classes
+class ExifIndex():
+    def __init__(self, root):
+        '''
+        Exif index of the images in a directory tree, stored in a sidecar
+        file (SIDECAR) in the root directory. Entries are updated when the
+        size or modification time of an image changes.
+        
+        Parameters
+        ----------
+        root : str
+            Root directory.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.root = root
+        self.sidecar = os.path.join(root, SIDECAR)
+        self.entries = {}
+        self.scanned = False
+        self._changed = False
+        self._lock = threading.Lock()
+        
+        if os.path.isfile(self.sidecar):
+            try:
+                with open(self.sidecar, "r") as f:
+                    self.entries = json.load(f)
+            
+            except (OSError, ValueError):
+                self.entries = {}
+    
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root) \
+            .replace("\\", "/")
+    
+    def _update(self, path):
+        stat = os.stat(path)
+        key = self._key(path)
+        
+        with self._lock:
+            entry = self.entries.get(key)
+        
+        if entry is None or entry["size"] != stat.st_size or \
+            entry["mtime"] != stat.st_mtime:
+            entry = extract(path)
+            entry.update({"size" : stat.st_size, "mtime" : stat.st_mtime})
+            
+            with self._lock:
+                self.entries[key] = entry
+                self._changed = True
+        
+        return entry
+    
+    def scan(self):
+        '''
+        Read the Exif of all (new or changed) images in the directory tree
+        and save the index.
+        
+        Returns
+        -------
+        int
+            Number of indexed images.
+        '''
+        found = set()
+        
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.lower().endswith(EXTENSIONS):
+                    path = os.path.join(directory, name)
+                    self._update(path)
+                    found.add(self._key(path))
+        
+        with self._lock:
+            for key in set(self.entries) - found:
+                del self.entries[key]
+                self._changed = True
+        
+        self.scanned = True
+        self.save()
+        
+        return len(found)
+    
+    def get(self, path):
+        '''
+        Get the Exif entry of an image. Images that are not indexed yet are
+        added (the index is saved by .scan or .save).
+        
+        Parameters
+        ----------
+        path : str
+            Full path to image file.
+        
+        Returns
+        -------
+        dict
+            Index entry ("lat", "lon", "datetime", "size", "mtime").
+        '''
+        return self._update(path)
+    
+    def save(self):
+        '''
+        Write the index to the sidecar file if it has changed.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._lock:
+            if not self._changed:
+                return
+            
+            tmp = self.sidecar + ".tmp"
+            
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(self.entries, f)
+                
+                os.replace(tmp, self.sidecar)
+                self._changed = False
+            
+            except OSError:
+                warn(
+                    "Unable to write Exif index {0}.".format(self.sidecar)
+                    )
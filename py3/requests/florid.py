@@ -23,7 +23,7 @@ import os, time, threading, warnings
 from datetime import datetime
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 
-import base
+import base, httppool, payloadcache, exifindex
 import requests
 
 #-----------------------------------------------------------------------------|
@@ -113,7 +113,7 @@ def post_image(image_files,
     file = files[0]
     
     if coords is None:
-        coords = base.get_coords(file)
+        coords = exifindex.get_coords(file)
         lat, lon = coords["lat"], coords["lon"]
     
     else:
@@ -125,11 +125,12 @@ def post_image(image_files,
     if not isinstance(lat, float):
         print("Warning: No valid coordinates found.")
     
-    date_time = base.get_creation_time(file) if date is None else date
+    date_time = exifindex.get_creation_time(file) if date is None else date
     
     img = {
       "images": files if LOCAL else [
-          base.image_crop_to_b64(f, max_size = IMG_MAXSIZE) for f in files
+          payloadcache.image_crop_to_b64(f, max_size = IMG_MAXSIZE) \
+              for f in files
           ],
       "lat" : lat,
       "lon" : lon,
@@ -149,7 +150,7 @@ def post_image(image_files,
             start_local_server()
             time.sleep(30)
     
-    response = requests.post(POSTURL, json = img)
+    response = httppool.get_session("florid").post(POSTURL, json = img)
     
     return response.json()
 
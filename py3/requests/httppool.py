@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:40:05 2026
+
+Shared HTTP sessions (connection pools with keep-alive) for the API clients.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 13:40:05 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import dispatch
+
+#-----------------------------------------------------------------------------|
+# Settings
+## Retry policy. Connection errors (the request was not sent) are retried for
+## all methods. Temporary server errors and read errors are only retried for
+## idempotent methods, since a POST may already have been processed (and
+## charged) by the identification service; the API clients handle failed
+## POSTs themselves. (Quota responses, i.e. status 429, are handled in
+## quota.py.)
+RETRY = {
+    "total" : 3,
+    "connect" : 3,
+    "backoff_factor" : 1.0,
+    "status_forcelist" : [500, 502, 503, 504],
+    "allowed_methods" : ["HEAD", "GET"],
+    "raise_on_status" : False
+    }
+
+## Connection pool size per provider. By default, the pool holds one
+## connection per dispatch worker (see dispatch.py).
+POOLSIZE = {}
+
+_SESSIONS = {}
+_LOCK = threading.Lock()
+
+#-----------------------------------------------------------------------------|
+# Functions
+def pool_size(provider):
+    '''
+    Get the connection pool size of a provider.
+    
+    Parameters
+    ----------
+    provider : str
+        Provider key.
+    
+    Returns
+    -------
+    int
+        Maximum number of pooled connections.
+    '''
+    if provider in POOLSIZE:
+        return POOLSIZE[provider]
+    
+    settings = dispatch.DEFAULT.copy()
+    settings.update(dispatch.PROVIDERS.get(provider, {}))
+    
+    return settings["max_workers"]
+
+def get_session(provider):
+    '''
+    Get the shared session of a provider. Connections are kept alive and
+    reused by all requests to the provider.
+    
+    Parameters
+    ----------
+    provider : str
+        Provider key (e.g., "plantnet", "florid").
+    
+    Returns
+    -------
+    requests.Session
+        Session with a connection pool and retry policy.
+    '''
+    with _LOCK:
+        if provider not in _SESSIONS:
+            size = pool_size(provider)
+            
+            adapter = HTTPAdapter(
+                pool_connections = size,
+                pool_maxsize = size,
+                max_retries = Retry(**RETRY)
+                )
+            
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            
+            _SESSIONS[provider] = session
+        
+        return _SESSIONS[provider]
+
+def close_sessions():
+    '''
+    Close all shared sessions and their connections.
+    
+    Returns
+    -------
+    None.
+    '''
+    with _LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        
+        _SESSIONS.clear()
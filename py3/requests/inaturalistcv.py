@@ -21,10 +21,9 @@ __status__ = "Development"
 #-----------------------------------------------------------------------------|
 # Imports
 import os, requests, time
-from datetime import datetime, timedelta
 
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
-import authentication
+import authentication, quota, httppool
 
 #-----------------------------------------------------------------------------|
 # Settings
@@ -45,7 +44,10 @@ TAXONFROM = None
 #-----------------------------------------------------------------------------|
 # Functions
 def post_image(image_path, coordinates):
-    files = {"image" : open(image_path, "rb")}
+    ## Read the file once and close it right away; the multipart body is
+    ## encoded once and re-sent unchanged on retries
+    with open(image_path, "rb") as f:
+        files = {"image" : (os.path.basename(image_path), f.read())}
     
     payload = {
         "lat" : str(coordinates[0]),
@@ -56,10 +58,14 @@ def post_image(image_path, coordinates):
         payload["taxon_id"] = TAXONFROM
     
     headers = HEADER
+    session = httppool.get_session("inaturalist")
     
-    response = requests.post(
-        POSTURL, data = payload, files = files, headers = headers
-        )
+    prepared_req = session.prepare_request(requests.Request(
+        "POST", POSTURL, data = payload, files = files, headers = headers
+        ))
+    del files
+    
+    response = session.send(prepared_req)
     
     remaining_ids = int(response.headers["x-ratelimit-requests-remaining"])
     
@@ -78,29 +84,23 @@ def post_image(image_path, coordinates):
             print("Request failed at attempt {0}.".format(a))
             time.sleep(5)
             
-            response = requests.post(
-                POSTURL, data = payload, files = files, headers = headers
-                )
+            response = session.send(prepared_req)
         
         remaining_ids -= 1
         
         json_result = response.json()
     
+    ## Track the quota of the current payment period; further requests are
+    ## paused once it is used (see quota.py)
+    quota.LIMITER.update_from_headers("inaturalist", response.headers)
+    
     if int(remaining_ids) <= 0:
-        now = datetime.now()
         current_plan = int(response.headers["x-ratelimit-requests-limit"])
-        remaining_time = timedelta(
-            seconds = int(response.headers["x-ratelimit-requests-reset"])
-            )
-        
-        end_of_period = datetime.strftime(
-            now + remaining_time, format = "%Y-%m-%d %H:%M:%S"
-            )
         
         mssg = "iNaturalist VisionAPI quota limit ({0} requests per month)" + \
-            " reached. The current payment period ends on {1}."
+            " reached."
         
-        raise Warning(mssg.format(current_plan, end_of_period), UserWarning)
+        print(mssg.format(current_plan))
     
     return json_result
 
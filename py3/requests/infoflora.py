@@ -19,14 +19,16 @@ __status__ = "Development"
 
 #-----------------------------------------------------------------------------|
 # Imports
-import os, sys, re, shutil, wget, json, argparse, base64, time, logging
+import os, sys, re, shutil, argparse, base64, time, logging
 import pickle as pk
+import concurrent.futures as cf
+import requests
 import pandas as pd
-import urllib.request as ulrq
 from alive_progress import alive_bar as pb
 
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
-import base, authentication, dirselect
+import base, authentication, dirselect, httppool, quota, observationstore
+import exifindex
 
 #-----------------------------------------------------------------------------|
 # Settings
@@ -62,6 +64,22 @@ def parseArguments():
                         help = "Remove existing files and folders of the " + \
                             "output directory.",
                             type = bool, default = False)
+    parser.add_argument("-full_download", "--full_download",
+                        help = "Download all images again instead of only " + \
+                            "new or changed images.",
+                            type = bool, default = False)
+    parser.add_argument("-check_remote", "--check_remote",
+                        help = "Check ETag or size of previously " + \
+                            "downloaded images on the document host.",
+                            type = bool, default = False)
+    parser.add_argument("-dry_run_removal", "--dry_run_removal",
+                        help = "Only log observations that no longer " + \
+                            "exist instead of removing them.",
+                            type = bool, default = False)
+    parser.add_argument("-stream", "--stream",
+                        help = "Write observations to an observation " + \
+                            "store (META.sqlite) instead of META.pickle.",
+                            type = bool, default = False)
     
     args = parser.parse_args()
     
@@ -81,11 +99,24 @@ if __name__ == "__main__":
         else [args.releve_names]
     RELEVETABLE = args.releve_table
     REMOVE = args.clear_directory
+    INCREMENTAL = not args.full_download
+    CHECKREMOTE = args.check_remote
+    STREAM = args.stream
+    DRYRUNREMOVAL = args.dry_run_removal
 
 max_return = 1000
 max_return_releves = 10
 obs_after = args.obs_after if __name__ == "__main__" else "2023-04-15"
 
+## Request timeout for API pages (s). Requests to the API are rate limited
+## (see quota.py); the number of parallel requests is set in dispatch.py.
+page_timeout = 60
+
+## Image downloads
+download_retries = 3
+download_backoff = 1.0
+download_timeout = 60
+
 ## Log messages, warnings, and errors
 logging.basicConfig(level = logging.INFO)
 
@@ -115,10 +146,14 @@ class Observations():
     def __init__(self):
         self.auth = None
         self.token = None
+        self._auth_header = None
         self.authenticate()
         self.META = {}
+        self.sync = None
     
     def authenticate(self):
+        self._auth_header = None
+        
         try:
             self.token = authentication.get_token(
                 provider_url = "https://auth.infoflora.ch/oauth2/token",
@@ -136,9 +171,96 @@ class Observations():
     
     def log_out(self):
         self.auth = None
+        self._auth_header = None
+    
+    def _headers(self):
+        ## Authorization header (encoded once per login)
+        if self._auth_header is None:
+            if self.token is not None:
+                self._auth_header = self.token["token_type"] + " " + \
+                    self.token["access_token"]
+            
+            else:
+                b64str = base64.b64encode(
+                    bytes("%s:%s" % self.auth, "ascii")
+                    )
+                self._auth_header = "Basic %s" % b64str.decode("utf-8")
+        
+        return {"accept" : "application/json",
+                "authorization" : self._auth_header}
+    
+    def _get_page(self, url):
+        quota.LIMITER.acquire("infoflora")
+        
+        response = httppool.get_session("infoflora").get(
+            url, headers = self._headers(), timeout = page_timeout
+            )
+        
+        if response.status_code == 401:
+            logger.error("Authentication failed.")
+        
+        response.raise_for_status()
+        self.url = response.url
+        
+        return response.json()
+    
+    def _iter_pages(self, url, limit, concurrent = True):
+        '''
+        Get all pages of a paginated API endpoint.
+        
+        Parameters
+        ----------
+        url : str
+            Request URL with "{0}" in place of the offset.
+        limit : int
+            Number of items per page.
+        concurrent : bool, optional
+            Compute the offsets from the total count of the first page and
+            request the remaining pages in parallel (under the rate limit of
+            quota.LIMITER). Otherwise, request the pages one after another.
+            The default is True.
+        
+        Yields
+        ------
+        page : dict
+            Response content per page in order of the offset.
+        '''
+        page = self._get_page(url.format(0))
+        offset = limit
+        
+        yield page
+        
+        n_total = page.get("filtered_count", page.get("total_count"))
+        
+        if concurrent and n_total is not None and page["data"] != []:
+            offsets = list(range(limit, n_total, limit))
+            workers = httppool.pool_size("infoflora")
+            
+            mssg = "Loading {0} request pages ({1} items)."
+            logger.info(mssg.format(len(offsets) + 1, n_total))
+            
+            with cf.ThreadPoolExecutor(max_workers = workers) as executor:
+                for page in executor.map(
+                        lambda o: self._get_page(url.format(o)), offsets
+                        ):
+                    yield page
+            
+            offset += len(offsets) * limit
+        
+        ## Continue until an empty page is returned (items added since the
+        ## first request or total count not provided)
+        while page["data"] != []:
+            mssg = "Loading request page {0}. Offset = {1} items."
+            logger.info(mssg.format(int(offset / limit), offset))
+            
+            page = self._get_page(url.format(offset))
+            offset += limit
+            
+            yield page
     
     def update_releve_table(self, file,
-                            projects = [93662], observers = [None]):
+                            projects = [93662], observers = [None],
+                            concurrent = True):
         '''
         Write an Excel file containing data on releves existing on Info Flora.
 
@@ -150,6 +272,8 @@ class Observations():
             List of project IDs. The default is [93662].
         observers : list of int, optional
             List of observer IDs. The default is [None].
+        concurrent : bool, optional
+            Request the result pages in parallel. The default is True.
 
         Returns
         -------
@@ -162,65 +286,20 @@ class Observations():
         releve_url = RELEVEENDPOINT + "?after=" + obs_after + \
             "&limit={0}".format(max_return_releves)
         
-        releve_url_updated = releve_url + "&offset={0}"
-        
         if not projects == [None]:
             releve_url += "&projects=" + ",".join(map(str, projects))
-            releve_url_updated += "&projects=" + ",".join(map(str, projects))
         
         if not observers == [None]:
             releve_url += "&observers=" + ",".join(map(str, observers))
-            releve_url_updated += "&observers=" + ",".join(map(str, observers))
         
-        releve_url_updated += "&after=" + obs_after
+        ## Multiple requests might be required due to response item limit
+        pages = self._iter_pages(releve_url + "&offset={0}",
+                                 max_return_releves, concurrent)
         
-        ## Settings for repeated requests (multiple requests might be required
-        ## due to response item limit).
-        status = 200
-        releve_df = None
-        offset = 0
+        releve_df = pd.DataFrame(
+            [releve for page in pages for releve in page["data"]]
+            )[["id", "name", "surface", "last_modified_when"]]
         
-        while status == 200:
-            if self.token is not None:
-                rresponse = ulrq.urlopen(
-                    ulrq.Request(releve_url, headers = {
-                        "accept" : "application/json",
-                        "authorization" : self.token["token_type"] + " " + \
-                            self.token["access_token"]
-                        })
-                    )
-            else:
-                request = ulrq.Request(releve_url)
-                b64str = base64.b64encode(bytes("%s:%s" % self.auth, "ascii"))
-                request.add_header(
-                    "authorization", "Basic %s" % b64str.decode("utf-8")
-                    )
-                
-                rresponse = ulrq.urlopen(request)
-            
-            status = rresponse.getcode()
-            
-            if status == 200:
-                content = json.load(rresponse)
-                
-                releve_dat = content["data"]
-                
-                if releve_dat == []:
-                    break
-                
-                releve_batch = pd.DataFrame(releve_dat)[
-                    ["id", "name", "surface", "last_modified_when"]
-                    ]
-            
-            if releve_df is None:
-                releve_df = releve_batch.copy()
-            
-            else:
-                releve_df = pd.concat([releve_df, releve_batch])
-            
-            offset += max_return_releves
-            releve_url = releve_url_updated.format(offset)
-            
         releve_df = releve_df.sort_values(by = "name")
             
         ### Set "include" column to False
@@ -253,7 +332,8 @@ class Observations():
         return 0
     
     def get_observations(self, projects, observers,
-                         releves = None, releve_names = None, out = None):
+                         releves = None, releve_names = None, out = None,
+                         concurrent = True, stream = False):
         '''
         Get observations accessible to a user from InfoFlora.ch.
 
@@ -268,6 +348,17 @@ class Observations():
         releve_names : str, optional
             Releve names. Overwrites "releves" with releve IDs obtained from
             InfoFlora for matching releves.
+        out : str, optional
+            Output directory (RELEVE.dict and, if stream is True,
+            META.sqlite). Required if stream is True. The default is None.
+        concurrent : bool, optional
+            Request the result pages in parallel (see ._iter_pages). The
+            default is True.
+        stream : bool, optional
+            Write the observations page by page to the observation store of
+            the output directory (out/META.sqlite, see observationstore.py)
+            instead of keeping them in memory. .observations is then a view
+            of the store. The default is False.
 
         Returns
         -------
@@ -280,8 +371,19 @@ class Observations():
         plemented at this point. (There are loops for the .update_releve_table
         method and the observations themselves, though. Thus, the issue only
         concerns the length of the provided releve list.)
+        
+        .sync records whether the observations were filtered by project or
+        observer and whether all pages were received (number of distinct
+        observations equal to the filtered count of the API). Observations
+        that no longer exist are only removed by .download_images after an
+        unfiltered and complete sync (see ._remove_deprecated).
 
         '''
+        if stream and out is None:
+            raise ValueError(
+                "An output directory (out) is required to stream observations."
+                )
+        
         RELEVEENDPOINT = "https://obs.infoflora.ch/rest/v4/releves"
         
         OBSENDPOINT = "https://obs.infoflora.ch/rest/v4/observations"
@@ -289,10 +391,13 @@ class Observations():
         releve_url = RELEVEENDPOINT + "?after=" + obs_after + \
             "&limit={0}".format(max_return_releves)
         
-        releve_url_updated = releve_url + "&offset={0}"
-        
         request_url = OBSENDPOINT + "?limit={0}".format(max_return)
         
+        filtered = any(
+            ids is not None and ids != [None] for ids in (projects, observers)
+            )
+        n_expected = None
+        
         if not projects == [None]:
             releve_url += "&projects=" + ",".join(map(str, projects))
             request_url += "&projects=" + ",".join(map(str, projects))
@@ -302,46 +407,15 @@ class Observations():
             request_url += "&observers=" + ",".join(map(str, observers))
         
         ## Translate releve names to releve IDs-------------------------------|
-        status = 200
         releve_dict = dict()
-        offset = 0
         
         logger.info("Creating releve dictionary...")
         
-        while status == 200:
-            if self.token is not None:
-                rresponse = ulrq.urlopen(
-                    ulrq.Request(releve_url, headers = {
-                        "accept" : "application/json",
-                        "authorization" : self.token["token_type"] + " " + \
-                            self.token["access_token"]
-                        })
-                    )
-            else:
-                request = ulrq.Request(releve_url)
-                b64str = base64.b64encode(bytes("%s:%s" % self.auth, "ascii"))
-                request.add_header(
-                    "authorization", "Basic %s" % b64str.decode("utf-8")
-                    )
-                
-                rresponse = ulrq.urlopen(request)
-            
-            status = rresponse.getcode()
-            
-            if status == 200:
-                content = json.load(rresponse)
-                
-                releve_dat = content["data"]
-                
-                if releve_dat == []:
-                    break
-                
-                for releve in releve_dat:
-                    if releve["name"] is not None:
-                        releve_dict[releve["name"]] = releve["id"]
-            
-            offset += max_return_releves
-            releve_url = releve_url_updated.format(offset)
+        for page in self._iter_pages(releve_url + "&offset={0}",
+                                     max_return_releves, concurrent):
+            for releve in page["data"]:
+                if releve["name"] is not None:
+                    releve_dict[releve["name"]] = releve["id"]
         
         if releve_names is None and releves is not None:
             releve_names = releve_dict.keys()
@@ -364,64 +438,48 @@ class Observations():
         logger.info("Using request url: " + request_url)
         
         self.observations = {}
-        self.n_observations = 0
-        request_url += "&offset={0}"
-        offset = 0
-        response_data = ["PLACEHOLDER"]
         
-        while response_data != []:
-            mssg = "Loading request page {0}. Offset = {1} observations."
-            logger.info(mssg.format(int(offset / max_return), offset))
-            
-            if self.token is not None:
-                response = ulrq.urlopen(
-                    ulrq.Request(request_url.format(offset), headers = {
-                        "accept" : "application/json",
-                        "authorization" : self.token["token_type"] + " " + \
-                            self.token["access_token"]
-                        })
-                    )
-            else:
-                request = ulrq.Request(request_url.format(offset))
-                b64str = base64.b64encode(bytes("%s:%s" % self.auth, "ascii"))
-                request.add_header(
-                    "authorization", "Basic %s" % b64str.decode("utf-8")
-                    )
-                
-                response = ulrq.urlopen(request)
-            
-            self.url = response.url
-            logger.info("Response code: " + str(response.getcode()))
-            
-            if response.getcode() == 200:
-                content = json.load(response)
-                
-                mssg = "Content total count: " + str(content["total_count"])
+        if stream:
+            store = observationstore.ObservationStore(
+                os.path.join(out, observationstore.FILENAME)
+                )
+            obs_ids = list()
+        
+        pages = self._iter_pages(request_url + "&offset={0}", max_return,
+                                 concurrent)
+        
+        for i, page in enumerate(pages):
+            if i == 0:
+                mssg = "Content total count: " + str(page.get("total_count"))
                 logger.info(mssg)
                 mssg = "Content filtered count: " + str(
-                    content["filtered_count"]
+                    page.get("filtered_count")
                     )
-                
                 logger.info(mssg)
-                
-                response_data = content["data"]
-                response_dict = {x["obs_id"] : x for x in response_data}
-                
-                self.observations.update(response_dict)
-                self.n_observations += content["total_count"]
-                
-            elif response.getcode() == 401:
-                response_data = []
-                
-                logger.error("Authentication failed.")
-                
-            else:
-                response_data = []
-                
-                logger.warn(response.text)
+                n_expected = page.get("filtered_count")
             
-            offset += max_return
-            time.sleep(0.5)
+            if stream:
+                store.put_many(page["data"])
+                obs_ids += [x["obs_id"] for x in page["data"]]
+            
+            else:
+                self.observations.update(
+                    {x["obs_id"] : x for x in page["data"]}
+                    )
+        
+        if stream:
+            self.observations = store.view(list(dict.fromkeys(obs_ids)))
+        
+        self.n_observations = len(self.observations)
+        
+        ## Items may shift between pages while paging by offset
+        complete = n_expected is None or self.n_observations >= n_expected
+        
+        if not complete:
+            mssg = "Received {0} of {1} observations."
+            logger.warning(mssg.format(self.n_observations, n_expected))
+        
+        self.sync = {"filtered" : filtered, "complete" : complete}
     
     def get_releves(self, releve_types = [922, 923]):
         '''
@@ -513,140 +571,504 @@ class Observations():
             
             logger.info(mssg.format(observation))
     
-    def download_images(self, directory = None, remove = False,
-                        cleanup = True
-                        ):
+    def _file_meta(self, observation):
+        ## Image metadata that is written to the Exif of the downloaded files
+        return [observation["y"], observation["x"], str(observation["date"])]
+    
+    def _remote_unchanged(self, session, URL, signature):
+        ## Compare the stored signature of a file with the document host
+        response = session.head(URL, timeout = download_timeout,
+                                allow_redirects = True)
         
-        out_dir = dirselect.select_directory() if directory is None \
-            else directory
+        if not response.ok:
+            return False
         
-        if remove:
-            shutil.rmtree(out_dir)
-            self.META = {}
-        else:
-            old_meta_file = os.path.join(out_dir, "META.pickle")
+        etag = response.headers.get("ETag")
+        size = response.headers.get("Content-Length")
+        
+        if etag is not None and signature.get("etag") is not None:
+            return etag == signature["etag"]
+        
+        return size is not None and int(size) == signature.get("size")
+    
+    def _download_image(self, session, observation, URL, dest,
+                        signature = None):
+        if signature is not None and \
+            self._remote_unchanged(session, URL, signature):
+            return signature, False
+        
+        for attempt in range(download_retries + 1):
+            try:
+                response = session.get(URL, timeout = download_timeout)
+                response.raise_for_status()
+                data = response.content
+                break
             
-            if os.path.isfile(old_meta_file):
-                self.META = base.load_meta(old_meta_file)
+            except requests.RequestException:
+                if attempt == download_retries:
+                    raise
+                
+                time.sleep(download_backoff * 2 ** attempt)
         
-        warnings = 0
+        signature = {
+            "file" : dest,
+            "etag" : response.headers.get("ETag"),
+            "size" : len(data),
+            "meta" : self._file_meta(observation)
+            }
         
-        ## Create dict of current observations to clean up old metadata files
-        ## later
-        obs_ids = list()
+        ## Add plot coordinates as image coordinates and the creation date
+        ## (for some files, this tag might have been lost on the way) before
+        ## the file is written
+        data = base.set_image_meta(
+            data,
+            coordinates = (observation["y"], observation["x"]),
+            date_time = observation["date"],
+            replace = True
+            )
         
-        n_total = 0
+        with open(dest, "wb") as f:
+            f.write(data)
         
-        for obs in self.observations.values():
-            n_total += len(self._get_image_urls(obs))
+        return signature, True
+    
+    def _download_all(self, observations, n_total = None, on_done = None):
+        '''
+        Download images in parallel (connections to the document host are
+        reused). Failed downloads are removed from the observation's file
+        locations and image types. Observations are taken from the iterator as download slots
+        become free, so only the observations currently being downloaded are
+        held in memory.
         
-        with pb(n_total, bar = "smooth") as bar:
-            for observation in self.observations.values():
-                ## Create folder
-                obs_id = observation["obs_id"]
-                obs_ids.append(obs_id)
-                
-                releve_id = observation["releve_id"]
-                
-                current_dir = os.path.join(
-                    out_dir, str(releve_id), str(obs_id)
-                    )
-                
-                ## Remove previously existing version of the observation
-                if os.path.isdir(current_dir):
-                    shutil.rmtree(current_dir)
-                
-                ## Get image information
-                rem = observation["rem"]
-                remarks = rem.split(",") if rem is not None else []
-                img_types = [re.sub("\w+:", "", r).strip() for r in remarks]
-                
-                for image_index, t in enumerate(img_types):
-                    if not t in ["f", "i", "s", "t", "v"]:
-                        mssg = "Invalid image type: {0}. " + \
-                            "Must be in {{f, i, s, t, v}}."
-                        
-                        warnings += 1
-                        logger.warn(mssg.format(t))
-                
-                ## Download images
-                url_list = self._get_image_urls(observation)
+        Parameters
+        ----------
+        observations : iterable
+            Tuples (observation, jobs), where jobs is a list of tuples
+            (observation, URL, destination, signature). If a signature is
+            given, the file is only downloaded if it has changed on the
+            document host.
+        n_total : int, optional
+            Number of observations (for the progress bar). The default is
+            None (unknown).
+        on_done : callable, optional
+            Function called with each observation once all its images are
+            processed. The default is None.
+        
+        Returns
+        -------
+        warnings : int
+            Number of failed downloads.
+        n_saved : int
+            Bytes not downloaded because the file was unchanged.
+        '''
+        session = httppool.get_session("infoflora")
+        workers = httppool.pool_size("infoflora")
+        window = 4 * workers
+        
+        warnings = 0
+        n_files = 0
+        n_bytes = 0
+        n_saved = 0
+        t0 = time.perf_counter()
+        
+        observations = iter(observations)
+        exhausted = False
+        pending = dict()
+        open_jobs = dict()
+        finished = list()
+        
+        with pb(n_total, bar = "smooth") as bar, \
+            cf.ThreadPoolExecutor(max_workers = workers) as executor:
+            while True:
+                ## Submit the images of further observations
+                while not exhausted and len(pending) < window:
+                    item = next(observations, None)
+                    
+                    if item is None:
+                        exhausted = True
+                        break
+                    
+                    observation, jobs = item
+                    open_jobs[id(observation)] = len(jobs)
+                    
+                    for job in jobs:
+                        future = executor.submit(
+                            self._download_image, session, *job
+                            )
+                        pending[future] = job
+                    
+                    if len(jobs) == 0:
+                        finished.append(observation)
                 
-                if len(url_list) != len(img_types):
-                    warning_curr = "Length of URL list ({0}) " + \
-                        "differs from length of image type notation ({1})." + \
-                            " Noted image types: {2}."
+                for observation in finished:
+                    del open_jobs[id(observation)]
                     
-                    warnings += 1
-                    logger.warn(
-                        warning_curr.format(len(url_list),
-                                            len(img_types),
-                                            str(img_types))
-                        )
+                    if on_done is not None:
+                        on_done(observation)
                     
-                    img_types = ["Unknown"] * len(url_list)
+                    ### Increase progress bar
+                    bar()
                 
-                if len(url_list) > 0 and not os.path.exists(current_dir):
-                    os.makedirs(current_dir, exist_ok = True)
+                finished = list()
                 
-                else:
-                    mssg = "No image URLs found: releve {0}, observation {1}."
-                    
-                    logger.warn(mssg.format(str(releve_id), str(obs_id)))
+                if len(pending) == 0:
+                    break
                 
-                disc_locations = list()
+                done, _ = cf.wait(pending, return_when = cf.FIRST_COMPLETED)
                 
-                for idx, (URL, suffix) in enumerate(zip(url_list, img_types)):
-                    f_ext = os.path.splitext(URL)[-1]
-                    fname = "img_{0}_{1}{2}".format(idx, suffix, f_ext)
+                for future in done:
+                    observation, URL, dest, _ = pending.pop(future)
                     
-                    dest = os.path.join(current_dir, fname).replace("\\", "/")
-                    
-                    response = wget.download(URL, dest)
-                    logger.info(response)
-                    
-                    disc_locations.append(dest)
-                    
-                    logger.info("Image disc location appended to META.")
+                    try:
+                        signature, downloaded = future.result()
+                        observation["file_signatures"][URL] = signature
+                        
+                        if downloaded:
+                            n_bytes += signature["size"]
+                            n_files += 1
+                            logger.info(dest)
+                        
+                        else:
+                            n_saved += signature["size"]
                     
-                    ## Add plot coordinates as image coordinates if image location
-                    ## is missing
-                    base.add_coords(dest, (observation["y"], observation["x"]),
-                                    replace = True)
+                    except Exception as e:
+                        warnings += 1
+                        
+                        ## Image types and file locations are parallel lists
+                        index = observation["file_locations"].index(dest)
+                        del observation["file_locations"][index]
+                        del observation["img_types"][index]
+                        logger.warn(
+                            "Failed to download {0}: {1}".format(URL, e)
+                            )
                     
-                    ### Add creation date (for some files, this tag might have
-                    ### been lost on the way)
-                    base.add_creation_time(dest, observation["date"],
-                                           replace = True)
+                    open_jobs[id(observation)] -= 1
                     
-                    ### Increade progress bar
-                    bar()
+                    if open_jobs[id(observation)] == 0:
+                        finished.append(observation)
                 
-                self._set_observation_meta(observation,
-                                           "img_types",
-                                           img_types)
+                seconds = max(time.perf_counter() - t0, 1e-6)
+                bar.text = "{0:.2f} MB/s, {1:.1f} files/s".format(
+                    n_bytes / 1024 ** 2 / seconds, n_files / seconds
+                    )
+        
+        seconds = max(time.perf_counter() - t0, 1e-6)
+        mssg = "Downloaded {0} images ({1:.1f} MB) in {2:.1f} s " + \
+            "({3:.2f} MB/s, {4:.1f} files/s)."
+        
+        logger.info(mssg.format(n_files, n_bytes / 1024 ** 2, seconds,
+                                n_bytes / 1024 ** 2 / seconds,
+                                n_files / seconds))
+        
+        return warnings, n_saved
+    
+    def _remove_deprecated(self, out_dir, releve_ids, dry_run = False):
+        ## Remove observations of the current releves that no longer exist.
+        ## Observations missing from a sync filtered by project or observer
+        ## (e.g., observations of other observers of the same releve) or
+        ## from an incomplete sync may still exist; they are only logged
+        if isinstance(self.META, observationstore.ObservationStore):
+            deprecated = [obs_id for obs_id in self.META.ids(releve_ids) if \
+                          obs_id not in self.observations]
+        
+        else:
+            deprecated = [obs_id for obs_id, obs in self.META.items() if \
+                          obs["releve_id"] in releve_ids and \
+                              obs_id not in self.observations]
+        
+        if len(deprecated) == 0:
+            return
+        
+        sync = self.sync or {"filtered" : True, "complete" : False}
+        
+        if sync["filtered"] or not sync["complete"]:
+            mssg = "Not removing {0} observations missing from the {1} sync."
+            logger.warning(mssg.format(
+                len(deprecated),
+                "filtered" if sync["filtered"] else "incomplete"
+                ))
+            dry_run = True
+        
+        for obs_id in deprecated:
+            obs_dir = os.path.join(
+                out_dir, str(self.META[obs_id]["releve_id"]), str(obs_id)
+                )
+            
+            if dry_run:
+                mssg = "Observation {0} not found; would remove {1}."
+                logger.info(mssg.format(obs_id, obs_dir))
+                continue
+            
+            mssg = "Observation {0} no longer exists and will be removed."
+            logger.info(mssg.format(obs_id))
+            
+            if os.path.isdir(obs_dir):
+                shutil.rmtree(obs_dir)
+            
+            del self.META[obs_id]
+    
+    def _prepare_observation(self, observation, out_dir, cleanup = True,
+                             incremental = True, check_remote = False):
+        '''
+        Create the directory of an observation, set its image types and file
+        locations, and list the images to download (see .download_images).
+        
+        Returns
+        -------
+        jobs : list
+            Tuples (observation, URL, destination, signature).
+        n_saved : int
+            Bytes of unchanged images that are not downloaded again.
+        warnings : int
+            Number of warnings.
+        '''
+        warnings = 0
+        n_saved = 0
+        jobs = list()
+        
+        ## Create folder
+        obs_id = observation["obs_id"]
+        releve_id = observation["releve_id"]
+        
+        current_dir = os.path.join(
+            out_dir, str(releve_id), str(obs_id)
+            )
+        
+        ## File signatures of the previous download
+        old_signatures = self.META.get(obs_id, {}).get(
+            "file_signatures", {}
+            ) if incremental else {}
+        
+        ## Remove previously existing version of the observation
+        if not incremental and os.path.isdir(current_dir):
+            shutil.rmtree(current_dir)
+        
+        ## Get image information
+        rem = observation["rem"]
+        remarks = rem.split(",") if rem is not None else []
+        img_types = [re.sub("\w+:", "", r).strip() for r in remarks]
+        
+        for image_index, t in enumerate(img_types):
+            if not t in ["f", "i", "s", "t", "v"]:
+                mssg = "Invalid image type: {0}. " + \
+                    "Must be in {{f, i, s, t, v}}."
                 
-                self._set_observation_meta(observation,
-                                           "file_locations",
-                                           disc_locations)
+                warnings += 1
+                logger.warn(mssg.format(t))
+        
+        ## Get image URLs
+        url_list = self._get_image_urls(observation)
+        
+        if len(url_list) != len(img_types):
+            warning_curr = "Length of URL list ({0}) " + \
+                "differs from length of image type notation ({1})." + \
+                    " Noted image types: {2}."
+            
+            warnings += 1
+            logger.warn(
+                warning_curr.format(len(url_list),
+                                    len(img_types),
+                                    str(img_types))
+                )
+            
+            img_types = ["Unknown"] * len(url_list)
+        
+        if len(url_list) > 0:
+            os.makedirs(current_dir, exist_ok = True)
+        
+        else:
+            mssg = "No image URLs found: releve {0}, observation {1}."
+            
+            logger.warn(mssg.format(str(releve_id), str(obs_id)))
+        
+        disc_locations = list()
+        signatures = dict()
+        
+        for idx, (URL, suffix) in enumerate(zip(url_list, img_types)):
+            f_ext = os.path.splitext(URL)[-1]
+            fname = "img_{0}_{1}{2}".format(idx, suffix, f_ext)
+            
+            dest = os.path.join(current_dir, fname).replace("\\", "/")
+            
+            disc_locations.append(dest)
+            
+            ## Skip images that were downloaded before to the same file
+            signature = old_signatures.get(URL)
+            
+            if signature is None or signature["file"] != dest or \
+                not os.path.isfile(dest):
+                jobs.append((observation, URL, dest, None))
+                continue
+            
+            ## Update the Exif of the local file if the observation's
+            ## coordinates or date have changed
+            if list(signature["meta"]) != self._file_meta(observation):
+                base.set_image_meta(
+                    dest,
+                    coordinates = (observation["y"], observation["x"]),
+                    date_time = observation["date"],
+                    replace = True
+                    )
                 
-                if cleanup and os.path.isdir(current_dir):
-                    all_files = [os.path.join(current_dir, f) for f in \
-                                 os.listdir(current_dir) if os.path.isfile(f)]
+                signature = dict(
+                    signature, meta = self._file_meta(observation)
+                    )
+            
+            if check_remote:
+                jobs.append((observation, URL, dest, signature))
+            
+            else:
+                signatures[URL] = signature
+                n_saved += signature["size"]
+        
+        self._set_observation_meta(observation,
+                                   "img_types",
+                                   img_types)
+        
+        self._set_observation_meta(observation,
+                                   "file_locations",
+                                   disc_locations)
+        
+        self._set_observation_meta(observation,
+                                   "file_signatures",
+                                   signatures)
+        
+        if cleanup and os.path.isdir(current_dir):
+            ## Keep the Exif index of the directory (see exifindex.py)
+            all_files = [os.path.join(current_dir, f) for f in \
+                         os.listdir(current_dir) if \
+                             os.path.isfile(os.path.join(current_dir, f)) \
+                                 and not f.startswith(exifindex.SIDECAR)]
+            
+            for file_location in all_files:
+                if file_location not in disc_locations:
+                    mssg = "Found deprecated file {0} which will " + \
+                        "be removed."
                     
-                    for file_location in all_files:
-                        if file_location not in disc_locations:
-                            mssg = "Found deprecated file {0} which will " + \
-                                "be removed."
-                            
-                            logger.info(mssg.format(file_location))
-                            os.remove(file_location)
+                    logger.info(mssg.format(file_location))
+                    os.remove(file_location)
         
-        ## Update observation metadata
-        self.META.update(self.observations)
+        return jobs, n_saved, warnings
+    
+    def _prepare_observations(self, out_dir, summary, **kwargs):
+        ## Prepare the observations one by one as the downloads proceed
+        ## (see ._prepare_observation and ._download_all)
+        for observation in self.observations.values():
+            jobs, n_saved, warnings = self._prepare_observation(
+                observation, out_dir, **kwargs
+                )
+            
+            summary["warnings"] += warnings
+            summary["n_saved"] += n_saved
+            summary["releve_ids"].add(observation["releve_id"])
+            
+            yield observation, jobs
+    
+    def download_images(self, directory = None, remove = False,
+                        cleanup = True, incremental = True,
+                        check_remote = False, dry_run_removal = False
+                        ):
+        '''
+        Download the images of the current observations.
         
-        with open(os.path.join(out_dir, "META.pickle"), "wb") as f:
-            pk.dump(self.META, f)
+        Parameters
+        ----------
+        directory : str, optional
+            Output directory. The default is None (select directory).
+        remove : bool, optional
+            Remove the output directory and its metadata first. The default
+            is False.
+        cleanup : bool, optional
+            Remove files of an observation that are not part of it (anymore).
+            The default is True.
+        incremental : bool, optional
+            Only download images that are new or changed compared to the
+            metadata file (META.pickle) and remove images and observations
+            that no longer exist. Otherwise, all images are downloaded again.
+            The default is True.
+        check_remote : bool, optional
+            In incremental mode, check the ETag or size of files with known
+            URLs on the document host (HEAD request). Otherwise, files with
+            known URLs are considered unchanged. The default is False.
+        dry_run_removal : bool, optional
+            Only log the observations that no longer exist and the directories
+            that would be removed. Observations are never removed after a
+            sync filtered by project or observer or an incomplete sync (see
+            .get_observations). The default is False.
+        
+        Returns
+        -------
+        None.
+        
+        Notes
+        -----
+        If the observations were streamed to an observation store (see
+        .get_observations), the store is used as metadata instead of
+        META.pickle, and each observation is written back to the store once
+        its images are downloaded.
+        '''
+        out_dir = dirselect.select_directory() if directory is None \
+            else directory
+        
+        store = self.observations.store if isinstance(
+            self.observations, observationstore.ObservationView
+            ) else None
+        
+        if store is not None:
+            self.META = store
+            
+            ## Keep the observation store in the output directory
+            if remove:
+                for name in os.listdir(out_dir):
+                    if os.path.isdir(os.path.join(out_dir, name)):
+                        shutil.rmtree(os.path.join(out_dir, name))
+                
+                for obs_id in store.ids():
+                    if obs_id not in self.observations:
+                        del store[obs_id]
+                
+                store.clear_files()
+        
+        elif remove:
+            shutil.rmtree(out_dir)
+            self.META = {}
+        else:
+            old_meta_file = os.path.join(out_dir, "META.pickle")
+            
+            if os.path.isfile(old_meta_file):
+                self.META = base.load_meta(old_meta_file)
+        
+        ## Warnings, bytes of unchanged images that are not downloaded again,
+        ## and releves of the current observations
+        summary = {"warnings" : 0, "n_saved" : 0, "releve_ids" : set()}
+        
+        ## Download images
+        failed, n_unchanged = self._download_all(
+            self._prepare_observations(
+                out_dir, summary, cleanup = cleanup,
+                incremental = incremental, check_remote = check_remote
+                ),
+            n_total = len(self.observations),
+            on_done = None if store is None else store.set_files
+            )
+        warnings = summary["warnings"] + failed
+        n_saved = summary["n_saved"] + n_unchanged
+        
+        if incremental and cleanup:
+            self._remove_deprecated(out_dir, summary["releve_ids"],
+                                    dry_run = dry_run_removal)
+        
+        if incremental:
+            logger.info("Skipped unchanged images: {0:.1f} MB saved.".format(
+                n_saved / 1024 ** 2
+                ))
+        
+        ## Update observation metadata
+        if store is None:
+            self.META.update(self.observations)
+            
+            with open(os.path.join(out_dir, "META.pickle"), "wb") as f:
+                pk.dump(self.META, f)
         
         logger.info("Finished with {0} warnings.".format(warnings))
 
@@ -675,10 +1097,17 @@ if __name__ == "__main__":
     # Run
     my_obs = Observations()
     
+    ## The observation store is written to the output directory
+    if STREAM and OUT is None:
+        OUT = dirselect.select_directory()
+    
     with pb(bar = "smooth", unknown = "brackets", spinner = "classic") as bar:
         my_obs.get_observations(PROJECT, USER,
                                 releves = RELEVES, releve_names = RELEVENAMES,
-                                out = OUT)
+                                out = OUT, stream = STREAM)
     
     logger.info("Starting downloads...")
-    my_obs.download_images(directory = OUT, remove = REMOVE)
\ No newline at end of file
+    my_obs.download_images(directory = OUT, remove = REMOVE,
+                           incremental = INCREMENTAL,
+                           check_remote = CHECKREMOTE,
+                           dry_run_removal = DRYRUNREMOVAL)
\ No newline at end of file
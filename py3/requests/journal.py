@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:26:51 2026
+
+Append-only journal of Batchrequest results. Each completed request is written
+once as a pickled record, so checkpoints no longer need to contain the
+results.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 14:26:51 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, threading
+import pickle as pk
+
+#-----------------------------------------------------------------------------|
+# Settings
+EXTENSION = ".journal"
+
+## Record types
+PUT = "put"
+DELETE = "del"
+
+#-----------------------------------------------------------------------------|
+# Functions
+def insert(results, key, value):
+    '''
+    Insert a value into the nested results dictionary.
+    
+    Parameters
+    ----------
+    results : dict
+        Nested results dictionary (releve -> observation -> image -> model).
+    key : tuple
+        Path of the value within the results dictionary.
+    value : dict
+        Result dictionary.
+    
+    Returns
+    -------
+    None.
+    '''
+    node = results
+    
+    for k in key[:-1]:
+        node = node.setdefault(k, {})
+    
+    node[key[-1]] = value
+
+def remove(results, key):
+    '''
+    Remove an entry (of any level) from the nested results dictionary.
+    
+    Parameters
+    ----------
+    results : dict
+        Nested results dictionary.
+    key : tuple
+        Path of the entry within the results dictionary.
+    
+    Returns
+    -------
+    None.
+    '''
+    node = results
+    
+    for k in key[:-1]:
+        node = node.get(k)
+        
+        if not isinstance(node, dict):
+            return
+    
+    node.pop(key[-1], None)
+
+#-----------------------------------------------------------------------------|
+# Classes
+class ResultsJournal():
+    def __init__(self, path, sync = False):
+        '''
+        Append-only journal file.
+        
+        Parameters
+        ----------
+        path : str
+            Path of the journal file.
+        sync : bool, optional
+            Call os.fsync after each record (survives power loss, but slower).
+            The default is False (records are flushed to the OS only).
+        
+        Returns
+        -------
+        None.
+        '''
+        self.path = path
+        self.sync = sync
+        self._file = None
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _records(self):
+        '''
+        Iterate over the records in the journal file. Reading stops at a
+        truncated record (e.g., if the process was killed while writing).
+        
+        Yields
+        ------
+        tuple
+            Record (operation, key, value) and file offset after the record.
+        '''
+        if not os.path.isfile(self.path):
+            return
+        
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    record = pk.load(f)
+                
+                except (EOFError, pk.UnpicklingError, ValueError,
+                        AttributeError, IndexError):
+                    return
+                
+                yield record, f.tell()
+    
+    def _open(self):
+        if self._file is None:
+            ## Drop an incomplete last record before appending
+            end = 0
+            
+            for _, end in self._records():
+                pass
+            
+            if os.path.isfile(self.path) and os.path.getsize(self.path) > end:
+                with open(self.path, "r+b") as f:
+                    f.truncate(end)
+            
+            self._file = open(self.path, "ab")
+        
+        return self._file
+    
+    def append(self, operation, key, value = None):
+        '''
+        Append a record to the journal.
+        
+        Parameters
+        ----------
+        operation : str
+            PUT or DELETE.
+        key : tuple
+            Path of the entry within the results dictionary.
+        value : dict, optional
+            Result dictionary (PUT only). The default is None.
+        
+        Returns
+        -------
+        int
+            Size of the record (bytes).
+        '''
+        with self._lock:
+            f = self._open()
+            start = f.tell()
+            pk.dump((operation, tuple(key), value), f)
+            f.flush()
+            
+            if self.sync:
+                os.fsync(f.fileno())
+            
+            return f.tell() - start
+    
+    def put(self, key, value):
+        return self.append(PUT, key, value)
+    
+    def delete(self, key):
+        return self.append(DELETE, key)
+    
+    def replay(self, results = None):
+        '''
+        Rebuild the results dictionary from the journal.
+        
+        Parameters
+        ----------
+        results : dict, optional
+            Dictionary to apply the records to. The default is None (new
+            dictionary).
+        
+        Returns
+        -------
+        results : dict
+            Nested results dictionary.
+        '''
+        results = {} if results is None else results
+        
+        with self._lock:
+            for (operation, key, value), _ in self._records():
+                if operation == PUT:
+                    insert(results, key, value)
+                
+                elif operation == DELETE:
+                    remove(results, key)
+        
+        return results
+    
+    def rewrite(self, results):
+        '''
+        Replace the journal by one PUT record per result (compaction). Used
+        after changes that are not journaled record by record.
+        
+        Parameters
+        ----------
+        results : dict
+            Nested results dictionary.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            
+            tmp = self.path + ".tmp"
+            
+            with open(tmp, "wb") as f:
+                for releve_name, releve in results.items():
+                    for observation_id, observation in releve.items():
+                        for image, models in observation.items():
+                            for cv_model, result in models.items():
+                                key = (
+                                    releve_name, observation_id, image,
+                                    cv_model
+                                    )
+                                pk.dump((PUT, key, result), f)
+                
+                f.flush()
+                os.fsync(f.fileno())
+            
+            os.replace(tmp, self.path)
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:26:41 2026
+
+On-disk (SQLite) store of Info Flora observations, written page by page by
+infoflora.py and read lazily instead of loading META.pickle as a whole.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 19:26:41 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, json, sqlite3, threading
+import pickle as pk
+from collections.abc import Mapping, MutableMapping
+
+#-----------------------------------------------------------------------------|
+# Settings
+## File name of the store within an image file collection directory
+FILENAME = "META.sqlite"
+
+## Observation fields set by infoflora.Observations.download_images. They are
+## stored separately, so that updates of the API data keep them.
+FILE_FIELDS = ("img_types", "file_locations", "file_signatures")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    obs_id INTEGER PRIMARY KEY,
+    releve_id INTEGER,
+    data TEXT NOT NULL,
+    files TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_releve
+    ON observations (releve_id);
+"""
+
+#-----------------------------------------------------------------------------|
+# Functions
+def metadata_file(image_dir):
+    '''
+    Get the current metadata file of an image file collection directory: the
+    observation store (FILENAME) if it is at least as recent as META.pickle,
+    else META.pickle.
+    
+    Parameters
+    ----------
+    image_dir : str
+        Image file collection directory.
+    
+    Returns
+    -------
+    str
+        Path to the metadata file (which might not exist).
+    '''
+    store_file = os.path.join(image_dir, FILENAME)
+    meta_file = os.path.join(image_dir, "META.pickle")
+    
+    if os.path.isfile(store_file) and (
+            not os.path.isfile(meta_file) or \
+                os.path.getmtime(store_file) >= os.path.getmtime(meta_file)
+            ):
+        return store_file
+    
+    return meta_file
+
+def _split(observation):
+    ## API data and download fields of an observation
+    data = {k : v for k, v in observation.items() if k not in FILE_FIELDS}
+    files = {k : observation[k] for k in FILE_FIELDS if k in observation}
+    
+    return data, files
+
+def _dumps(value):
+    return json.dumps(value, default = str)
+
+#-----------------------------------------------------------------------------|
+# Classes
+class ObservationStore(MutableMapping):
+    def __init__(self, path):
+        '''
+        Observations (dictionaries as returned by the Info Flora API plus the
+        download fields) by observation ID. Observations are read from disk
+        on access; the store itself keeps no observations in memory.
+        
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite file. The file is created if it does not
+            exist.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.path = path
+        self._local = threading.local()
+        
+        with self._connection() as con:
+            con.executescript(SCHEMA)
+    
+    def __getstate__(self):
+        return {"path" : self.path}
+    
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+    
+    def _connection(self):
+        ## One connection per thread
+        con = getattr(self._local, "con", None)
+        
+        if con is None:
+            con = sqlite3.connect(self.path)
+            self._local.con = con
+        
+        return con
+    
+    def __getitem__(self, obs_id):
+        row = self._connection().execute(
+            "SELECT data, files FROM observations WHERE obs_id = ?",
+            (int(obs_id),)
+            ).fetchone()
+        
+        if row is None:
+            raise KeyError(obs_id)
+        
+        observation = json.loads(row[0])
+        
+        if row[1] is not None:
+            observation.update(json.loads(row[1]))
+        
+        return observation
+    
+    def __contains__(self, obs_id):
+        try:
+            obs_id = int(obs_id)
+        
+        except (TypeError, ValueError):
+            return False
+        
+        return self._connection().execute(
+            "SELECT 1 FROM observations WHERE obs_id = ?", (obs_id,)
+            ).fetchone() is not None
+    
+    def __iter__(self):
+        return iter(self.ids())
+    
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM observations"
+            ).fetchone()[0]
+    
+    def __setitem__(self, obs_id, observation):
+        data, files = _split(observation)
+        
+        with self._connection() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)",
+                (int(obs_id), data.get("releve_id"), _dumps(data),
+                 _dumps(files) if files else None)
+                )
+    
+    def __delitem__(self, obs_id):
+        with self._connection() as con:
+            con.execute(
+                "DELETE FROM observations WHERE obs_id = ?", (int(obs_id),)
+                )
+    
+    def ids(self, releve_ids = None):
+        '''
+        Get observation IDs.
+        
+        Parameters
+        ----------
+        releve_ids : list, optional
+            Only return observations of these releves. The default is None
+            (all observations).
+        
+        Returns
+        -------
+        list
+            Observation IDs.
+        '''
+        con = self._connection()
+        
+        if releve_ids is None:
+            rows = con.execute(
+                "SELECT obs_id FROM observations ORDER BY obs_id"
+                )
+        
+        else:
+            releve_ids = [int(r) for r in releve_ids]
+            rows = con.execute(
+                "SELECT obs_id FROM observations WHERE releve_id IN " + \
+                    "(SELECT value FROM json_each(?)) ORDER BY obs_id",
+                (json.dumps(releve_ids),)
+                )
+        
+        return [row[0] for row in rows]
+    
+    def put_many(self, observations):
+        '''
+        Insert or update observations (API data) in one transaction. Stored
+        download fields of existing observations are kept.
+        
+        Parameters
+        ----------
+        observations : list
+            Observation dictionaries (with key "obs_id").
+        
+        Returns
+        -------
+        None.
+        '''
+        rows = []
+        
+        for observation in observations:
+            data, _ = _split(observation)
+            rows.append(
+                (int(data["obs_id"]), data.get("releve_id"), _dumps(data))
+                )
+        
+        with self._connection() as con:
+            con.executemany(
+                "INSERT INTO observations (obs_id, releve_id, data) " + \
+                    "VALUES (?, ?, ?) ON CONFLICT (obs_id) DO UPDATE SET " + \
+                        "releve_id = excluded.releve_id, data = excluded.data",
+                rows
+                )
+    
+    def set_files(self, observation):
+        '''
+        Store the download fields (FILE_FIELDS) of an observation.
+        
+        Parameters
+        ----------
+        observation : dict
+            Observation dictionary (with key "obs_id").
+        
+        Returns
+        -------
+        None.
+        '''
+        _, files = _split(observation)
+        
+        with self._connection() as con:
+            con.execute(
+                "UPDATE observations SET files = ? WHERE obs_id = ?",
+                (_dumps(files), int(observation["obs_id"]))
+                )
+    
+    def clear_files(self):
+        '''
+        Remove the download fields of all observations.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._connection() as con:
+            con.execute("UPDATE observations SET files = NULL")
+    
+    def column(self, field):
+        '''
+        Iterate over one field of all observations (without reading the
+        other fields).
+        
+        Parameters
+        ----------
+        field : str
+            Field name (e.g., "xy_precision").
+        
+        Returns
+        -------
+        generator
+            Field values in order of the observation ID.
+        '''
+        rows = self._connection().execute(
+            "SELECT json_extract(data, ?) FROM observations ORDER BY obs_id",
+            ("$." + field,)
+            )
+        
+        for row in rows:
+            yield row[0]
+    
+    def view(self, ids = None, transform = None):
+        '''
+        Get a read-only view of the store.
+        
+        Parameters
+        ----------
+        ids : list, optional
+            Observation IDs included in the view. The default is None (all
+            observations).
+        transform : callable, optional
+            Function applied to each observation when it is read. The default
+            is None.
+        
+        Returns
+        -------
+        ObservationView
+            View.
+        '''
+        return ObservationView(self, ids, transform)
+    
+    def import_pickle(self, meta_file):
+        '''
+        Copy the observations of a metadata file (META.pickle) into the
+        store.
+        
+        Parameters
+        ----------
+        meta_file : str
+            Path to the metadata file.
+        
+        Returns
+        -------
+        int
+            Number of imported observations.
+        '''
+        with open(meta_file, "rb") as f:
+            metadata = pk.load(f)
+        
+        for obs_id, observation in metadata.items():
+            self[obs_id] = observation
+        
+        return len(metadata)
+    
+    def close(self):
+        '''
+        Close the connection of the calling thread.
+        
+        Returns
+        -------
+        None.
+        '''
+        con = getattr(self._local, "con", None)
+        
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+class ObservationView(Mapping):
+    def __init__(self, store, ids = None, transform = None):
+        '''
+        Read-only mapping of (a subset of) the observations of a store. Can be
+        used in place of a metadata dictionary loaded from META.pickle.
+        
+        Parameters
+        ----------
+        store : ObservationStore
+            Observation store.
+        ids : list, optional
+            Observation IDs. The default is None (all observations of the
+            store at the time of access).
+        transform : callable, optional
+            Function applied to each observation when it is read. Must be
+            picklable if the view is pickled. The default is None.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.store = store
+        self.ids = None if ids is None else list(dict.fromkeys(ids))
+        self.transform = transform
+        self._members = None if ids is None else set(self.ids)
+    
+    def __getitem__(self, obs_id):
+        if self._members is not None and obs_id not in self._members:
+            raise KeyError(obs_id)
+        
+        observation = self.store[obs_id]
+        
+        if self.transform is not None:
+            observation = self.transform(observation)
+        
+        return observation
+    
+    def __contains__(self, obs_id):
+        if self._members is not None:
+            return obs_id in self._members
+        
+        return obs_id in self.store
+    
+    def __iter__(self):
+        return iter(self.store.ids() if self.ids is None else self.ids)
+    
+    def __len__(self):
+        return len(self.store) if self.ids is None else len(self.ids)
+    
+    @property
+    def releve_ids(self):
+        '''
+        Get the releve IDs of the observations in the view.
+        
+        Returns
+        -------
+        set
+            Releve IDs.
+        '''
+        con = self.store._connection()
+        
+        if self.ids is None:
+            rows = con.execute(
+                "SELECT DISTINCT releve_id FROM observations"
+                )
+        
+        else:
+            rows = con.execute(
+                "SELECT DISTINCT releve_id FROM observations WHERE obs_id " + \
+                    "IN (SELECT value FROM json_each(?))",
+                (json.dumps(self.ids),)
+                )
+        
+        return set(row[0] for row in rows)
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:37:12 2026
+
+Content-addressed on-disk cache of preprocessed (resized, re-encoded, base64)
+image payloads, with LRU eviction and a size limit.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 16:37:12 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, hashlib, threading
+import concurrent.futures as cf
+
+import base
+
+#-----------------------------------------------------------------------------|
+# Settings
+CACHE_DIR = os.path.join(base.dir_main, "cache", "payloads")
+
+## Maximum total size of the cached payloads (bytes)
+MAX_BYTES = 2 * 1024 ** 3
+
+## Encoder settings of base.image_crop_to_b64. Change the version whenever the
+## preprocessing changes, so that old payloads are not reused.
+ENCODER = "cv2-jpg-default-cubic-reduced;v2"
+
+## Number of processes that prepare payloads ahead of the requests
+PREFETCH_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+## Number of images prepared ahead of the last image used by the requests
+PREFETCH_LOOKAHEAD = 4 * PREFETCH_WORKERS
+
+## Number of used images after which the Prefetcher enforces the size limit
+## of the cache (the worker processes do not track the cache size)
+CHECK_EVERY = 100
+
+## Cache of a Prefetcher worker process (see _init_worker)
+_WORKER_CACHE = None
+
+#-----------------------------------------------------------------------------|
+# Functions
+def file_hash(path, chunk_size = 1024 ** 2):
+    '''
+    Get the SHA-256 hash of a file's content.
+    
+    Parameters
+    ----------
+    path : str
+        File path.
+    chunk_size : int, optional
+        Read buffer size. The default is 1 MiB.
+    
+    Returns
+    -------
+    str
+        Hex digest.
+    '''
+    h = hashlib.sha256()
+    
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    
+    return h.hexdigest()
+
+def image_crop_to_b64(path, max_size):
+    '''
+    Cached version of base.image_crop_to_b64 (see PayloadCache).
+    
+    Parameters
+    ----------
+    path : str
+        Full path to image file.
+    max_size : int
+        Maximum image size in pixels.
+    
+    Returns
+    -------
+    str
+        Encoded string.
+    '''
+    return CACHE.get(path, max_size)
+
+def _init_worker(cache_dir, encoder):
+    ## Runs once per worker process of Prefetcher. The cache size is not
+    ## tracked in the workers; the Prefetcher checks it while the payloads
+    ## are used (see Prefetcher.claim).
+    global _WORKER_CACHE
+    _WORKER_CACHE = PayloadCache(cache_dir, max_bytes = None, encoder = encoder)
+
+def _warm(path, max_size):
+    ## Runs in a worker process of Prefetcher
+    _WORKER_CACHE.get(path, max_size)
+
+#-----------------------------------------------------------------------------|
+# Classes
+class PayloadCache():
+    def __init__(self, cache_dir = CACHE_DIR, max_bytes = MAX_BYTES,
+                 encoder = ENCODER):
+        '''
+        Cache of preprocessed image payloads. Payloads are stored under a key
+        derived from the image content (file hash), the maximum image size,
+        and the encoder settings, so renamed or moved images are still found,
+        and changed images are not.
+        
+        Parameters
+        ----------
+        cache_dir : str, optional
+            Cache directory. The default is CACHE_DIR.
+        max_bytes : int, optional
+            Size limit. The least recently used payloads are removed when it
+            is exceeded. None disables size tracking (see .check_size). The
+            default is MAX_BYTES.
+        encoder : str, optional
+            Encoder settings (part of the key). The default is ENCODER.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.encoder = encoder
+        self.hits = 0
+        self.misses = 0
+        self._hashes = {}
+        self._size = None
+        self._lock = threading.Lock()
+    
+    def key(self, path, max_size):
+        '''
+        Get the cache key of an image. File hashes are kept in memory as long
+        as the file's size and modification time do not change.
+        
+        Returns
+        -------
+        str
+            Cache key.
+        '''
+        stat = os.stat(path)
+        file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        
+        with self._lock:
+            digest = self._hashes.get(file_id)
+        
+        if digest is None:
+            digest = file_hash(path)
+            
+            with self._lock:
+                self._hashes[file_id] = digest
+        
+        settings = "{0};{1};{2}".format(digest, max_size, self.encoder)
+        
+        return hashlib.sha256(settings.encode("utf8")).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".b64")
+    
+    def get(self, path, max_size):
+        '''
+        Get the payload of an image. The image is only decoded and encoded if
+        the payload is not cached.
+        
+        Parameters
+        ----------
+        path : str
+            Full path to image file.
+        max_size : int
+            Maximum image size in pixels.
+        
+        Returns
+        -------
+        str
+            Encoded string.
+        '''
+        file = self._path(self.key(path, max_size))
+        
+        try:
+            with open(file, "r") as f:
+                payload = f.read()
+            
+            ## Mark as recently used
+            os.utime(file)
+            
+            with self._lock:
+                self.hits += 1
+            
+            return payload
+        
+        except OSError:
+            pass
+        
+        payload = base.image_crop_to_b64(path, max_size = max_size)
+        self._put(file, payload)
+        
+        with self._lock:
+            self.misses += 1
+        
+        return payload
+    
+    def _put(self, file, payload):
+        os.makedirs(os.path.dirname(file), exist_ok = True)
+        
+        tmp = "{0}.{1}.tmp".format(file, threading.get_ident())
+        
+        with open(tmp, "w") as f:
+            f.write(payload)
+        
+        os.replace(tmp, file)
+        
+        if self.max_bytes is None:
+            return
+        
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            
+            else:
+                self._size += os.path.getsize(file)
+            
+            full = self._size > self.max_bytes
+        
+        if full:
+            self.evict()
+    
+    def _files(self):
+        files = []
+        
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".b64"):
+                    p = os.path.join(root, name)
+                    
+                    try:
+                        stat = os.stat(p)
+                    
+                    except OSError:
+                        continue
+                    
+                    files.append((stat.st_mtime, stat.st_size, p))
+        
+        return files
+    
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._files())
+    
+    def evict(self, target = 0.9):
+        '''
+        Remove the least recently used payloads until the cache is smaller
+        than target * max_bytes.
+        
+        Parameters
+        ----------
+        target : float, optional
+            Fraction of max_bytes to keep. The default is 0.9.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._lock:
+            files = sorted(self._files())
+            size = sum(s for _, s, _ in files)
+            
+            for _, s, p in files:
+                if size <= self.max_bytes * target:
+                    break
+                
+                try:
+                    os.remove(p)
+                    size -= s
+                
+                except OSError:
+                    pass
+            
+            self._size = size
+    
+    def check_size(self):
+        '''
+        Recount the cache size (e.g., after other processes have written to
+        the cache) and evict payloads if it exceeds the size limit.
+        
+        Returns
+        -------
+        None.
+        '''
+        if self.max_bytes is None:
+            return
+        
+        with self._lock:
+            self._size = self._scan_size()
+            full = self._size > self.max_bytes
+        
+        if full:
+            self.evict()
+    
+    def clear(self):
+        '''
+        Remove all cached payloads.
+        
+        Returns
+        -------
+        None.
+        '''
+        with self._lock:
+            for _, _, p in self._files():
+                try:
+                    os.remove(p)
+                
+                except OSError:
+                    pass
+            
+            self._size = 0
+
+class Prefetcher():
+    def __init__(self, cache = None, max_workers = PREFETCH_WORKERS,
+                 lookahead = PREFETCH_LOOKAHEAD, check_every = CHECK_EVERY):
+        '''
+        Prepare payloads in a process pool ahead of the requests, so that
+        uploads do not wait for JPEG decoding. The payloads are written to
+        the cache, where the request thread picks them up.
+        
+        Parameters
+        ----------
+        cache : PayloadCache, optional
+            Cache to fill. The default is None (CACHE).
+        max_workers : int, optional
+            Number of processes. The default is PREFETCH_WORKERS.
+        lookahead : int, optional
+            Number of images prepared ahead of the last claimed image (see
+            .claim). The default is PREFETCH_LOOKAHEAD.
+        check_every : int, optional
+            Enforce the size limit of the cache every check_every claimed
+            images. The default is CHECK_EVERY.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.cache = CACHE if cache is None else cache
+        self.lookahead = lookahead
+        self.check_every = check_every
+        self._pool = cf.ProcessPoolExecutor(
+            max_workers = max_workers,
+            initializer = _init_worker,
+            initargs = (self.cache.cache_dir, self.cache.encoder)
+            )
+        self._futures = {}
+        self._lock = threading.Lock()
+        
+        ## Queued images in submission order, the position of each image,
+        ## the position of the next image to process, and the position after
+        ## the last claimed image
+        self._jobs = []
+        self._positions = {}
+        self._next = 0
+        self._claimed = 0
+        self._n_claims = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+    
+    def _top_up(self):
+        ## Call with self._lock held
+        while self._next < len(self._jobs) and \
+            self._next < self._claimed + self.lookahead:
+            key = self._jobs[self._next]
+            self._futures[key] = self._pool.submit(_warm, *key)
+            self._next += 1
+    
+    def submit(self, path, max_size):
+        '''
+        Queue an image for preprocessing. Images are processed in the order
+        they are submitted, at most lookahead images ahead of the last
+        claimed image.
+        
+        Parameters
+        ----------
+        path : str
+            Full path to image file.
+        max_size : int
+            Maximum image size in pixels.
+        
+        Returns
+        -------
+        None.
+        '''
+        key = (path, max_size)
+        
+        with self._lock:
+            if key in self._positions:
+                return
+            
+            self._positions[key] = len(self._jobs)
+            self._jobs.append(key)
+            self._top_up()
+    
+    def claim(self, path, max_size):
+        '''
+        Call before the payload of an image is used. Waits if the image is
+        currently being processed; if processing has not started yet, it is
+        cancelled and left to the caller. Moves the prefetch window past the
+        image and periodically enforces the size limit of the cache.
+        
+        Parameters
+        ----------
+        path : str
+            Full path to image file.
+        max_size : int
+            Maximum image size in pixels.
+        
+        Returns
+        -------
+        None.
+        '''
+        key = (path, max_size)
+        
+        with self._lock:
+            future = self._futures.pop(key, None)
+            position = self._positions.get(key)
+            
+            if position is not None and position >= self._claimed:
+                self._claimed = position + 1
+                
+                ### Images that were passed are left to the caller
+                self._next = max(self._next, self._claimed)
+            
+            self._top_up()
+            
+            self._n_claims += 1
+            check = self._n_claims % self.check_every == 0
+        
+        if future is not None and not future.cancel():
+            try:
+                future.result()
+            
+            ## Errors are raised again when the caller processes the image
+            except Exception:
+                pass
+        
+        if check:
+            self.cache.check_size()
+    
+    def shutdown(self):
+        '''
+        Stop the worker processes. Queued images are dropped. The size limit
+        of the cache is enforced for the payloads written by the workers.
+        
+        Returns
+        -------
+        None.
+        '''
+        self._pool.shutdown(wait = True, cancel_futures = True)
+        
+        with self._lock:
+            self._futures.clear()
+        
+        self.cache.check_size()
+
+## Shared instance used by the API clients
+CACHE = PayloadCache()
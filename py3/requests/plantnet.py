@@ -27,7 +27,7 @@ __status__ = "Production"
 import os, json, time, warnings
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 
-import authentication, requests
+import authentication, requests, quota, httppool
 
 #-----------------------------------------------------------------------------|
 # General settings/variables
@@ -77,8 +77,15 @@ def post_image(files, organs = "auto"):
     response : requests.response
         Response type opject.
     '''
-    img_files = [("images", (f, open(f, "rb"))) for f in files] if \
-        isinstance(files, list) else [("images", (files, open(files, "rb")))]
+    files = files if isinstance(files, list) else [files]
+    
+    ## Read each file once and close it right away; the multipart body is
+    ## encoded once and re-sent unchanged on retries
+    img_files = []
+    
+    for f in files:
+        with open(f, "rb") as img:
+            img_files.append(("images", (f, img.read())))
     
     plant_organs = organs if isinstance(organs, list) else [organs]
     
@@ -94,10 +101,13 @@ def post_image(files, organs = "auto"):
         )
     
     prepared_req = req.prepare()
+    del req, img_files
+    
+    session = httppool.get_session("plantnet")
+    json_result = {}
     
     for a in range(3):
         try:
-            session = requests.Session()
             response = session.send(prepared_req)
             
             json_result = json.loads(response.text)
@@ -126,6 +136,9 @@ def post_image(files, organs = "auto"):
             print(
                 "Remaining PlantNet IDs for today: {0}\n".format(remaining_ids)
                 )
+            
+            ## Pause further PlantNet requests once the daily quota is used
+            quota.LIMITER.update_from_plantnet(json_result)
         
         except:
             Warning("Failed to get number of remaining PlantNet IDs.")
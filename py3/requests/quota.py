@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:03:27 2026
+
+Per-provider rate limits (token buckets) and API quota tracking.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 11:03:27 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import math, time, threading
+from datetime import datetime, timedelta
+
+#-----------------------------------------------------------------------------|
+# Settings
+## Sustained request rate (requests per second) and burst size per provider.
+## A rate of None disables rate limiting (Flora Incognita requests only copy
+## files locally).
+LIMITS = {
+    "plantnet" : {"rate" : 1.0, "capacity" : 2},
+    "inaturalist" : {"rate" : 1.0, "capacity" : 1},
+    "florid" : {"rate" : 2.0, "capacity" : 4},
+    "floraincognita" : {"rate" : None, "capacity" : 1},
+    "infoflora" : {"rate" : 4.0, "capacity" : 4}
+    }
+
+DEFAULT = {"rate" : 1.0, "capacity" : 1}
+
+#-----------------------------------------------------------------------------|
+# Functions
+def seconds_to_midnight(now = None):
+    '''
+    Get the time until the next midnight (when the daily PlantNet quota is
+    reset).
+    
+    Parameters
+    ----------
+    now : datetime, optional
+        Current time. The default is None (datetime.now()).
+    
+    Returns
+    -------
+    float
+        Seconds until midnight.
+    '''
+    now = datetime.now() if now is None else now
+    tomorrow = now + timedelta(days = 1)
+    midnight = datetime(tomorrow.year, tomorrow.month, tomorrow.day)
+    
+    return (midnight - now).total_seconds()
+
+#-----------------------------------------------------------------------------|
+# Classes
+class QuotaExhausted(Exception):
+    ## The API quota of a provider is used up and its reset time is unknown
+    pass
+
+class TokenBucket():
+    def __init__(self, rate, capacity = 1):
+        '''
+        Token bucket rate limiter.
+        
+        Parameters
+        ----------
+        rate : float or None
+            Tokens added per second. None disables the limit.
+        capacity : int, optional
+            Maximum number of tokens (burst size). The default is 1.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.t_last = time.monotonic()
+    
+    def reserve(self):
+        '''
+        Take a token if one is available.
+        
+        Returns
+        -------
+        float
+            0 if a token was taken, else the time (s) until the next token is
+            available.
+        '''
+        if self.rate is None:
+            return 0.0
+        
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.t_last) * self.rate
+            )
+        self.t_last = now
+        
+        if self.tokens >= 1:
+            self.tokens -= 1
+            
+            return 0.0
+        
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter():
+    def __init__(self, limits = LIMITS):
+        '''
+        Token buckets and quota states of all providers.
+        
+        Parameters
+        ----------
+        limits : dict, optional
+            Rate limit settings ("rate", "capacity") per provider. Providers
+            not listed use DEFAULT. The default is LIMITS.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.limits = limits
+        self.buckets = {}
+        self.remaining = {}
+        self.blocked_until = {}
+        self._lock = threading.Lock()
+    
+    def _bucket(self, provider):
+        if provider not in self.buckets:
+            settings = DEFAULT.copy()
+            settings.update(self.limits.get(provider, {}))
+            
+            self.buckets[provider] = TokenBucket(
+                settings["rate"], settings["capacity"]
+                )
+        
+        return self.buckets[provider]
+    
+    def delay(self, provider):
+        '''
+        Get the time until the quota of a provider is available again.
+        
+        Parameters
+        ----------
+        provider : str
+            Provider (CV model) key.
+        
+        Returns
+        -------
+        float
+            Seconds until the provider accepts requests again (0 if it is not
+            blocked, math.inf if its quota is exhausted and the reset time is
+            unknown).
+        '''
+        with self._lock:
+            return self._quota_wait(provider)
+    
+    def _quota_wait(self, provider):
+        ## Call with self._lock held
+        if self.remaining.get(provider, 1) > 0:
+            return 0.0
+        
+        if provider not in self.blocked_until:
+            ### Exhausted, but the reset time is unknown
+            return math.inf
+        
+        wait = self.blocked_until[provider] - time.time()
+        
+        if wait > 0:
+            return wait
+        
+        ### The quota period is over
+        del self.blocked_until[provider]
+        del self.remaining[provider]
+        
+        return 0.0
+    
+    def reserve(self, provider):
+        '''
+        Reserve a request slot for a provider without blocking.
+        
+        Parameters
+        ----------
+        provider : str
+            Provider (CV model) key.
+        
+        Returns
+        -------
+        float
+            0 if the request may be sent now, else the time (s) to wait
+            before trying again (math.inf if the quota is exhausted and the
+            reset time is unknown).
+        '''
+        with self._lock:
+            wait = self._quota_wait(provider)
+            
+            if wait > 0:
+                return wait
+            
+            return self._bucket(provider).reserve()
+    
+    def acquire(self, provider):
+        '''
+        Block the calling thread until a request slot for the provider is
+        available.
+        
+        Parameters
+        ----------
+        provider : str
+            Provider (CV model) key.
+        
+        Returns
+        -------
+        None.
+        
+        Raises
+        ------
+        QuotaExhausted
+            The quota of the provider is exhausted and the reset time is
+            unknown.
+        '''
+        while True:
+            wait = self.reserve(provider)
+            
+            if wait <= 0:
+                return
+            
+            if math.isinf(wait):
+                raise QuotaExhausted(
+                    "API quota of {0} exhausted.".format(provider)
+                    )
+            
+            time.sleep(min(wait, 60))
+    
+    def update(self, provider, remaining = None, reset = None):
+        '''
+        Update the quota state of a provider.
+        
+        Parameters
+        ----------
+        provider : str
+            Provider (CV model) key.
+        remaining : int, optional
+            Remaining requests in the current quota period. The default is
+            None (unknown).
+        reset : float, optional
+            Seconds until the quota is reset. The default is None (unknown).
+        
+        Returns
+        -------
+        None.
+        
+        Notes
+        -----
+        An exhausted quota blocks the provider until the reset time. If the
+        reset time is unknown, the provider stays blocked until an update
+        reports remaining requests again.
+        '''
+        with self._lock:
+            if remaining is None:
+                return
+            
+            self.remaining[provider] = remaining
+            self.blocked_until.pop(provider, None)
+            
+            if remaining > 0:
+                return
+            
+            if reset is not None:
+                self.blocked_until[provider] = time.time() + reset
+                
+                mssg = "API quota of {0} exhausted. Requests to {0} " + \
+                    "are paused until {1}."
+                
+                print(mssg.format(provider, datetime.strftime(
+                    datetime.now() + timedelta(seconds = reset),
+                    "%Y-%m-%d %H:%M:%S"
+                    )))
+            
+            else:
+                mssg = "API quota of {0} exhausted (reset time unknown). " + \
+                    "Requests to {0} are paused."
+                
+                print(mssg.format(provider))
+    
+    def update_from_plantnet(self, response_json):
+        '''
+        Read the daily quota from a PlantNet response (field
+        "remainingIdentificationRequests", reset at midnight).
+        '''
+        try:
+            remaining = int(response_json["remainingIdentificationRequests"])
+        
+        except (KeyError, TypeError, ValueError):
+            return
+        
+        self.update("plantnet", remaining, seconds_to_midnight())
+    
+    def update_from_headers(self, provider, headers):
+        '''
+        Read the quota from RapidAPI style response headers
+        (x-ratelimit-requests-remaining, x-ratelimit-requests-reset).
+        '''
+        try:
+            remaining = int(headers["x-ratelimit-requests-remaining"])
+        
+        except (KeyError, TypeError, ValueError):
+            return
+        
+        try:
+            reset = float(headers["x-ratelimit-requests-reset"])
+        
+        except (KeyError, TypeError, ValueError):
+            reset = None
+        
+        self.update(provider, remaining, reset)
+
+## Shared instance used by the API clients and Batchrequest
+LIMITER = RateLimiter()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:52:19 2026
+
+Columnar (typed) table of Batchrequest results with Parquet/Feather export.
+The full API responses (full_json) are kept separately and referenced by row.
+"""
+__author__ = "Manuel"
+__date__ = "Sun Oct 18 15:52:19 2026"
+__credits__ = ["Manuel R. Popp"]
+__license__ = "Unlicense"
+__version__ = "1.0.1"
+__maintainer__ = "Manuel R. Popp"
+__email__ = "requests@cdpopp.de"
+__status__ = "Development"
+
+#-----------------------------------------------------------------------------|
+# Imports
+import os, json
+import pandas as pd
+
+#-----------------------------------------------------------------------------|
+# Settings
+COLUMNS = [
+    "timestamp", "question_type", "releve_name", "releve_id",
+    "observation_id", "true_taxon_id", "plant_organ", "image_files",
+    "cv_model"
+    ]
+
+TAXON_COLUMNS = ["first", "second", "third", "forth", "fifth"]
+
+## Column types (columns not listed remain of type object)
+CATEGORIES = ["question_type", "releve_name", "plant_organ", "cv_model"]
+INTEGERS = ["releve_id", "observation_id", "true_taxon_id"]
+
+FORMATS = {
+    "parquet" : ".parquet",
+    "feather" : ".feather",
+    "pickle" : ".pkl"
+    }
+
+#-----------------------------------------------------------------------------|
+# Functions
+def _as_int(values):
+    '''
+    Convert to a nullable integer column if all values are integers.
+    '''
+    try:
+        return pd.array(values, dtype = "Int64")
+    
+    except (TypeError, ValueError):
+        return values
+
+#-----------------------------------------------------------------------------|
+# Classes
+class ResultsTable():
+    def __init__(self, df, full_json):
+        '''
+        Table of results.
+        
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            One row per result. The column "json_ref" is the index of the
+            full API response in full_json.
+        full_json : list
+            Full API responses.
+        
+        Returns
+        -------
+        None.
+        '''
+        self.df = df
+        self.full_json = full_json
+    
+    @classmethod
+    def from_results(cls, results):
+        '''
+        Flatten a nested Batchrequest results dictionary
+        (results[releve][observation][image][cv_model]) column by column.
+        
+        Parameters
+        ----------
+        results : dict
+            Batchrequest.results.
+        
+        Returns
+        -------
+        ResultsTable
+            Table of results.
+        '''
+        columns = {c : [] for c in COLUMNS + TAXON_COLUMNS}
+        full_json = []
+        n_taxa = len(TAXON_COLUMNS)
+        
+        for releve in results.values():
+            for observation in releve.values():
+                for image in observation.values():
+                    for result in image.values():
+                        for c in COLUMNS:
+                            columns[c].append(result.get(c))
+                        
+                        taxa = list(
+                            result.get("taxon_suggestions") or []
+                            )[:n_taxa]
+                        taxa += [None] * (n_taxa - len(taxa))
+                        
+                        for c, taxon in zip(TAXON_COLUMNS, taxa):
+                            columns[c].append(taxon)
+                        
+                        full_json.append(result.get("full_json"))
+        
+        for c in INTEGERS:
+            columns[c] = _as_int(columns[c])
+        
+        for c in CATEGORIES:
+            columns[c] = pd.Categorical(columns[c])
+        
+        columns["timestamp"] = pd.to_datetime(columns["timestamp"])
+        columns["json_ref"] = range(len(full_json))
+        
+        return cls(pd.DataFrame(columns), full_json)
+    
+    def write(self, path, fmt = "parquet"):
+        '''
+        Write the table in a columnar format and the full API responses to a
+        separate JSON lines file (<path>.full_json.jsonl).
+        
+        Parameters
+        ----------
+        path : str
+            Output file path without extension.
+        fmt : str {"parquet", "feather", "pickle"}, optional
+            Table format. Parquet and Feather require pyarrow. The default is
+            "parquet".
+        
+        Returns
+        -------
+        out : str
+            Path of the table file.
+        '''
+        out = path + FORMATS[fmt]
+        os.makedirs(os.path.dirname(out) or ".", exist_ok = True)
+        
+        if fmt == "parquet":
+            self.df.to_parquet(out, index = False)
+        
+        elif fmt == "feather":
+            self.df.reset_index(drop = True).to_feather(out)
+        
+        else:
+            self.df.to_pickle(out)
+        
+        refs = set(self.df["json_ref"])
+        
+        with open(path + ".full_json.jsonl", "w") as f:
+            for ref, response in enumerate(self.full_json):
+                if ref in refs:
+                    f.write(json.dumps(
+                        {"json_ref" : ref, "full_json" : response},
+                        default = str
+                        ) + "\n")
+        
+        return out
+    
+    def write_excel(self, path, sheet_name):
+        '''
+        Write the table (without full API responses) to a sheet of an Excel
+        file. An existing sheet of the same name is replaced.
+        
+        Parameters
+        ----------
+        path : str
+            Excel file path.
+        sheet_name : str
+            Sheet name.
+        
+        Returns
+        -------
+        None.
+        '''
+        df = self.df.drop(columns = "json_ref")
+        
+        if os.path.isfile(path):
+            with pd.ExcelWriter(path, mode = "a",
+                                if_sheet_exists = "replace") as writer:
+                df.to_excel(writer, sheet_name = sheet_name, index = False)
+            print("Wrote sheet to Excel table " + path + ".")
+        
+        else:
+            df.to_excel(path, sheet_name = sheet_name, index = False)
+            print("Created Excel table at " + path + ".")